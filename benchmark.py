@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from models import *
+from persistencia import crear_almacen
+
+#Banco de pruebas: genera un coworking sintetico y mide las operaciones principales.
+#Los resultados se guardan en JSON para poder comparar corridas y detectar regresiones
+
+MEMBRESIAS = [MembresiaBasica, MembresiaEstandar, MembresiaPremium, MembresiaEstudiante]
+NOMBRES_PRODUCTOS = ["Cafe", "Te", "Agua", "Snack", "Sandwich", "Refresco", "Ensalada", "Galletas", "Jugo", "Fruta"]
+# Los tipos que escribe Coworking: compras, renovaciones y cancelaciones ("membresia") y pagos de deuda
+TIPOS_VENTA = ["producto", "membresia", "pago_renovacion"]
+INICIO_CALENDARIO = datetime(2025, 1, 6, 8, 0)
+
+
+def generar_coworking(coworking, clientes, productos, salas, reservas_por_sala, azar):
+    """Llena el coworking con clientes de los cuatro tipos de membresia, productos y salas con el calendario lleno"""
+    membresias = [clase() for clase in MEMBRESIAS]
+    coworking.agregar_clientes([
+        Cliente(f"C{i + 1}", f"Cliente {i + 1}", f"cliente{i + 1}@correo.com", membresias[i % len(membresias)])
+        for i in range(clientes)
+    ])
+
+    for i in range(productos):
+        nombre = NOMBRES_PRODUCTOS[i % len(NOMBRES_PRODUCTOS)]
+        coworking.agregar_producto(Producto(f"P{i + 1}", f"{nombre} {i + 1}", round(azar.uniform(1, 10), 2), 10 ** 9))
+
+    # Reservas de una hora seguidas, de 8 a 20, sin huecos: el peor caso para buscar disponibilidad
+    lista_clientes = list(coworking.clientes.values())
+    for i in range(salas):
+        sala = Sala(f"S{i + 1}", f"Sala {i + 1}", azar.choice([2, 4, 6, 8, 15]))
+        coworking.agregar_sala(sala)
+        reservas = []
+        for j in range(reservas_por_sala):
+            dia, hora = divmod(j, 12)
+            cliente = azar.choice(lista_clientes)
+            id_reserva = f"R{coworking.prox_id_reserva}"
+            coworking.prox_id_reserva += 1
+            reserva = Reserva(id_reserva, cliente, sala, INICIO_CALENDARIO + timedelta(days=dia, hours=hora), 1)
+            reservas.append(reserva)
+            cliente.reservas.append(reserva)
+            coworking.reservas[id_reserva] = reserva
+        sala.cargar_reservas(reservas)
+
+
+def generar_ventas(libro, cantidad, clientes, azar, lote=10000):
+    """Escribe un historial de ventas ordenado por fecha repartido en el ultimo anio"""
+    inicio = datetime.now() - timedelta(days=365)
+    paso = timedelta(days=365) / max(cantidad, 1)
+    ventas = []
+    for i in range(cantidad):
+        ventas.append({
+            "fecha": (inicio + paso * i).isoformat(),
+            "tipo": azar.choice(TIPOS_VENTA),
+            "cliente_id": f"C{azar.randint(1, clientes)}",
+            "descripcion": "Venta sintetica",
+            "monto": round(azar.uniform(1, 80), 2)
+        })
+        if len(ventas) == lote:
+            libro.registrar_lote(ventas)
+            ventas = []
+    if ventas:
+        libro.registrar_lote(ventas)
+
+
+def _resumen_tiempos(tiempos, fallidas=0):
+    ordenados = sorted(tiempos)
+    n = len(ordenados)
+    if not n:
+        return {"operaciones": 0, "fallidas": fallidas}
+
+    def percentil(p):
+        return ordenados[min(n - 1, int(p * n))] * 1000
+
+    total = sum(ordenados)
+    return {
+        "operaciones": n,
+        "fallidas": fallidas,
+        "total_s": round(total, 6),
+        "media_ms": round(total / n * 1000, 4),
+        "p50_ms": round(percentil(0.50), 4),
+        "p95_ms": round(percentil(0.95), 4),
+        "max_ms": round(ordenados[-1] * 1000, 4),
+        "ops_por_s": round(n / total, 1) if total else None
+    }
+
+
+def medir(funcion, repeticiones, errores=(), preparar=None):
+    """Llama funcion(i) repeticiones veces y resume los tiempos. Los errores esperados se cuentan aparte.
+    preparar(i), si se indica, se ejecuta antes de cada llamada y no se mide"""
+    tiempos = []
+    fallidas = 0
+    for i in range(repeticiones):
+        if preparar is not None:
+            preparar(i)
+        inicio = time.perf_counter()
+        try:
+            funcion(i)
+        except errores:
+            fallidas += 1
+            continue
+        tiempos.append(time.perf_counter() - inicio)
+    return _resumen_tiempos(tiempos, fallidas)
+
+
+def _reactivar_clientes(coworking):
+    for cliente in coworking.clientes.values():
+        antes = coworking._estado_cliente(cliente)
+        cliente.activo = True
+        cliente.deuda_renovacion = 0
+        coworking._cliente_actualizado(cliente, antes)
+
+
+def ejecutar(parametros, directorio):
+    """Devuelve (preparacion, resultados): la preparacion se informa pero no se compara entre corridas"""
+    azar = random.Random(parametros["semilla"])
+    preparacion = {}
+    resultados = {}
+    errores_negocio = (ClienteInhabilitadoError, SalaOcupadaError, ProductoAgotadoError, StockInsuficienteError,
+                       PagoRechazadoError)
+
+    almacen = crear_almacen(parametros["almacen"], directorio)
+    libro = almacen.crear_libro_ventas()
+    inicio = time.perf_counter()
+    generar_ventas(libro, parametros["ventas"], parametros["clientes"], azar)
+    libro.cerrar()
+    preparacion["generar_ventas"] = _resumen_tiempos([time.perf_counter() - inicio])
+
+    inicio = time.perf_counter()
+    coworking = Coworking(libro_ventas=almacen.crear_libro_ventas())
+    resultados["arranque_resumen_ventas"] = _resumen_tiempos([time.perf_counter() - inicio])
+
+    generar_coworking(coworking, parametros["clientes"], parametros["productos"], parametros["salas"],
+                      parametros["reservas_por_sala"], azar)
+    coworking.tomar_cambios()
+
+    ids_clientes = list(coworking.clientes)
+    ids_salas = list(coworking.salas)
+    ids_productos = list(coworking.productos)
+    n = parametros["repeticiones"]
+    dias_ocupados = parametros["reservas_por_sala"] // 12 + 1
+
+    # Reservas en horarios al azar: la mitad cae en la zona ya ocupada del calendario
+    horarios = [INICIO_CALENDARIO + timedelta(days=azar.randrange(dias_ocupados * 2), hours=azar.randrange(12))
+                for _ in range(n)]
+    resultados["reservar_sala"] = medir(
+        lambda i: coworking.reservar_sala(azar.choice(ids_clientes), azar.choice(ids_salas), horarios[i]),
+        n, errores_negocio)
+
+    resultados["comprar_producto"] = medir(
+        lambda i: coworking.comprar_producto(azar.choice(ids_clientes), azar.choice(ids_productos), 1 + i % 3),
+        n, errores_negocio)
+
+    resultados["obtener_estadisticas"] = medir(lambda i: coworking.obtener_estadisticas(), n)
+    hoy = datetime.now().date()
+    resultados["obtener_estadisticas_rango"] = medir(
+        lambda i: coworking.obtener_estadisticas(hoy - timedelta(days=azar.randrange(1, 365)), hoy), n)
+
+    resultados["historial_ultimas_ventas"] = medir(lambda i: coworking.obtener_ultimas_ventas(20, i % 10), n)
+    resultados["historial_por_cliente"] = medir(
+        lambda i: coworking.obtener_historial_ventas(cliente_id=azar.choice(ids_clientes)),
+        max(1, parametros["repeticiones_lentas"]))
+    resultados["analizar_ventas"] = medir(
+        lambda i: coworking.analizar_ventas(), max(1, parametros["repeticiones_lentas"]))
+
+    # Cada renovacion parte de todos los clientes activos
+    resultados["renovar_membresias_automatico"] = medir(
+        lambda i: coworking.renovar_membresias_automatico(), max(1, parametros["repeticiones_lentas"]),
+        preparar=lambda i: _reactivar_clientes(coworking))
+
+    resultados["guardar_datos"] = medir(lambda i: almacen.guardar(coworking), max(1, parametros["repeticiones_lentas"]))
+    coworking.cerrar()
+
+    def cargar(i):
+        nuevo = Coworking(libro_ventas=almacen.crear_libro_ventas())
+        almacen.cargar(nuevo)
+        nuevo.cerrar()
+    resultados["cargar_datos"] = medir(cargar, max(1, parametros["repeticiones_lentas"]))
+
+    almacen.cerrar()
+    return preparacion, resultados
+
+
+def comparar(actual, anterior, tolerancia):
+    """Compara la media de cada operacion con una corrida anterior. Devuelve las que empeoraron"""
+    regresiones = []
+    print(f"\n{'Operacion':32} {'Antes (ms)':>12} {'Ahora (ms)':>12} {'Cambio':>9}")
+    for nombre, datos in actual["resultados"].items():
+        previo = anterior["resultados"].get(nombre)
+        if not previo or "media_ms" not in previo or "media_ms" not in datos:
+            continue
+        cambio = datos["media_ms"] / previo["media_ms"] - 1 if previo["media_ms"] else 0
+        marca = " <-- regresion" if cambio > tolerancia else ""
+        print(f"{nombre:32} {previo['media_ms']:>12.3f} {datos['media_ms']:>12.3f} {cambio:>+8.1%}{marca}")
+        if cambio > tolerancia:
+            regresiones.append(nombre)
+    if anterior.get("parametros") != actual["parametros"]:
+        print("Aviso: las corridas usan parametros distintos")
+    return regresiones
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Banco de pruebas del sistema de coworking")
+    parser.add_argument("--clientes", type=int, default=5000)
+    parser.add_argument("--productos", type=int, default=50)
+    parser.add_argument("--salas", type=int, default=20)
+    parser.add_argument("--reservas-por-sala", type=int, default=2000)
+    parser.add_argument("--ventas", type=int, default=200000)
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    parser.add_argument("--repeticiones-lentas", type=int, default=3)
+    parser.add_argument("--almacen", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", default="benchmark.json", help="Archivo JSON con los resultados")
+    parser.add_argument("--comparar", help="Resultados de una corrida anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.20, help="Empeoramiento aceptado (0.20 = 20%%)")
+    parser.add_argument("--directorio", help="Carpeta de trabajo (por defecto una temporal que se borra)")
+    opciones = parser.parse_args(argumentos)
+
+    parametros = {
+        "clientes": opciones.clientes,
+        "productos": opciones.productos,
+        "salas": opciones.salas,
+        "reservas_por_sala": opciones.reservas_por_sala,
+        "ventas": opciones.ventas,
+        "repeticiones": opciones.repeticiones,
+        "repeticiones_lentas": opciones.repeticiones_lentas,
+        "almacen": opciones.almacen,
+        "semilla": opciones.semilla
+    }
+
+    directorio = opciones.directorio or tempfile.mkdtemp(prefix="coworking_bench_")
+    os.makedirs(directorio, exist_ok=True)
+    try:
+        preparacion, resultados = ejecutar(parametros, directorio)
+    finally:
+        if not opciones.directorio:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    actual = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": parametros,
+        "preparacion": preparacion,
+        "resultados": resultados
+    }
+    with open(opciones.salida, "w", encoding="utf-8") as f:
+        json.dump(actual, f, indent=2, ensure_ascii=False)
+
+    print(f"\n{'Operacion':32} {'n':>7} {'media ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'ops/s':>10}")
+    for nombre, datos in list(preparacion.items()) + list(resultados.items()):
+        if datos["operaciones"]:
+            print(f"{nombre:32} {datos['operaciones']:>7} {datos['media_ms']:>10.3f} {datos['p50_ms']:>10.3f} "
+                  f"{datos['p95_ms']:>10.3f} {datos['ops_por_s'] or 0:>10.1f}")
+    print(f"Resultados guardados en {opciones.salida}")
+
+    if opciones.comparar:
+        with open(opciones.comparar, "r", encoding="utf-8") as f:
+            anterior = json.load(f)
+        regresiones = comparar(actual, anterior, opciones.tolerancia)
+        if regresiones:
+            print(f"Regresiones: {', '.join(regresiones)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
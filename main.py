@@ -1,13 +1,39 @@
 from models import *
 from persistencia import *
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import argparse
+import csv
+import json
 import os
+import time
 
-def main():
-    coworking = Coworking()
-    os.makedirs("datos", exist_ok=True)
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Sistema de coworking")
+    parser.add_argument("--lote", help="Archivo .csv o .jsonl de operaciones a procesar sin menu")
+    parser.add_argument("--punto-control", type=int, default=0,
+                        help="Guardar los cambios cada N operaciones correctas (0 = solo al final)")
+    parser.add_argument("--errores", help="Archivo .jsonl donde dejar las operaciones que fallaron")
+    opciones = parser.parse_args(argumentos)
     
-    cargar_datos(coworking)
+    # COWORKING_ALMACEN=sqlite usa datos/coworking.db en lugar de los archivos JSON.
+    # COWORKING_FSYNC=1 sincroniza con el disco cada grupo de ventas
+    almacen = crear_almacen(os.environ.get("COWORKING_ALMACEN", "json"),
+                            fsync=os.environ.get("COWORKING_FSYNC") == "1")
+    coworking = Coworking(libro_ventas=almacen.crear_libro_ventas())
+    
+    almacen.cargar(coworking)
+    
+    if opciones.lote:
+        try:
+            procesar_lote(coworking, almacen, opciones.lote, opciones.punto_control, opciones.errores)
+        finally:
+            # Aunque el lote se corte, lo aplicado (y ya escrito en el libro de ventas) queda guardado
+            almacen.guardar(coworking)
+            coworking.cerrar()
+            almacen.cerrar()
+        return
+    
+    coworking.al_bajar_stock(avisar_stock_bajo)
     
     tipos_membresia = {
         "1": MembresiaBasica(),
@@ -28,7 +54,10 @@ def main():
         print("8. Ver estadisticas")
         print("9. Renovar membresias (simulacion)")
         print("10. Ver historial de ventas")
-        print("11. Salir")
+        print("11. Reporte de ventas por fechas")
+        print("12. Ver metricas de rendimiento")
+        print("13. Reservar serie semanal")
+        print("14. Salir")
 
         opcion = input("\nSeleccione una opcion: ")
         
@@ -53,17 +82,33 @@ def main():
         elif opcion == "10":
             ver_historial_ventas(coworking)
         elif opcion == "11":
-            guardar_datos(coworking)
+            reporte_ventas(coworking)
+        elif opcion == "12":
+            ver_metricas(coworking)
+            continue
+        elif opcion == "13":
+            reservar_serie(coworking)
+        elif opcion == "14":
+            METRICAS.detener_perfil()
+            almacen.guardar(coworking)
+            coworking.cerrar()
+            almacen.cerrar()
             print("Datos guardados. Sesion finalizada")
             break
         else:
             print("Opcion no valida")
+            continue
+        
+        # Guardado incremental: solo lo que cambio en esta operacion
+        almacen.guardar_cambios(coworking)
 
 def registrar_cliente(coworking, tipos_membresia):
     print("\n--- REGISTRAR CLIENTE ---")
     id_cliente = input("ID del cliente: ")
     nombre = input("Nombre: ")
     correo = input("Correo: ")
+    if coworking.buscar_clientes_por_correo(correo):
+        print("Aviso: ya hay un cliente registrado con ese correo")
     
     print("\nTipos de membresia:")
     for key, mem in tipos_membresia.items():
@@ -91,21 +136,61 @@ def reservar_sala(coworking):
     print("\n--- RESERVAR SALA ---")
     id_cliente = input("ID del cliente: ")
     
+    try:
+        personas = int(input("Cantidad de personas: "))
+        horas_desde_ahora = int(input("Horas hasta la reserva: "))
+        duracion = int(input("Duración en horas: "))
+        
+        fecha_reserva = datetime.now() + timedelta(hours=horas_desde_ahora)
+        # La sala mas chica en la que entra el grupo o, si no hay, horarios cercanos (+- 3 horas)
+        opciones = coworking.sugerir_salas(personas, fecha_reserva, duracion, flexibilidad_horas=3,
+                                           no_antes_de=datetime.now())
+        if not opciones:
+            print("No hay salas libres para ese grupo cerca de ese horario")
+            return
+        
+        if opciones[0]['desplazamiento_minutos'] == 0:
+            opcion = opciones[0]
+        else:
+            print("\nNo hay salas libres a esa hora. Horarios cercanos:")
+            for i, opcion in enumerate(opciones, start=1):
+                print(f"{i}. {opcion['sala'].nombre} (Capacidad: {opcion['sala'].capacidad}) - "
+                      f"{opcion['inicio'].strftime('%d/%m %H:%M')}")
+            eleccion = input("Opcion (Enter para cancelar): ")
+            if not eleccion:
+                return
+            opcion = opciones[int(eleccion) - 1]
+        
+        reserva = coworking.reservar_sala(id_cliente, opcion['sala'].id_sala, opcion['inicio'], duracion)
+        
+        print(f"Reserva exitosa: {reserva}")
+        
+    except (ClienteInhabilitadoError, SalaOcupadaError, ValueError, IndexError) as e:
+        print(f"Error: {e}")
+
+def reservar_serie(coworking):
+    print("\n--- RESERVAR SERIE SEMANAL ---")
+    id_cliente = input("ID del cliente: ")
+    
     print("\nSalas disponibles:")
     for sala in coworking.salas.values():
         print(sala)
     
-    id_sala = input("ID de la sala: ")
+    ids_salas = [id_sala.strip() for id_sala in input("IDs de las salas (separados por coma): ").split(",")]
     
     try:
-        horas_desde_ahora = int(input("Horas hasta la reserva: "))
+        inicio = datetime.fromisoformat(input("Primera reserva (AAAA-MM-DD HH:MM): "))
         duracion = int(input("Duración en horas: "))
+        semanas = int(input("Cantidad de semanas: "))
         
-        fecha_reserva = datetime.now() + timedelta(hours=horas_desde_ahora)
-        reserva = coworking.reservar_sala(id_cliente, id_sala, fecha_reserva, duracion)
-        
-        print(f"Reserva exitosa: {reserva}")
+        reservas = coworking.reservar_recurrente(id_cliente, ids_salas, inicio, duracion,
+                                                 inicio + timedelta(weeks=semanas))
+        print(f"Se registraron {len(reservas)} reservas")
         
+    except ReservaEnBloqueError as e:
+        print(f"Error: {e}. No se registro ninguna:")
+        for conflicto in e.conflictos:
+            print(f"  {conflicto['id_sala']} {conflicto['inicio'].strftime('%d/%m/%Y %H:%M')}: {conflicto['motivo']}")
     except (ClienteInhabilitadoError, SalaOcupadaError, ValueError) as e:
         print(f"Error: {e}")
 
@@ -117,12 +202,22 @@ def comprar_producto(coworking):
     for producto in coworking.productos.values():
         print(producto)
     
-    id_producto = input("ID del producto: ")
-    cantidad = int(input("Cantidad: "))
-    
     try:
-        compra = coworking.comprar_producto(id_cliente, id_producto, cantidad)
-        print(f"Compra exitosa: {compra['producto']} x{compra['cantidad']} - Total: ${compra['total']}")
+        carrito = []
+        while True:
+            id_producto = input("ID del producto: ")
+            cantidad = int(input("Cantidad: "))
+            carrito.append((id_producto, cantidad))
+            if input("Agregar otro producto? (s/n): ").lower() != "s":
+                break
+        
+        compras = coworking.comprar_productos(id_cliente, carrito)
+        total = 0
+        for compra in compras:
+            print(f"Compra exitosa: {compra['producto']} x{compra['cantidad']} - Total: ${compra['total']}")
+            total += compra['total']
+        if len(compras) > 1:
+            print(f"Total del carrito: ${total}")
     except (ClienteInhabilitadoError, ProductoAgotadoError, ValueError) as e:
         print(f"Error: {e}")
 
@@ -162,6 +257,12 @@ def reponer_stock(coworking):
     except ProductoAgotadoError as e:
         print(f"Error: {e}")
 
+def avisar_stock_bajo(alerta):
+    aviso = f"\n[AVISO] {alerta['nombre']} quedo con {alerta['stock']} unidades (umbral {alerta['umbral_stock']})"
+    if alerta['dias_hasta_agotar'] is not None:
+        aviso += f", se agota en {alerta['dias_hasta_agotar']:.1f} dias"
+    print(aviso)
+
 def ver_estadisticas(coworking):
     print("\n--- ESTADISTICAS DEL SISTEMA ---")
     stats = coworking.obtener_estadisticas()
@@ -182,45 +283,259 @@ def ver_estadisticas(coworking):
     
     if stats['productos_bajo_stock']:
         print(f"\nProductos con stock bajo: {', '.join(stats['productos_bajo_stock'])}")
+    
+    sugerencias = [p for p in coworking.pronostico_stock() if p['reponer']]
+    if sugerencias:
+        print("\nReposicion sugerida:")
+        for producto in sugerencias:
+            print(f"  {producto['nombre']}: pedir {producto['reponer']} "
+                  f"(stock {producto['stock']}, {producto['velocidad_diaria']:.1f} por dia)")
+    
+    # Ocupacion de los ultimos 30 dias en horario de 8 a 20
+    hasta = date.today() + timedelta(days=1)
+    desde = hasta - timedelta(days=30)
+    print("\nOcupacion de salas (ultimos 30 dias, 8 a 20 hs):")
+    utilizacion = coworking.utilizacion_salas(desde, hasta, datetime.strptime("08:00", "%H:%M").time(),
+                                              datetime.strptime("20:00", "%H:%M").time())
+    for id_sala, porcentaje in utilizacion.items():
+        print(f"  {coworking.salas[id_sala].nombre}: {porcentaje}%")
+    mapa = coworking.mapa_calor_ocupacion(desde, hasta)
+    pico = max(((porcentaje, dia, hora) for dia, fila in enumerate(mapa) for hora, porcentaje in enumerate(fila)),
+               key=lambda celda: celda[0])
+    if pico[0]:
+        dias_semana = ["lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo"]
+        print(f"  Hora pico: {dias_semana[pico[1]]} {pico[2]}:00 ({pico[0]}% de las salas ocupadas)")
 
 def renovar_membresias(coworking):
     print("\n--- RENOVACION AUTOMATICA DE MEMBRESIAS ---")
-    resultados = coworking.renovar_membresias_automatico()
-    if resultados:
-        for resultado in resultados:
-            print(resultado)
+    resumen = coworking.renovar_membresias_lote()
+    if resumen["resultados"]:
+        for resultado in resumen["resultados"]:
+            print(f"{resultado['nombre']}: {resultado['mensaje']}")
+        print(f"\nRenovadas: {resumen['renovados']} - Suspendidas: {resumen['suspendidos']} "
+              f"({resumen['clientes_por_segundo']:.0f} clientes/s)")
     else:
         print("No hay clientes activos para renovar")
 
 def ver_historial_ventas(coworking):
     print("\n--- HISTORIAL DE VENTAS DEL NEGOCIO ---")
-    ventas = coworking.obtener_historial_ventas()
+    cliente_id = input("ID del cliente (Enter para ver todas): ").strip() or None
+    pagina = 0
     
-    if not ventas:
-        print("No hay ventas registradas")
+    while True:
+        ventas = coworking.obtener_ultimas_ventas(20, pagina, cliente_id)
+        
+        if not ventas:
+            print("No hay ventas registradas" if pagina == 0 else "No hay mas ventas")
+            break
+        
+        total_general = 0
+        print("\nUltimas ventas:" if pagina == 0 else f"\nPagina {pagina + 1}:")
+        print("-" * 80)
+        for venta in ventas:
+            fecha = datetime.fromisoformat(venta['fecha']).strftime('%d/%m/%Y %H:%M')
+            print(f"{fecha} | {venta['tipo']:15} | {venta['cliente_id']:10} | {venta['descripcion']:30} | ${venta['monto']:>8}")
+            total_general += venta['monto']
+        
+        print("-" * 80)
+        print(f"Total de las ventas mostradas: ${total_general}")
+        
+        if len(ventas) < 20 or input("Ver ventas anteriores? (s/n): ").lower() != "s":
+            break
+        pagina += 1
+    
+    if cliente_id is not None:
         return
     
-    ventas_ordenadas = sorted(ventas, key=lambda x: x['fecha'], reverse=True)
+    # Totales acumulados, sin recorrer el historial
+    stats = coworking.obtener_estadisticas()
+    if stats['ventas_por_tipo']:
+        print("\nResumen por tipo de venta:")
+        for tipo, total in stats['ventas_por_tipo'].items():
+            print(f"  {tipo}: ${total}")
+        print(f"Total general en historial: ${stats['ventas_totales']}")
+
+def reporte_ventas(coworking):
+    print("\n--- REPORTE DE VENTAS POR FECHAS ---")
+    try:
+        desde = date.fromisoformat(input("Desde (AAAA-MM-DD): "))
+        hasta = date.fromisoformat(input("Hasta, incluida (AAAA-MM-DD): "))
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
     
-    total_general = 0
-    print("\nUltimas ventas:")
-    print("-" * 80)
-    for venta in ventas_ordenadas[:20]:
-        fecha = datetime.fromisoformat(venta['fecha']).strftime('%d/%m/%Y %H:%M')
-        print(f"{fecha} | {venta['tipo']:15} | {venta['cliente_id']:10} | {venta['descripcion']:30} | ${venta['monto']:>8}")
-        total_general += venta['monto']
+    stats = coworking.obtener_estadisticas(desde, hasta + timedelta(days=1))
+    print(f"\nVentas del {desde.strftime('%d/%m/%Y')} al {hasta.strftime('%d/%m/%Y')}: "
+          f"{stats['cantidad_ventas']} ventas - ${stats['ventas_totales']}")
     
-    print("-" * 80)
-    print(f"Total general en historial: ${total_general}")
+    print("\nPor tipo de venta:")
+    for tipo, total in stats['ventas_por_tipo'].items():
+        print(f"  {tipo}: ${total}")
     
-    ventas_por_tipo = {}
-    for venta in ventas:
-        tipo = venta['tipo']
-        ventas_por_tipo[tipo] = ventas_por_tipo.get(tipo, 0) + venta['monto']
+    mejores = sorted(stats['ventas_por_cliente'].items(), key=lambda x: x[1], reverse=True)[:10]
+    if mejores:
+        print("\nClientes con mas ventas:")
+        for cliente_id, total in mejores:
+            print(f"  {cliente_id}: ${total}")
     
-    print("\nResumen por tipo de venta:")
-    for tipo, total in ventas_por_tipo.items():
-        print(f"  {tipo}: ${total}")
+    # Productos mas vendidos: se analiza el historial del rango (un proceso por mes)
+    analisis = coworking.analizar_ventas(desde.isoformat(), (hasta + timedelta(days=1)).isoformat())
+    productos = sorted(analisis['por_producto'].items(), key=lambda x: x[1]['monto'], reverse=True)[:10]
+    if productos:
+        print("\nProductos mas vendidos:")
+        for id_producto, datos in productos:
+            producto = coworking.buscar_producto(id_producto)
+            nombre = producto.nombre if producto else id_producto
+            print(f"  {nombre}: {datos['unidades']} unidades - ${datos['monto']}")
+
+#Modo por lotes: cada linea del archivo es una operacion. Columnas / claves:
+#  registrar_cliente: id_cliente, nombre, correo, membresia (Basica, Estandar, Premium, Estudiante)
+#  reservar_sala: id_cliente, id_sala, inicio (AAAA-MM-DDTHH:MM), duracion_horas
+#  comprar_producto: id_cliente, id_producto, cantidad
+#  pagar_renovacion: id_cliente, monto
+#  cancelar_membresia: id_cliente
+#  reponer_stock: id_producto, cantidad
+
+MEMBRESIAS_LOTE = {
+    "Basica": MembresiaBasica,
+    "Estandar": MembresiaEstandar,
+    "Premium": MembresiaPremium,
+    "Estudiante": MembresiaEstudiante
+}
+
+def _lote_registrar_cliente(coworking, evento):
+    membresia = MEMBRESIAS_LOTE.get(evento.get('membresia') or "Basica")
+    if membresia is None:
+        raise ValueError(f"Membresia desconocida: {evento['membresia']}")
+    coworking.agregar_cliente(Cliente(evento['id_cliente'], evento['nombre'], evento['correo'], membresia()))
+
+def _cantidad_lote(cantidad):
+    """En el CSV llega como texto ("2.7" no es entero).
+    En JSONL se pasa tal cual y la valida el modelo: 2.7 se rechaza en vez de truncarse"""
+    return int(cantidad) if isinstance(cantidad, str) else cantidad
+
+def _lote_reservar_sala(coworking, evento):
+    duracion_horas = evento.get('duracion_horas')
+    coworking.reservar_sala(evento['id_cliente'], evento['id_sala'], datetime.fromisoformat(evento['inicio']),
+                            1 if duracion_horas is None else float(duracion_horas))
+
+def _lote_comprar_producto(coworking, evento):
+    cantidad = evento.get('cantidad')
+    coworking.comprar_producto(evento['id_cliente'], evento['id_producto'],
+                               1 if cantidad is None else _cantidad_lote(cantidad))
+
+def _lote_pagar_renovacion(coworking, evento):
+    coworking.pagar_renovacion(evento['id_cliente'], float(evento['monto']))
+
+def _lote_cancelar_membresia(coworking, evento):
+    coworking.cancelar_membresia(evento['id_cliente'])
+
+def _lote_reponer_stock(coworking, evento):
+    coworking.reponer_stock(evento['id_producto'], _cantidad_lote(evento['cantidad']))
+
+OPERACIONES_LOTE = {
+    "registrar_cliente": _lote_registrar_cliente,
+    "reservar_sala": _lote_reservar_sala,
+    "comprar_producto": _lote_comprar_producto,
+    "pagar_renovacion": _lote_pagar_renovacion,
+    "cancelar_membresia": _lote_cancelar_membresia,
+    "reponer_stock": _lote_reponer_stock
+}
+
+ERRORES_LOTE = (ClienteInhabilitadoError, SalaOcupadaError, PagoRechazadoError, ProductoAgotadoError,
+                StockInsuficienteError, ValueError, KeyError, TypeError)
+
+def leer_eventos(archivo):
+    """Recorre el archivo de operaciones linea a linea. Devuelve (numero_de_linea, evento)"""
+    with open(archivo, 'r', encoding='utf-8', newline='') as f:
+        if archivo.lower().endswith(".csv"):
+            lector = csv.DictReader(f)
+            for evento in lector:
+                # Las celdas vacias cuentan como campos ausentes
+                yield lector.line_num, {clave: valor for clave, valor in evento.items() if valor not in (None, "")}
+        else:
+            for numero, linea in enumerate(f, start=1):
+                if linea.strip():
+                    yield numero, linea
+
+def procesar_lote(coworking, almacen, archivo, punto_control=0, archivo_errores=None):
+    """Aplica las operaciones del archivo sin pasar por el menu. Una operacion que falla no detiene el resto"""
+    print(f"\n--- PROCESANDO LOTE {archivo} ---")
+    por_operacion = {}
+    correctas = fallidas = 0
+    errores = open(archivo_errores, 'w', encoding='utf-8') if archivo_errores else None
+    inicio = time.perf_counter()
+    
+    try:
+        for numero, evento in leer_eventos(archivo):
+            nombre = "?"
+            try:
+                if isinstance(evento, str):
+                    evento = json.loads(evento)
+                if not isinstance(evento, dict):
+                    raise ValueError(f"La linea no es un objeto JSON sino {type(evento).__name__}")
+                nombre = evento.get('operacion', "?")
+                operacion = OPERACIONES_LOTE.get(nombre)
+                if operacion is None:
+                    raise ValueError(f"Operacion desconocida: {nombre}")
+                operacion(coworking, evento)
+            except (ERRORES_LOTE + (json.JSONDecodeError,)) as e:
+                mensaje = f"Falta el campo {e}" if isinstance(e, KeyError) else str(e)
+                fallidas += 1
+                por_operacion.setdefault(nombre, [0, 0])[1] += 1
+                if errores:
+                    errores.write(json.dumps({'linea': numero, 'operacion': nombre, 'error': mensaje,
+                                              'evento': evento}, ensure_ascii=False, default=str) + "\n")
+                else:
+                    print(f"Linea {numero} ({nombre}): {mensaje}")
+                continue
+            
+            correctas += 1
+            por_operacion.setdefault(nombre, [0, 0])[0] += 1
+            if punto_control and correctas % punto_control == 0:
+                almacen.guardar_cambios(coworking)
+                print(f"Punto de control: {correctas} operaciones aplicadas")
+    finally:
+        if errores:
+            errores.close()
+    
+    segundos = time.perf_counter() - inicio
+    total = correctas + fallidas
+    print(f"\n{'Operacion':22} {'Correctas':>10} {'Fallidas':>10}")
+    print("-" * 44)
+    for nombre, (ok, mal) in sorted(por_operacion.items()):
+        print(f"{nombre:22} {ok:>10} {mal:>10}")
+    print("-" * 44)
+    print(f"{total} operaciones en {segundos:.2f} s ({total / segundos if segundos else 0:.0f} op/s). "
+          f"Correctas: {correctas} - Fallidas: {fallidas}")
+    if archivo_errores and fallidas:
+        print(f"Detalle de los errores en {archivo_errores}")
+    return {'correctas': correctas, 'fallidas': fallidas, 'por_operacion': por_operacion, 'segundos': segundos}
+
+def ver_metricas(coworking):
+    print("\n--- METRICAS DE RENDIMIENTO ---")
+    metricas = coworking.obtener_metricas()
+    
+    print(f"Medido durante {metricas['segundos_medidos']} segundos")
+    print(f"{'Operacion':40} {'Llamadas':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'Max ms':>9}")
+    print("-" * 90)
+    for nombre, datos in metricas['operaciones'].items():
+        print(f"{nombre:40} {datos['llamadas']:>9} {datos['p50_ms']:>9.3f} {datos['p95_ms']:>9.3f} "
+              f"{datos['p99_ms']:>9.3f} {datos['max_ms']:>9.3f}")
+    print("-" * 90)
+    print(f"Bytes leidos: {metricas['bytes']['leidos']:,} - escritos: {metricas['bytes']['escritos']:,}")
+    print(f"Libro de ventas: {metricas['libro_ventas']['ventas']} ventas, {metricas['libro_ventas']['bytes']:,} bytes")
+    
+    if metricas['perfil']['activo']:
+        print(f"Perfil en curso ({metricas['perfil']['segundos_restantes']} s restantes): {metricas['perfil']['archivo']}")
+    elif input("\nCapturar un perfil (cProfile)? (s/n): ").lower() == "s":
+        try:
+            segundos = float(input("Segundos de captura: "))
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        METRICAS.iniciar_perfil(segundos, "datos/perfil.prof")
+        print(f"Perfilando las proximas operaciones durante {segundos} segundos en datos/perfil.prof")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
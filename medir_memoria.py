@@ -0,0 +1,64 @@
+import tracemalloc
+from datetime import datetime, timedelta
+from models import Cliente, MembresiaEstandar
+
+#Mide los bytes por cliente con 1000 compras: representacion anterior (dicts) contra la actual (slots + arrays)
+
+PRODUCTOS = [("Cafe", 2), ("Te", 1.5), ("Agua", 1), ("Snack", 3), ("Sandwich", 5), ("Refresco", 2.5), ("Ensalada", 8)]
+
+
+class ClienteConDict:
+    """Cliente como era antes: atributos en __dict__ y compras como lista de diccionarios"""
+
+    def __init__(self, id_cliente, nombre, correo, membresia):
+        self.id_cliente = id_cliente
+        self.nombre = nombre
+        self.correo = correo
+        self.membresia = membresia
+        self.activo = True
+        self.entradas_usadas = 0
+        self.deuda_renovacion = 0
+        self.reservas = []
+        self.compras = []
+        self.fecha_ultimo_uso = datetime.now()
+
+
+def _compras(cantidad):
+    inicio = datetime(2025, 1, 1, 8, 0)
+    for i in range(cantidad):
+        nombre, precio = PRODUCTOS[i % len(PRODUCTOS)]
+        yield {
+            "fecha": inicio + timedelta(minutes=37 * i),
+            "producto": nombre,
+            "cantidad": 1 + i % 3,
+            "precio_unitario": precio,
+            "descuento": precio * 0.1,
+            "total": precio * 0.9 * (1 + i % 3)
+        }
+
+
+def medir(clase, clientes=200, compras_por_cliente=1000):
+    membresia = MembresiaEstandar()
+    tracemalloc.start()
+    antes = tracemalloc.take_snapshot()
+    lista = []
+    for i in range(clientes):
+        cliente = clase(f"C{i}", f"Cliente {i}", f"cliente{i}@correo.com", membresia)
+        cliente.compras.extend(_compras(compras_por_cliente))
+        lista.append(cliente)
+    despues = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in despues.compare_to(antes, "filename"))
+    return total / clientes
+
+
+def main():
+    antes = medir(ClienteConDict)
+    ahora = medir(Cliente)
+    print(f"Bytes por cliente con 1000 compras (dicts):        {antes:,.0f}")
+    print(f"Bytes por cliente con 1000 compras (slots+arrays): {ahora:,.0f}")
+    print(f"Reduccion: {antes / ahora:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
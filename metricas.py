@@ -0,0 +1,183 @@
+import cProfile
+import functools
+import math
+import os
+import threading
+import time
+
+#Metricas de rendimiento: llamadas, latencias (histograma con p50/p95/p99) y bytes leidos/escritos en datos/.
+#Un unico registro global (METRICAS) que comparten models, persistencia y el servicio
+
+# Cubetas del histograma: 10 por decada desde 1 microsegundo (cada una ~26% mas ancha que la anterior)
+CUBETAS_POR_DECADA = 10
+CANTIDAD_CUBETAS = 8 * CUBETAS_POR_DECADA  # Hasta 100 segundos; lo mas lento cae en la ultima
+
+
+class Histograma:
+    __slots__ = ("cubetas", "llamadas", "total", "maximo")
+
+    def __init__(self):
+        self.cubetas = [0] * CANTIDAD_CUBETAS
+        self.llamadas = 0
+        self.total = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, segundos):
+        microsegundos = segundos * 1e6
+        i = int(math.log10(microsegundos) * CUBETAS_POR_DECADA) + 1 if microsegundos > 1 else 0
+        self.cubetas[min(i, CANTIDAD_CUBETAS - 1)] += 1
+        self.llamadas += 1
+        self.total += segundos
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+    def percentil(self, fraccion):
+        """Limite superior (en segundos) de la cubeta donde cae el percentil"""
+        objetivo = fraccion * self.llamadas
+        acumulado = 0
+        for i, cantidad in enumerate(self.cubetas):
+            acumulado += cantidad
+            if cantidad and acumulado >= objetivo:
+                return min(10 ** (i / CUBETAS_POR_DECADA) / 1e6, self.maximo)
+        return self.maximo
+
+    def como_diccionario(self):
+        return {
+            "llamadas": self.llamadas,
+            "total_ms": round(self.total * 1000, 3),
+            "media_ms": round(self.total / self.llamadas * 1000, 4) if self.llamadas else 0,
+            "p50_ms": round(self.percentil(0.50) * 1000, 4),
+            "p95_ms": round(self.percentil(0.95) * 1000, 4),
+            "p99_ms": round(self.percentil(0.99) * 1000, 4),
+            "max_ms": round(self.maximo * 1000, 4)
+        }
+
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.operaciones = {}
+        self.bytes = {"leidos": 0, "escritos": 0}
+        self.desde = time.time()
+        # Captura de cProfile por ventana de tiempo (ver iniciar_perfil)
+        self._perfil = None
+        self._perfil_hasta = 0
+        self._perfil_archivo = None
+        self._lock_perfil = threading.Lock()
+        self._hilo = threading.local()
+
+    def registrar(self, nombre, segundos):
+        with self._lock:
+            histograma = self.operaciones.get(nombre)
+            if histograma is None:
+                histograma = self.operaciones[nombre] = Histograma()
+            histograma.registrar(segundos)
+
+    def sumar_bytes(self, sentido, cantidad):
+        """sentido: 'leidos' o 'escritos'"""
+        with self._lock:
+            self.bytes[sentido] += cantidad
+
+    def sumar_archivo(self, sentido, archivo):
+        try:
+            self.sumar_bytes(sentido, os.path.getsize(archivo))
+        except OSError:
+            pass
+
+    def reiniciar(self):
+        with self._lock:
+            self.operaciones = {}
+            self.bytes = {"leidos": 0, "escritos": 0}
+            self.desde = time.time()
+
+    def como_diccionario(self):
+        self._revisar_perfil()
+        with self._lock:
+            return {
+                "segundos_medidos": round(time.time() - self.desde, 1),
+                "operaciones": {nombre: histograma.como_diccionario()
+                                for nombre, histograma in sorted(self.operaciones.items())},
+                "bytes": dict(self.bytes),
+                "perfil": {"activo": self._perfil is not None, "archivo": self._perfil_archivo,
+                           "segundos_restantes": round(max(0, self._perfil_hasta - time.monotonic()), 1)
+                           if self._perfil is not None else 0}
+            }
+
+    #Perfilado con cProfile
+
+    def iniciar_perfil(self, segundos, archivo="datos/perfil.prof"):
+        """Perfila las operaciones medidas durante los proximos segundos y guarda el resultado en archivo
+        (se abre con pstats o snakeviz). Mientras dura la captura las operaciones medidas se ejecutan de a una"""
+        with self._lock_perfil:
+            if self._perfil is not None:
+                raise ValueError("Ya hay una captura de perfil en curso")
+            self._perfil = cProfile.Profile()
+            self._perfil_hasta = time.monotonic() + segundos
+            self._perfil_archivo = archivo
+
+    def detener_perfil(self):
+        """Termina la captura en curso y guarda el archivo. Devuelve su ruta o None"""
+        with self._lock_perfil:
+            perfil, archivo = self._perfil, self._perfil_archivo
+            if perfil is None:
+                return None
+            self._perfil = None
+            directorio = os.path.dirname(archivo)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            perfil.dump_stats(archivo)
+        return archivo
+
+    def _revisar_perfil(self):
+        # Dentro de una llamada perfilada no se puede cerrar la captura: se cierra en la siguiente
+        if getattr(self._hilo, "perfilando", False):
+            return
+        if self._perfil is not None and time.monotonic() >= self._perfil_hasta:
+            self.detener_perfil()
+
+    def _llamar_perfilado(self, funcion, args, kwargs):
+        with self._lock_perfil:
+            perfil = self._perfil
+            if perfil is None:
+                return funcion(*args, **kwargs)
+            # Las llamadas anidadas quedan dentro de la llamada exterior
+            self._hilo.perfilando = True
+            try:
+                return perfil.runcall(funcion, *args, **kwargs)
+            finally:
+                self._hilo.perfilando = False
+
+    def medir(self, nombre, funcion):
+        """Envuelve funcion para contar sus llamadas y su latencia bajo nombre"""
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                if self._perfil is not None and not getattr(self._hilo, "perfilando", False):
+                    self._revisar_perfil()
+                    return self._llamar_perfilado(funcion, args, kwargs)
+                return funcion(*args, **kwargs)
+            finally:
+                self.registrar(nombre, time.perf_counter() - inicio)
+        return envoltura
+
+
+METRICAS = Metricas()
+
+
+def instrumentar_clase(clase, prefijo=None, excluir=()):
+    """Mide todos los metodos publicos definidos en la clase, salvo los de excluir"""
+    prefijo = prefijo or clase.__name__
+    for nombre, valor in list(vars(clase).items()):
+        if nombre.startswith("_") or nombre in excluir or not callable(valor):
+            continue
+        if isinstance(valor, (staticmethod, classmethod, type)):
+            continue
+        setattr(clase, nombre, METRICAS.medir(f"{prefijo}.{nombre}", valor))
+    return clase
+
+
+def instrumentar_funciones(espacio, nombres, prefijo):
+    """Reemplaza las funciones indicadas de un modulo (sus globals()) por su version medida"""
+    for nombre in nombres:
+        espacio[nombre] = METRICAS.medir(f"{prefijo}.{nombre}", espacio[nombre])
@@ -1,5 +1,17 @@
-import json
+import heapq
+import math
+import operator
+import threading
+import time
+from contextlib import ExitStack
+from array import array
+from bisect import bisect_left, bisect_right, insort
 from datetime import datetime, timedelta
+from itertools import chain, islice, takewhile
+from metricas import METRICAS, instrumentar_clase
+from ocupacion import (GrillaOcupacion, DIA_COMPLETO, FRANJAS_HORA, MINUTOS_FRANJA, contar_bits, dias_entre, huecos,
+                       mascara_horario)
+from ventas import LibroVentasPorMes
 
 #Excepciones personalizadas para busquedas y operaciones en el sistema
 
@@ -18,9 +30,17 @@ class ProductoAgotadoError(Exception):
 class StockInsuficienteError(Exception):
     pass
 
+class ReservaEnBloqueError(SalaOcupadaError):
+    """Reservas en bloque rechazadas: conflictos tiene un dict por cada reserva del lote que choca"""
+    def __init__(self, conflictos):
+        super().__init__(f"{len(conflictos)} reservas del lote no se pueden hacer")
+        self.conflictos = conflictos
+
 # Clase base para las membresías
 
 class MembresiaBase:
+    __slots__ = ("tipo", "precio", "entradas_mes", "descuento_productos", "limite_deuda")
+    
     def __init__(self, tipo, precio, entradas_mes, descuento_productos=0, limite_deuda=100):
         self.tipo = tipo
         self.precio = precio
@@ -40,45 +60,217 @@ class MembresiaBase:
 
 #Cambiar precios y beneficios
 class MembresiaBasica(MembresiaBase):
+    __slots__ = ()
+    
     def __init__(self):
         super().__init__("Basica", 100, 10, 5, 100)
 
 class MembresiaEstandar(MembresiaBase):
+    __slots__ = ()
+    
     def __init__(self):
         super().__init__("Estandar", 200, 30, 10, 200)
 
 class MembresiaPremium(MembresiaBase):
+    __slots__ = ()
+    
     def __init__(self):
         super().__init__("Premium", 350, 80, 15, 350)
 
 class MembresiaEstudiante(MembresiaBase):
+    __slots__ = ()
+    
     def __init__(self):
         super().__init__("Estudiante", 70, 15, 10, 70)
 
 #Clase para productos
 
+UMBRAL_STOCK_BAJO = 10
+# La demanda de cada producto es una media movil exponencial de las unidades vendidas:
+# una venta de hace VIDA_MEDIA_DEMANDA_DIAS dias pesa la mitad que una de hoy
+VIDA_MEDIA_DEMANDA_DIAS = 7
+_TAU_DEMANDA = VIDA_MEDIA_DEMANDA_DIAS * 86400 / math.log(2)
+
+
+def cantidad_entera(cantidad, nombre):
+    """Unidades de un producto: entero positivo (2.0 se acepta como 2). Se valida antes de tocar el stock"""
+    if isinstance(cantidad, float) and cantidad.is_integer():
+        cantidad = int(cantidad)
+    if isinstance(cantidad, bool) or not isinstance(cantidad, int) or cantidad <= 0:
+        raise ValueError(f"Cantidad invalida para {nombre}: {cantidad}")
+    return cantidad
+
 class Producto:
-    def __init__(self, id_producto, nombre, precio, stock):
+    __slots__ = ("id_producto", "nombre", "precio", "stock", "umbral_stock", "demanda", "ultima_demanda",
+                 "observador", "_lock")
+    
+    def __init__(self, id_producto, nombre, precio, stock, umbral_stock=UMBRAL_STOCK_BAJO):
         self.id_producto = id_producto
         self.nombre = nombre
         self.precio = precio
         self.stock = stock
+        self.umbral_stock = umbral_stock
+        # Unidades vendidas con peso decreciente en el tiempo, a la fecha ultima_demanda (epoch)
+        self.demanda = 0.0
+        self.ultima_demanda = None
+        # Funcion (producto, stock_antes) llamada en cada cambio de stock (ver Coworking._stock_actualizado)
+        self.observador = None
+        self._lock = threading.RLock()
     
     def reducir_stock(self, cantidad):
-        if cantidad > self.stock:
-            raise StockInsuficienteError(f"Stock insuficiente de {self.nombre}. Stock disponible: {self.stock}")
-        self.stock -= cantidad
+        with self._lock:
+            if cantidad > self.stock:
+                raise StockInsuficienteError(f"Stock insuficiente de {self.nombre}. Stock disponible: {self.stock}")
+            stock_antes = self.stock
+            self.stock -= cantidad
+            self._avisar(stock_antes)
 
     def reponer_stock(self, cantidad):
-        self.stock += cantidad
+        with self._lock:
+            stock_antes = self.stock
+            self.stock += cantidad
+            self._avisar(stock_antes)
+    
+    def ajustar_stock(self, stock):
+        """Fija el stock (inventario, deshacer una compra, cambios de otro proceso) avisando del cambio"""
+        with self._lock:
+            stock_antes = self.stock
+            self.stock = stock
+            self._avisar(stock_antes)
+    
+    def _avisar(self, stock_antes):
+        if self.observador is not None and self.stock != stock_antes:
+            self.observador(self, stock_antes)
+    
+    def bajo_stock(self):
+        return self.stock < self.umbral_stock
+    
+    def registrar_demanda(self, cantidad, momento=None):
+        """Suma unidades vendidas a la demanda, atenuando lo acumulado segun el tiempo transcurrido"""
+        momento = time.time() if momento is None else momento
+        with self._lock:
+            self.demanda = self._demanda_en(momento) + cantidad
+            self.ultima_demanda = max(momento, self.ultima_demanda or momento)
+    
+    def _demanda_en(self, momento):
+        if self.ultima_demanda is None:
+            return 0.0
+        return self.demanda * math.exp(-max(momento - self.ultima_demanda, 0) / _TAU_DEMANDA)
+    
+    def velocidad_venta(self, momento=None):
+        """Unidades vendidas por dia segun la media movil exponencial"""
+        momento = time.time() if momento is None else momento
+        return self._demanda_en(momento) / _TAU_DEMANDA * 86400
+    
+    def dias_hasta_agotar(self, momento=None):
+        """Dias hasta quedarse sin stock al ritmo de venta actual (None si no se vende)"""
+        velocidad = self.velocidad_venta(momento)
+        if velocidad <= 0:
+            return None
+        return self.stock / velocidad
     
     def __str__(self):
         return f"Producto: {self.nombre} - ID: {self.id_producto}  - ${self.precio} (Stock: {self.stock})"
     
 
+#Historial de compras de un cliente guardado por columnas (arrays) en lugar de un dict por compra
+
+EPOCA = datetime(1970, 1, 1)
+UN_MICROSEGUNDO = timedelta(microseconds=1)
+
+class HistorialCompras:
+    __slots__ = ("_fechas", "_productos", "_cantidades", "_precios", "_descuentos", "_totales")
+    
+    # Tabla compartida de nombres de producto: cada compra guarda solo el indice
+    _nombres = []
+    _indices_nombres = {}
+    
+    def __init__(self, compras=()):
+        self._fechas = array("q")  # microsegundos desde 1970, exacto a diferencia de un double
+        self._productos = array("l")
+        self._cantidades = array("l")
+        self._precios = array("d")
+        self._descuentos = array("d")
+        self._totales = array("d")
+        self.extend(compras)
+    
+    @classmethod
+    def _indice_nombre(cls, nombre):
+        indice = cls._indices_nombres.get(nombre)
+        if indice is None:
+            indice = len(cls._nombres)
+            cls._nombres.append(nombre)
+            cls._indices_nombres[nombre] = indice
+        return indice
+    
+    def _columnas(self):
+        return (self._fechas, self._productos, self._cantidades, self._precios, self._descuentos, self._totales)
+    
+    def append(self, compra):
+        # Todos los valores se convierten antes de tocar las columnas: la compra entra completa o no entra
+        valores = (
+            (compra["fecha"] - EPOCA) // UN_MICROSEGUNDO,
+            self._indice_nombre(compra["producto"]),
+            operator.index(compra["cantidad"]),
+            float(compra["precio_unitario"]),
+            float(compra["descuento"]),
+            float(compra["total"])
+        )
+        agregadas = []
+        try:
+            for columna, valor in zip(self._columnas(), valores):
+                columna.append(valor)
+                agregadas.append(columna)
+        except Exception:
+            for columna in agregadas:
+                columna.pop()
+            raise
+    
+    def extend(self, compras):
+        for compra in compras:
+            self.append(compra)
+    
+    def _compra(self, i):
+        return {
+            "fecha": EPOCA + timedelta(microseconds=self._fechas[i]),
+            "producto": self._nombres[self._productos[i]],
+            "cantidad": self._cantidades[i],
+            "precio_unitario": self._precios[i],
+            "descuento": self._descuentos[i],
+            "total": self._totales[i]
+        }
+    
+    def __len__(self):
+        return len(self._fechas)
+    
+    def __iter__(self):
+        for i in range(len(self._fechas)):
+            yield self._compra(i)
+    
+    def __getitem__(self, posicion):
+        if isinstance(posicion, slice):
+            return [self._compra(i) for i in range(*posicion.indices(len(self)))]
+        if posicion < 0:
+            posicion += len(self)
+        if not 0 <= posicion < len(self):
+            raise IndexError("compra fuera de rango")
+        return self._compra(posicion)
+    
+    def __setitem__(self, posicion, compras):
+        if not isinstance(posicion, slice) or posicion.stop is not None or posicion.step is not None:
+            raise TypeError("Solo se puede reemplazar el final del historial: compras[desde:] = [...]")
+        desde = posicion.indices(len(self))[0]
+        for columna in self._columnas():
+            del columna[desde:]
+        self.extend(compras)
+
+
 #Clase para clientes
 
 class Cliente:
+    __slots__ = ("id_cliente", "nombre", "correo", "membresia", "activo", "entradas_usadas", "deuda_renovacion",
+                 "reservas", "_compras", "fecha_ultimo_uso", "_compras_guardadas", "_lock")
+    
     def __init__(self, id_cliente, nombre, correo, membresia):
         self.id_cliente = id_cliente
         self.nombre = nombre
@@ -90,6 +282,16 @@ class Cliente:
         self.reservas = []
         self.compras = []
         self.fecha_ultimo_uso = datetime.now()
+        self._compras_guardadas = 0
+        self._lock = threading.RLock()
+    
+    @property
+    def compras(self):
+        return self._compras
+    
+    @compras.setter
+    def compras(self, compras):
+        self._compras = compras if isinstance(compras, HistorialCompras) else HistorialCompras(compras)
 
     def puede_entrar(self):
         if not self.activo:
@@ -118,12 +320,18 @@ class Cliente:
         if producto.stock < cantidad:
             raise ProductoAgotadoError(f"Producto {producto.nombre} agotado o stock insuficiente")
         
+        compra = self.preparar_compra(producto, cantidad)
+        producto.reducir_stock(cantidad)
+        self.compras.append(compra)
+        
+        return compra
+    
+    def preparar_compra(self, producto, cantidad):
+        """Calcula la compra con el descuento de la membresia, sin tocar stock ni historial"""
         descuento = self.membresia.calcular_descuento_producto(producto.precio)
         precio_final = (producto.precio - descuento) * cantidad
-        
-        producto.reducir_stock(cantidad)
 
-        compra = {
+        return {
             "fecha": datetime.now(),
             "producto": producto.nombre,
             "cantidad": cantidad,
@@ -131,18 +339,29 @@ class Cliente:
             "descuento": descuento * cantidad,
             "total": precio_final
         }
-        self.compras.append(compra)
-        
-        return compra
     
     def renovar_membresia(self):
+        return self.aplicar_renovacion()["mensaje"]
+    
+    def aplicar_renovacion(self):
+        """Suma el mes a la deuda y devuelve el resultado como diccionario"""
         self.deuda_renovacion += self.membresia.precio
         
         if self.deuda_renovacion >= self.membresia.limite_deuda:
             self.activo = False
-            return "Membresia suspendida por deuda acumulada"
+            return {
+                "renovado": False,
+                "suspendido": True,
+                "deuda": self.deuda_renovacion,
+                "mensaje": "Membresia suspendida por deuda acumulada"
+            }
         
-        return f"Renovacion registrada. Deuda: ${self.deuda_renovacion}"
+        return {
+            "renovado": True,
+            "suspendido": False,
+            "deuda": self.deuda_renovacion,
+            "mensaje": f"Renovacion registrada. Deuda: ${self.deuda_renovacion}"
+        }
     
     def pagar_renovacion(self, monto):
         if monto <= 0:
@@ -175,19 +394,106 @@ class Cliente:
 #Clase para salas de reuniones
 
 class Sala:
+    __slots__ = ("id_sala", "nombre", "capacidad", "reservas", "_inicios", "ocupacion", "_lock")
+    
     def __init__(self, id_sala, nombre, capacidad):
         self.id_sala = id_sala
         self.nombre = nombre
         self.capacidad = capacidad
+        # Reservas ordenadas por inicio. Como no se solapan, tambien quedan ordenadas por fin
         self.reservas = []
+        self._inicios = []
+        # Franjas de 15 minutos ocupadas por dia (ver ocupacion.py)
+        self.ocupacion = GrillaOcupacion()
+        self._lock = threading.RLock()
+    
+    def _posicion_conflicto(self, inicio, fin):
+        """Devuelve el indice de una reserva que se solapa con [inicio, fin) o None"""
+        i = bisect_right(self._inicios, inicio)
+        # La reserva anterior es la unica que puede empezar antes y seguir ocupando la sala
+        if i > 0 and self.reservas[i - 1].fin > inicio:
+            return i - 1
+        if i < len(self.reservas) and self.reservas[i].inicio < fin:
+            return i
+        return None
     
     def esta_disponible(self, fecha_hora, duracion_horas):
         fin_reserva = fecha_hora + timedelta(hours=duracion_horas)
-        
-        for reserva in self.reservas:
-            if (fecha_hora < reserva.fin and fin_reserva > reserva.inicio):
-                return False
-        return True
+        with self._lock:
+            return self._posicion_conflicto(fecha_hora, fin_reserva) is None
+    
+    def agregar_reserva(self, reserva):
+        with self._lock:
+            if self._posicion_conflicto(reserva.inicio, reserva.fin) is not None:
+                raise SalaOcupadaError("Sala no disponible")
+            i = bisect_right(self._inicios, reserva.inicio)
+            self._inicios.insert(i, reserva.inicio)
+            self.reservas.insert(i, reserva)
+            self.ocupacion.marcar(reserva.inicio, reserva.fin)
+    
+    def buscar_conflictos(self, nuevas):
+        """nuevas: [(inicio, fin, indice), ...]. Devuelve [(indice, motivo)] de las que se solapan con una
+        reserva de la sala o con otra del mismo lote, en un solo barrido ordenado de ambas listas"""
+        nuevas = sorted(nuevas)
+        conflictos = []
+        with self._lock:
+            # Como las reservas no se solapan, estan ordenadas por inicio y por fin: j solo avanza
+            j = max(0, bisect_right(self._inicios, nuevas[0][0]) - 1)
+            fin_lote, indice_lote = None, None
+            for inicio, fin, indice in nuevas:
+                while j < len(self.reservas) and self.reservas[j].fin <= inicio:
+                    j += 1
+                if j < len(self.reservas) and self.reservas[j].inicio < fin:
+                    conflictos.append((indice, f"Se solapa con la reserva {self.reservas[j].id_reserva}"))
+                elif fin_lote is not None and inicio < fin_lote:
+                    conflictos.append((indice, f"Se solapa con la reserva {indice_lote} del mismo lote"))
+                if fin_lote is None or fin > fin_lote:
+                    fin_lote, indice_lote = fin, indice
+        return conflictos
+    
+    def agregar_reservas(self, reservas):
+        """Agrega reservas ya comprobadas con buscar_conflictos, intercalandolas en orden en una sola pasada"""
+        with self._lock:
+            combinadas = list(heapq.merge(self.reservas, sorted(reservas, key=lambda r: r.inicio),
+                                          key=lambda r: r.inicio))
+            self.reservas[:] = combinadas
+            self._inicios[:] = [reserva.inicio for reserva in combinadas]
+            for reserva in reservas:
+                self.ocupacion.marcar(reserva.inicio, reserva.fin)
+    
+    def cargar_reservas(self, reservas):
+        """Agrega reservas ya guardadas, ordenadas por inicio y sin solapes, sin volver a validarlas"""
+        with self._lock:
+            self.reservas.extend(reservas)
+            self._inicios.extend(reserva.inicio for reserva in reservas)
+            for reserva in reservas:
+                self.ocupacion.marcar(reserva.inicio, reserva.fin)
+    
+    def anterior_horario_libre(self, hasta, duracion_horas):
+        """Ultimo inicio <= hasta en el que la sala queda libre durante duracion_horas"""
+        duracion = timedelta(hours=duracion_horas)
+        inicio = hasta
+        with self._lock:
+            # Reservas que empiezan antes de que termine la ventana; se retrocede mientras la ultima choque
+            i = bisect_left(self._inicios, inicio + duracion)
+            while i > 0 and self.reservas[i - 1].fin > inicio:
+                inicio = min(inicio, self.reservas[i - 1].inicio - duracion)
+                i -= 1
+        return inicio
+    
+    def proximo_horario_libre(self, desde, duracion_horas):
+        """Primer inicio >= desde en el que la sala queda libre durante duracion_horas"""
+        duracion = timedelta(hours=duracion_horas)
+        inicio = desde
+        with self._lock:
+            i = bisect_left(self._inicios, desde)
+            if i > 0 and self.reservas[i - 1].fin > inicio:
+                inicio = self.reservas[i - 1].fin
+            # Se avanza por los huecos entre reservas consecutivas hasta encontrar uno suficiente
+            while i < len(self.reservas) and self.reservas[i].inicio < inicio + duracion:
+                inicio = max(inicio, self.reservas[i].fin)
+                i += 1
+        return inicio
     
     def __str__(self):
         return f"ID Sala: {self.id_sala} - {self.nombre}. (Capacidad: {self.capacidad})"
@@ -196,6 +502,8 @@ class Sala:
 #Clase para reservas de salas
 
 class Reserva:
+    __slots__ = ("id_reserva", "cliente", "sala", "inicio", "duracion_horas", "fin")
+    
     def __init__(self, id_reserva, cliente, sala, inicio, duracion_horas):
         self.id_reserva = id_reserva
         self.cliente = cliente
@@ -207,16 +515,251 @@ class Reserva:
     def __str__(self):
         return f"Reserva {self.id_reserva}: {self.cliente.nombre} - {self.sala.nombre} - {self.inicio.strftime('%d/%m %H:%M')}"
     
+#Clase para las estadisticas acumuladas del coworking (se actualizan en O(1) con cada operacion)
+
+class EstadisticasCoworking:
+    def __init__(self):
+        self.total_clientes = 0
+        self.clientes_activos = 0
+        self.membresias_por_tipo = {}
+        self.valor_inventario = 0
+        self.productos_bajo_stock = {}
+        self.ventas_totales = 0
+        self.ventas_por_tipo = {}
+    
+    def agregar_cliente(self, cliente):
+        self.total_clientes += 1
+        if cliente.activo:
+            self.clientes_activos += 1
+        tipo = cliente.membresia.tipo
+        self.membresias_por_tipo[tipo] = self.membresias_por_tipo.get(tipo, 0) + 1
+    
+    def actualizar_cliente(self, cliente, activo_antes):
+        if cliente.activo and not activo_antes:
+            self.clientes_activos += 1
+        elif activo_antes and not cliente.activo:
+            self.clientes_activos -= 1
+    
+    def agregar_producto(self, producto):
+        self.valor_inventario += producto.precio * producto.stock
+        self._revisar_stock_bajo(producto)
+    
+    def actualizar_stock(self, producto, stock_antes):
+        """True si el producto acaba de quedar por debajo de su umbral"""
+        self.valor_inventario += producto.precio * (producto.stock - stock_antes)
+        return self._revisar_stock_bajo(producto)
+    
+    def _revisar_stock_bajo(self, producto):
+        if producto.bajo_stock():
+            nuevo = producto.id_producto not in self.productos_bajo_stock
+            self.productos_bajo_stock[producto.id_producto] = producto.nombre
+            return nuevo
+        self.productos_bajo_stock.pop(producto.id_producto, None)
+        return False
+    
+    def cargar_totales_ventas(self, totales_por_tipo):
+        for tipo, monto in totales_por_tipo.items():
+            self.ventas_totales += monto
+            self.ventas_por_tipo[tipo] = self.ventas_por_tipo.get(tipo, 0) + monto
+    
+    def registrar_venta(self, venta):
+        tipo = venta["tipo"]
+        self.ventas_totales += venta["monto"]
+        self.ventas_por_tipo[tipo] = self.ventas_por_tipo.get(tipo, 0) + venta["monto"]
+    
+    def como_diccionario(self, total_reservas):
+        return {
+            "total_clientes": self.total_clientes,
+            "clientes_activos": self.clientes_activos,
+            "total_reservas": total_reservas,
+            "membresias_por_tipo": dict(self.membresias_por_tipo),
+            "valor_inventario": self.valor_inventario,
+            "productos_bajo_stock": list(self.productos_bajo_stock.values()),
+            "ventas_totales": self.ventas_totales,
+            "ventas_por_tipo": dict(self.ventas_por_tipo)
+        }
+
+
+#Indices secundarios sobre los clientes (correo, tipo de membresia, estado y deuda)
+
+class ListaOrdenada:
+    """Lista ordenada partida en tramos de a lo sumo 2 * CARGA elementos. Agregar o quitar solo mueve
+    los elementos de un tramo, en lugar de toda la lista como insort/del sobre una lista comun"""
+    CARGA = 500
+    
+    def __init__(self):
+        self._tramos = []
+        self._maximos = []  # ultimo elemento de cada tramo
+        self._largo = 0
+    
+    def __len__(self):
+        return self._largo
+    
+    def agregar(self, valor):
+        if not self._tramos:
+            self._tramos.append([valor])
+            self._maximos.append(valor)
+        else:
+            i = min(bisect_left(self._maximos, valor), len(self._tramos) - 1)
+            tramo = self._tramos[i]
+            insort(tramo, valor)
+            self._maximos[i] = tramo[-1]
+            if len(tramo) > 2 * self.CARGA:
+                self._tramos[i:i + 1] = [tramo[:self.CARGA], tramo[self.CARGA:]]
+                self._maximos[i:i + 1] = [tramo[self.CARGA - 1], tramo[-1]]
+        self._largo += 1
+    
+    def quitar(self, valor):
+        i = bisect_left(self._maximos, valor)
+        tramo = self._tramos[i] if i < len(self._tramos) else []
+        j = bisect_left(tramo, valor)
+        if j == len(tramo) or tramo[j] != valor:
+            raise ValueError(f"{valor} no esta en la lista")
+        del tramo[j]
+        if tramo:
+            self._maximos[i] = tramo[-1]
+        else:
+            del self._tramos[i]
+            del self._maximos[i]
+        self._largo -= 1
+    
+    @classmethod
+    def de_ordenados(cls, valores):
+        """Construye la lista de una vez a partir de valores ya ordenados"""
+        lista = cls()
+        lista._tramos = [valores[i:i + cls.CARGA] for i in range(0, len(valores), cls.CARGA)]
+        lista._maximos = [tramo[-1] for tramo in lista._tramos]
+        lista._largo = len(valores)
+        return lista
+    
+    def desde(self, valor):
+        """Elementos >= valor de menor a mayor"""
+        i = bisect_left(self._maximos, valor)
+        if i < len(self._tramos):
+            yield from self._tramos[i][bisect_left(self._tramos[i], valor):]
+            for tramo in self._tramos[i + 1:]:
+                yield from tramo
+    
+    def de_mayor_a_menor(self):
+        for tramo in reversed(self._tramos):
+            yield from reversed(tramo)
+
+
+class IndiceClientes:
+    def __init__(self):
+        self.por_correo = {}
+        self.por_tipo = {}
+        self.activos = set()
+        # (deuda, id_cliente) ordenados: uno global y uno por tipo de membresia
+        self.por_deuda = ListaOrdenada()
+        self.por_deuda_tipo = {}
+        # Deuda con la que esta indexado cada cliente (la entrada a quitar cuando cambia)
+        self.deudas = {}
+        self.limites = {}
+    
+    def agregar(self, cliente, deuda=True):
+        """Con deuda=False la deuda queda para un reindexar_deudas posterior"""
+        id_cliente = cliente.id_cliente
+        tipo = cliente.membresia.tipo
+        self.por_correo.setdefault(cliente.correo, set()).add(id_cliente)
+        self.por_tipo.setdefault(tipo, set()).add(id_cliente)
+        self.limites[tipo] = cliente.membresia.limite_deuda
+        if cliente.activo:
+            self.activos.add(id_cliente)
+        if not deuda:
+            return
+        entrada = (cliente.deuda_renovacion, id_cliente)
+        self.deudas[id_cliente] = cliente.deuda_renovacion
+        self.por_deuda.agregar(entrada)
+        self.por_deuda_tipo.setdefault(tipo, ListaOrdenada()).agregar(entrada)
+    
+    def actualizar(self, cliente, antes, deuda=True):
+        """Con deuda=False la deuda queda para un reindexar_deudas posterior"""
+        activo_antes = antes[0]
+        id_cliente = cliente.id_cliente
+        if cliente.activo != activo_antes:
+            if cliente.activo:
+                self.activos.add(id_cliente)
+            else:
+                self.activos.discard(id_cliente)
+        deuda_indexada = self.deudas[id_cliente]
+        if deuda and cliente.deuda_renovacion != deuda_indexada:
+            nueva = (cliente.deuda_renovacion, id_cliente)
+            for lista in (self.por_deuda, self.por_deuda_tipo[cliente.membresia.tipo]):
+                lista.quitar((deuda_indexada, id_cliente))
+                lista.agregar(nueva)
+            self.deudas[id_cliente] = cliente.deuda_renovacion
+    
+    def reindexar_deudas(self, clientes):
+        """Rehace los indices de deuda con un ordenamiento por tipo (despues de cambiar muchas deudas juntas)"""
+        por_tipo = {}
+        for cliente in clientes:
+            self.deudas[cliente.id_cliente] = cliente.deuda_renovacion
+            por_tipo.setdefault(cliente.membresia.tipo, []).append((cliente.deuda_renovacion, cliente.id_cliente))
+        for entradas in por_tipo.values():
+            entradas.sort()
+        # El ordenamiento global solo intercala las listas de cada tipo, que ya vienen ordenadas
+        self.por_deuda = ListaOrdenada.de_ordenados(sorted(chain.from_iterable(por_tipo.values())))
+        self.por_deuda_tipo = {tipo: ListaOrdenada.de_ordenados(entradas) for tipo, entradas in por_tipo.items()}
+    
+    def mayores_deudores(self, cantidad):
+        """Ids de los clientes con mas deuda, de mayor a menor (solo los que deben algo)"""
+        if cantidad <= 0:
+            return []
+        deudores = takewhile(lambda entrada: entrada[0] > 0, self.por_deuda.de_mayor_a_menor())
+        return [id_cliente for _, id_cliente in islice(deudores, cantidad)]
+    
+    def cerca_del_limite(self, fraccion):
+        """(deuda, id_cliente) con deuda >= fraccion * limite de su membresia, de mayor a menor deuda"""
+        resultado = []
+        for tipo, lista in self.por_deuda_tipo.items():
+            minimo = fraccion * self.limites[tipo]
+            resultado.extend(lista.desde((minimo,)))
+        resultado.sort(reverse=True)
+        return resultado
+
+
+def fechas_recurrentes(inicio, hasta, cada_dias=7):
+    """inicio, inicio + cada_dias, ... mientras sea anterior a hasta"""
+    if cada_dias <= 0:
+        raise ValueError("El intervalo de la serie debe ser de al menos un dia")
+    paso = timedelta(days=cada_dias)
+    fecha = inicio
+    while fecha < hasta:
+        yield fecha
+        fecha += paso
+
+
 #Clase para gestionar el coworking
 
 class Coworking:
-    def __init__(self):
+    def __init__(self, libro_ventas=None):
         self.clientes = {}
         self.salas = {}
         self.reservas = {}
         self.productos = {}
         self.prox_id_reserva = 1
-        
+        self.libro_ventas = libro_ventas if libro_ventas is not None else LibroVentasPorMes()
+        # Orden de bloqueo: cliente -> sala / productos (por id) -> libro de ventas -> _lock_agregados
+        self._lock_agregados = threading.RLock()
+        self._estadisticas = EstadisticasCoworking()
+        self._indice_clientes = IndiceClientes()
+        # (capacidad, id_sala) ordenado: para buscar la sala mas chica en la que entra un grupo
+        self._salas_por_capacidad = []
+        # Cambios pendientes de guardar (ver persistencia.guardar_cambios)
+        self._clientes_modificados = set()
+        self._productos_modificados = set()
+        self._reservas_nuevas = []
+        # True si la ultima foto completa quedo a medias: el proximo guardado tiene que ser completo
+        self._foto_pendiente = False
+        # Avisos de productos que quedaron bajo su umbral, y funciones a llamar en cada aviso
+        self._alertas_stock = []
+        self._oyentes_stock = []
+        # En una red de sedes (sedes.py) resuelve los clientes de otra sede que reservaron aqui
+        self.buscar_visitante = None
+        # Unica lectura del historial: al arrancar, para partir de los acumulados ya registrados
+        self._resumen_ventas = self.libro_ventas.resumen_por_periodo()
+        self._estadisticas.cargar_totales_ventas(self._resumen_ventas.totales_por_tipo())
     
     def inicializar_datos_default(self):
         self._crear_salas_si_no_existen()
@@ -252,8 +795,27 @@ class Coworking:
 
 
     #Registro de ventas
-    def _registrar_venta(self, tipo_venta, cliente_id, descripcion, monto):
-        """Registra una venta en el historial del negocio"""
+    def _registrar_venta(self, tipo_venta, cliente_id, descripcion, monto, **detalle):
+        """Registra una venta en el historial del negocio. Vuelve cuando esta escrita en el libro
+        (si la escritura falla se lanza el error y los acumulados no cambian)"""
+        venta = self._crear_venta(tipo_venta, cliente_id, descripcion, monto, **detalle)
+        
+        self.libro_ventas.registrar(venta).esperar()
+        with self._lock_agregados:
+            self._estadisticas.registrar_venta(venta)
+            self._resumen_ventas.registrar(venta)
+        return venta
+    
+    def _registrar_ventas(self, ventas):
+        """Registra varias ventas con una sola escritura en el libro y espera a que quede hecha"""
+        self.libro_ventas.registrar_lote(ventas).esperar()
+        with self._lock_agregados:
+            for venta in ventas:
+                self._estadisticas.registrar_venta(venta)
+                self._resumen_ventas.registrar(venta)
+        return ventas
+    
+    def _crear_venta(self, tipo_venta, cliente_id, descripcion, monto, **detalle):
         venta = {
             "fecha": datetime.now().isoformat(),  # Ya es string, no datetime
             "tipo": tipo_venta,
@@ -261,132 +823,591 @@ class Coworking:
             "descripcion": descripcion,
             "monto": monto
         }
-        
-        try:
-            with open("datos/ventas.json", "r", encoding='utf-8') as f:
-                ventas = json.load(f)
-        except FileNotFoundError:
-            ventas = []
-        
-        ventas.append(venta)
-        
-        with open("datos/ventas.json", "w", encoding='utf-8') as f:
-            json.dump(ventas, f, indent=2, ensure_ascii=False)
-        
+        venta.update(detalle)  # producto_id y cantidad en las ventas de productos
         return venta
     
-    def obtener_historial_ventas(self):
-        """Obtiene el historial completo de ventas"""
-        try:
-            with open("datos/ventas.json", "r", encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return []
+    def obtener_historial_ventas(self, tipo=None, cliente_id=None, desde=None, hasta=None):
+        """Obtiene el historial de ventas, completo o filtrado por tipo, cliente y fechas ISO"""
+        if tipo is None and cliente_id is None and desde is None and hasta is None:
+            return list(self.libro_ventas.iterar())
+        return list(self.libro_ventas.consultar(tipo, cliente_id, desde, hasta))
+    
+    def obtener_ultimas_ventas(self, cantidad=20, pagina=0, cliente_id=None):
+        """Ventas mas recientes primero, por paginas (de todo el negocio o de un cliente).
+        Solo se leen del libro las ventas de la pagina pedida"""
+        return self.libro_ventas.ultimas(cantidad, pagina, cliente_id)
+    
+    def analizar_ventas(self, desde=None, hasta=None, procesos=None):
+        """Totales de ventas por tipo, cliente, producto y dia en [desde, hasta), leyendo todo el historial.
+        Con el libro por meses cada mes se analiza en un proceso aparte"""
+        return self.libro_ventas.analizar(desde, hasta, procesos)
+    
+    def iterar_historial_ventas(self):
+        """Recorre el historial de ventas sin cargarlo completo en memoria"""
+        return self.libro_ventas.iterar()
+    
+    def confirmar_ventas(self, timeout=None):
+        """Espera a que todas las ventas registradas hasta ahora esten escritas en el libro"""
+        return self.libro_ventas.flush(timeout)
+    
+    def cerrar(self):
+        self.libro_ventas.cerrar()
         
+    def _estado_cliente(self, cliente):
+        """Lo que los indices necesitan recordar de un cliente antes de modificarlo"""
+        return (cliente.activo, cliente.deuda_renovacion)
+    
+    def _cliente_actualizado(self, cliente, antes, indexar_deuda=True):
+        with self._lock_agregados:
+            self._estadisticas.actualizar_cliente(cliente, antes[0])
+            self._indice_clientes.actualizar(cliente, antes, indexar_deuda)
+            self._clientes_modificados.add(cliente.id_cliente)
+    
+    def _stock_actualizado(self, producto, stock_antes):
+        """Observador de cada producto: se llama desde Producto con el lock del producto tomado"""
+        with self._lock_agregados:
+            nuevo_bajo = self._estadisticas.actualizar_stock(producto, stock_antes)
+            self._productos_modificados.add(producto.id_producto)
+            if not nuevo_bajo:
+                return
+            alerta = {
+                "fecha": datetime.now().isoformat(),
+                "id_producto": producto.id_producto,
+                "nombre": producto.nombre,
+                "stock": producto.stock,
+                "umbral_stock": producto.umbral_stock,
+                "dias_hasta_agotar": producto.dias_hasta_agotar()
+            }
+            self._alertas_stock.append(alerta)
+            oyentes = list(self._oyentes_stock)
+        for oyente in oyentes:
+            oyente(alerta)
+    
+    def al_bajar_stock(self, funcion):
+        """Registra una funcion(alerta) que se llama cuando un producto queda por debajo de su umbral"""
+        with self._lock_agregados:
+            self._oyentes_stock.append(funcion)
+    
+    def tomar_alertas_stock(self):
+        """Devuelve las alertas de stock bajo desde la ultima llamada"""
+        with self._lock_agregados:
+            alertas = self._alertas_stock
+            self._alertas_stock = []
+        return alertas
+    
+    def tomar_cambios(self):
+        """Devuelve los clientes, productos y reservas modificados desde la ultima llamada"""
+        with self._lock_agregados:
+            cambios = {
+                "clientes": [self.clientes[id_cliente] for id_cliente in self._clientes_modificados],
+                "productos": [self.productos[id_producto] for id_producto in self._productos_modificados],
+                "reservas": self._reservas_nuevas
+            }
+            self._clientes_modificados = set()
+            self._productos_modificados = set()
+            self._reservas_nuevas = []
+        return cambios
+    
+    def devolver_cambios(self, cambios):
+        """Vuelve a marcar como pendientes los cambios de un guardado que fallo"""
+        with self._lock_agregados:
+            self._clientes_modificados.update(cliente.id_cliente for cliente in cambios["clientes"])
+            self._productos_modificados.update(producto.id_producto for producto in cambios["productos"])
+            self._reservas_nuevas[:0] = cambios["reservas"]
+    
+    def foto(self):
+        """Clientes, productos y salas actuales y el proximo id de reserva, tomados juntos"""
+        with self._lock_agregados:
+            return (list(self.clientes.values()), list(self.productos.values()), list(self.salas.values()),
+                    self.prox_id_reserva)
+    
     def agregar_cliente(self, cliente):
-        if cliente.id_cliente in self.clientes:
-            raise ClienteInhabilitadoError("Cliente ya existe")
-        self.clientes[cliente.id_cliente] = cliente
+        with self._lock_agregados:
+            if cliente.id_cliente in self.clientes:
+                raise ClienteInhabilitadoError("Cliente ya existe")
+            self.clientes[cliente.id_cliente] = cliente
+            self._estadisticas.agregar_cliente(cliente)
+            self._indice_clientes.agregar(cliente)
+            self._clientes_modificados.add(cliente.id_cliente)
+    
+    def agregar_clientes(self, clientes):
+        """Agrega muchos clientes juntos (al cargar): el indice de deudas se arma una sola vez al final"""
+        with self._lock_agregados:
+            try:
+                for cliente in clientes:
+                    if cliente.id_cliente in self.clientes:
+                        raise ClienteInhabilitadoError(f"Cliente {cliente.id_cliente} ya existe")
+                    self.clientes[cliente.id_cliente] = cliente
+                    self._estadisticas.agregar_cliente(cliente)
+                    self._indice_clientes.agregar(cliente, deuda=False)
+                    self._clientes_modificados.add(cliente.id_cliente)
+            finally:
+                self._indice_clientes.reindexar_deudas(list(self.clientes.values()))
     
     def agregar_sala(self, sala):
-        if sala.id_sala in self.salas:
-            print(f"Sala {sala.id_sala} ya existe, omitiendo")
-            return
-        self.salas[sala.id_sala] = sala
+        with self._lock_agregados:
+            if sala.id_sala in self.salas:
+                print(f"Sala {sala.id_sala} ya existe, omitiendo")
+                return
+            self.salas[sala.id_sala] = sala
+            insort(self._salas_por_capacidad, (sala.capacidad, sala.id_sala))
     
     def agregar_producto(self, producto):
-        if producto.id_producto in self.productos:
-            print(f"Producto {producto.id_producto} ya existe, omitiendo")
-            return
-        self.productos[producto.id_producto] = producto
+        with self._lock_agregados:
+            if producto.id_producto in self.productos:
+                print(f"Producto {producto.id_producto} ya existe, omitiendo")
+                return
+            self.productos[producto.id_producto] = producto
+            producto.observador = self._stock_actualizado
+            self._estadisticas.agregar_producto(producto)
+            self._productos_modificados.add(producto.id_producto)
     
     def buscar_cliente(self, id_cliente):
         return self.clientes.get(id_cliente)
     
+    def buscar_cliente_reserva(self, id_cliente):
+        """Cliente de una reserva guardada: de este coworking o, en una red de sedes, visitante de otra"""
+        cliente = self.clientes.get(id_cliente)
+        if cliente is None and self.buscar_visitante is not None:
+            cliente = self.buscar_visitante(id_cliente)
+        return cliente
+    
+    def _cliente_modificado(self, cliente):
+        with self._lock_agregados:
+            self._clientes_modificados.add(cliente.id_cliente)
+    
+    def buscar_clientes_por_correo(self, correo):
+        with self._lock_agregados:
+            return [self.clientes[id_cliente] for id_cliente in self._indice_clientes.por_correo.get(correo, ())]
+    
+    def clientes_por_membresia(self, tipo):
+        with self._lock_agregados:
+            return [self.clientes[id_cliente] for id_cliente in self._indice_clientes.por_tipo.get(tipo, ())]
+    
+    def contar_por_membresia(self):
+        with self._lock_agregados:
+            return {tipo: len(ids) for tipo, ids in self._indice_clientes.por_tipo.items()}
+    
+    def clientes_activos(self):
+        with self._lock_agregados:
+            return [self.clientes[id_cliente] for id_cliente in self._indice_clientes.activos]
+    
+    def mayores_deudores(self, cantidad=10):
+        """Los clientes con mas deuda de renovacion, de mayor a menor"""
+        with self._lock_agregados:
+            return [self.clientes[id_cliente] for id_cliente in self._indice_clientes.mayores_deudores(cantidad)]
+    
+    def clientes_cerca_del_limite(self, fraccion=0.8):
+        """Clientes cuya deuda alcanza al menos esa fraccion de su limite_deuda, de mayor a menor deuda"""
+        with self._lock_agregados:
+            cercanos = self._indice_clientes.cerca_del_limite(fraccion)
+            return [self.clientes[id_cliente] for _, id_cliente in cercanos]
+    
     def buscar_sala(self, id_sala):
         return self.salas.get(id_sala)
     
     def buscar_producto(self, id_producto):
         return self.productos.get(id_producto)
     
-    def reservar_sala(self, id_cliente, id_sala, fecha_hora, duracion_horas=1):
-        cliente = self.buscar_cliente(id_cliente)
+    def reservar_sala(self, id_cliente, id_sala, fecha_hora, duracion_horas=1, origen=None):
+        """origen: coworking dueno del cliente si es de otra sede (la entrada se descuenta alli)"""
+        origen = origen or self
+        cliente = origen.buscar_cliente(id_cliente)
         if not cliente:
             raise ClienteInhabilitadoError("Cliente no encontrado")
+        # Antes de usar la entrada: una duracion no positiva romperia el orden de inicio y fin del indice de la sala
+        if duracion_horas <= 0:
+            raise ValueError("Duracion invalida")
         
-        puede, mensaje = cliente.usar_entrada()
-        if not puede:
-            raise ClienteInhabilitadoError(mensaje)
+        with cliente._lock:
+            antes = origen._estado_cliente(cliente)
+            puede, mensaje = cliente.usar_entrada()
+            origen._cliente_actualizado(cliente, antes)
+            if not puede:
+                raise ClienteInhabilitadoError(mensaje)
+            
+            sala = self.buscar_sala(id_sala)
+            if not sala:
+                raise SalaOcupadaError("Sala no encontrada")
+            
+            # Comprobar y agregar bajo el mismo bloqueo de la sala evita reservas dobles
+            with sala._lock:
+                if not sala.esta_disponible(fecha_hora, duracion_horas):
+                    raise SalaOcupadaError("Sala no disponible")
+                
+                with self._lock_agregados:
+                    id_reserva = f"R{self.prox_id_reserva}"
+                    self.prox_id_reserva += 1
+                reserva = Reserva(id_reserva, cliente, sala, fecha_hora, duracion_horas)
+                sala.agregar_reserva(reserva)
+            
+            cliente.reservas.append(reserva)
+            with self._lock_agregados:
+                self.reservas[reserva.id_reserva] = reserva
+                self._reservas_nuevas.append(reserva)
         
-        sala = self.buscar_sala(id_sala)
-        if not sala:
-            raise SalaOcupadaError("Sala no encontrada")
+        return reserva
+    
+    def reservar_salas(self, id_cliente, solicitudes, origen=None):
+        """Reserva en bloque [(id_sala, inicio, duracion_horas), ...]: se hacen todas o ninguna.
+        Cada reserva usa una entrada del cliente. Si alguna choca con otra reserva (existente o del mismo
+        lote) se lanza ReservaEnBloqueError con la lista completa de conflictos"""
+        origen = origen or self
+        cliente = origen.buscar_cliente(id_cliente)
+        if not cliente:
+            raise ClienteInhabilitadoError("Cliente no encontrado")
+        if not solicitudes:
+            raise ValueError("No hay reservas en el lote")
         
-        if not sala.esta_disponible(fecha_hora, duracion_horas):
-            raise SalaOcupadaError("Sala no disponible")
+        conflictos = []
+        por_sala = {}
+        for indice, (id_sala, inicio, duracion_horas) in enumerate(solicitudes):
+            if not self.buscar_sala(id_sala):
+                conflictos.append((indice, "Sala no encontrada"))
+            elif duracion_horas <= 0:
+                conflictos.append((indice, "Duracion invalida"))
+            else:
+                por_sala.setdefault(id_sala, []).append((inicio, inicio + timedelta(hours=duracion_horas), indice))
         
-        reserva = Reserva(f"R{self.prox_id_reserva}", cliente, sala, fecha_hora, duracion_horas)
+        with ExitStack() as bloqueos:
+            # Las salas se bloquean siempre en el mismo orden para no caer en un deadlock
+            bloqueos.enter_context(cliente._lock)
+            for id_sala in sorted(por_sala):
+                bloqueos.enter_context(self.salas[id_sala]._lock)
+            
+            for id_sala, nuevas in por_sala.items():
+                conflictos.extend(self.salas[id_sala].buscar_conflictos(nuevas))
+            if conflictos:
+                conflictos.sort()
+                raise ReservaEnBloqueError([
+                    {"indice": indice, "id_sala": solicitudes[indice][0], "inicio": solicitudes[indice][1],
+                     "motivo": motivo}
+                    for indice, motivo in conflictos
+                ])
+            
+            antes = origen._estado_cliente(cliente)
+            puede, mensaje = cliente.puede_entrar()
+            disponibles = cliente.membresia.entradas_mes - cliente.entradas_usadas
+            if puede and len(solicitudes) > disponibles:
+                puede, mensaje = False, f"Limite de entradas alcanzado: el lote necesita {len(solicitudes)} y quedan {disponibles}"
+            if puede:
+                cliente.entradas_usadas += len(solicitudes)
+                cliente.fecha_ultimo_uso = datetime.now()
+            origen._cliente_actualizado(cliente, antes)
+            if not puede:
+                raise ClienteInhabilitadoError(mensaje)
+            
+            with self._lock_agregados:
+                primero = self.prox_id_reserva
+                self.prox_id_reserva += len(solicitudes)
+            reservas = [
+                Reserva(f"R{primero + indice}", cliente, self.salas[id_sala], inicio, duracion_horas)
+                for indice, (id_sala, inicio, duracion_horas) in enumerate(solicitudes)
+            ]
+            reservas_por_sala = {}
+            for reserva in reservas:
+                reservas_por_sala.setdefault(reserva.sala.id_sala, []).append(reserva)
+            for id_sala, reservas_sala in reservas_por_sala.items():
+                self.salas[id_sala].agregar_reservas(reservas_sala)
+            
+            cliente.reservas.extend(reservas)
+            with self._lock_agregados:
+                for reserva in reservas:
+                    self.reservas[reserva.id_reserva] = reserva
+                self._reservas_nuevas.extend(reservas)
         
-        self.reservas[reserva.id_reserva] = reserva
-        cliente.reservas.append(reserva)
-        sala.reservas.append(reserva)
-        self.prox_id_reserva += 1
+        return reservas
+    
+    def reservar_recurrente(self, id_cliente, ids_salas, inicio, duracion_horas, hasta, cada_dias=7, origen=None):
+        """Reserva las salas en inicio y cada 'cada_dias' dias hasta 'hasta' (excluido), todo o nada.
+        Por ejemplo, todos los martes de 9 a 11 durante seis meses"""
+        solicitudes = [(id_sala, fecha, duracion_horas)
+                       for fecha in fechas_recurrentes(inicio, hasta, cada_dias) for id_sala in ids_salas]
+        return self.reservar_salas(id_cliente, solicitudes, origen)
+    
+    def sugerir_salas(self, personas, inicio, duracion_horas=1, flexibilidad_horas=0, cantidad=3, no_antes_de=None):
+        """Opciones para un grupo, de mejor a peor: la sala mas chica en la que entra y que esta libre en el
+        horario pedido o, si no hay, los horarios libres mas cercanos dentro de +- flexibilidad_horas
+        (sin empezar antes de no_antes_de). Cada opcion es {"sala", "inicio", "fin", "desplazamiento_minutos"}"""
+        with self._lock_agregados:
+            candidatas = [self.salas[id_sala] for _, id_sala in
+                          self._salas_por_capacidad[bisect_left(self._salas_por_capacidad, (personas,)):]]
+        duracion = timedelta(hours=duracion_horas)
         
-        return reserva
+        # Horario exacto: la primera libre en orden de capacidad es la que mejor se ajusta
+        for sala in candidatas:
+            if sala.esta_disponible(inicio, duracion_horas):
+                return [{"sala": sala, "inicio": inicio, "fin": inicio + duracion, "desplazamiento_minutos": 0}]
+        
+        if flexibilidad_horas <= 0:
+            return []
+        margen = timedelta(hours=flexibilidad_horas)
+        opciones = []
+        for sala in candidatas:
+            # El indice de reservas de la sala da el hueco libre mas cercano hacia cada lado
+            for alternativa in (sala.anterior_horario_libre(inicio, duracion_horas),
+                                sala.proximo_horario_libre(inicio, duracion_horas)):
+                if abs(alternativa - inicio) <= margen and (no_antes_de is None or alternativa >= no_antes_de):
+                    opciones.append((abs(alternativa - inicio), sala.capacidad, alternativa, sala))
+        opciones.sort(key=lambda opcion: opcion[:3])
+        return [{"sala": sala, "inicio": alternativa, "fin": alternativa + duracion,
+                 "desplazamiento_minutos": round((alternativa - inicio).total_seconds() / 60)}
+                for _, _, alternativa, sala in opciones[:cantidad]]
     
-    def comprar_producto(self, id_cliente, id_producto, cantidad=1):
-        cliente = self.buscar_cliente(id_cliente)
+    #Consultas sobre la grilla de ocupacion (franjas de 15 minutos: una reserva ocupa toda franja que toca)
+    
+    def salas_libres(self, dias, hora_inicio, hora_fin, capacidad_minima=0):
+        """Salas libres de hora_inicio a hora_fin (datetime.time) en todos los dias indicados,
+        por ejemplo los dias habiles de la semana que viene"""
+        mascara = mascara_horario(hora_inicio, hora_fin)
+        dias = list(dias)
+        libres = []
+        for sala in self.salas.values():
+            if sala.capacidad < capacidad_minima:
+                continue
+            with sala._lock:
+                if sala.ocupacion.libre(dias, mascara):
+                    libres.append(sala)
+        return libres
+    
+    def utilizacion_salas(self, desde, hasta, hora_inicio=None, hora_fin=None):
+        """Porcentaje de franjas ocupadas de cada sala entre las fechas desde y hasta (excluida),
+        contando solo el horario indicado (por defecto el dia completo)"""
+        mascara = mascara_horario(hora_inicio, hora_fin)
+        total = contar_bits(mascara) * max(0, (hasta - desde).days)
+        utilizacion = {}
+        for sala in self.salas.values():
+            with sala._lock:
+                ocupadas = sala.ocupacion.franjas_ocupadas(desde, hasta, mascara)
+            utilizacion[sala.id_sala] = round(100 * ocupadas / total, 2) if total else 0
+        return utilizacion
+    
+    def mapa_calor_ocupacion(self, desde, hasta, ids_salas=None):
+        """Porcentaje de ocupacion por dia de la semana (0 = lunes) y hora, sumando las salas indicadas"""
+        salas = [self.salas[id_sala] for id_sala in ids_salas] if ids_salas else list(self.salas.values())
+        tabla = [[0] * 24 for _ in range(7)]
+        for sala in salas:
+            with sala._lock:
+                sala.ocupacion.sumar_por_hora(desde, hasta, tabla)
+        dias_semana = [0] * 7
+        for dia in dias_entre(desde, hasta):
+            dias_semana[dia.weekday()] += 1
+        return [[round(100 * ocupadas / (dias_semana[dia] * len(salas) * FRANJAS_HORA), 1)
+                 if dias_semana[dia] and salas else 0 for ocupadas in fila]
+                for dia, fila in enumerate(tabla)]
+    
+    def horarios_libres_comunes(self, ids_salas, dia, duracion_horas=1, hora_inicio=None, hora_fin=None):
+        """Tramos (inicio, fin) del dia en que todas las salas estan libres durante al menos duracion_horas"""
+        ocupado = ~mascara_horario(hora_inicio, hora_fin) & DIA_COMPLETO
+        for id_sala in ids_salas:
+            sala = self.buscar_sala(id_sala)
+            if not sala:
+                raise SalaOcupadaError(f"Sala {id_sala} no encontrada")
+            with sala._lock:
+                ocupado |= sala.ocupacion.mascara(dia)
+        franjas = -int(-duracion_horas * FRANJAS_HORA // 1)
+        medianoche = datetime.combine(dia, datetime.min.time())
+        return [(medianoche + timedelta(minutes=primera * MINUTOS_FRANJA),
+                 medianoche + timedelta(minutes=(primera + largo) * MINUTOS_FRANJA))
+                for primera, largo in huecos(ocupado, max(1, franjas))]
+    
+    def proximo_horario_libre(self, id_sala, desde, duracion_horas=1):
+        sala = self.buscar_sala(id_sala)
+        if not sala:
+            raise SalaOcupadaError("Sala no encontrada")
+        return sala.proximo_horario_libre(desde, duracion_horas)
+    
+    def comprar_producto(self, id_cliente, id_producto, cantidad=1, origen=None):
+        """origen: coworking dueno del cliente si es de otra sede (la compra queda en su historial).
+        Es un carrito de una linea: si la venta no se registra no se modifica nada"""
+        return self.comprar_productos(id_cliente, [(id_producto, cantidad)], origen)[0]
+    
+    def comprar_productos(self, id_cliente, items, origen=None):
+        """Compra varios productos [(id_producto, cantidad), ...] en una sola transaccion.
+        Si alguna linea falla no se modifica nada"""
+        origen = origen or self
+        cliente = origen.buscar_cliente(id_cliente)
         if not cliente:
             raise ClienteInhabilitadoError("Cliente no encontrado")
         
-        producto = self.buscar_producto(id_producto)
-        if not producto:
-            raise ProductoAgotadoError("Producto no encontrado")
+        if not items:
+            raise ValueError("El carrito esta vacio")
         
-        compra = cliente.comprar_producto(producto, cantidad)
+        # Validar todas las lineas antes de tocar el stock
+        lineas = []
+        cantidades = {}
+        for id_producto, cantidad in items:
+            producto = self.buscar_producto(id_producto)
+            if not producto:
+                raise ProductoAgotadoError(f"Producto {id_producto} no encontrado")
+            cantidad = cantidad_entera(cantidad, producto.nombre)
+            cantidades[id_producto] = cantidades.get(id_producto, 0) + cantidad
+            lineas.append((producto, cantidad))
         
-        # Registrar en historial de ventas del negocio
-        self._registrar_venta(
-            tipo_venta="producto",
-            cliente_id=id_cliente,
-            descripcion=f"{producto.nombre} x{cantidad}",
-            monto=compra['total']
-        )
+        with ExitStack() as bloqueos:
+            # Los productos se bloquean siempre en el mismo orden para no caer en un deadlock
+            bloqueos.enter_context(cliente._lock)
+            for id_producto in sorted(cantidades):
+                bloqueos.enter_context(self.productos[id_producto]._lock)
+            
+            for id_producto, cantidad in cantidades.items():
+                producto = self.productos[id_producto]
+                if producto.stock < cantidad:
+                    raise ProductoAgotadoError(f"Producto {producto.nombre} agotado o stock insuficiente")
+            
+            compras = [cliente.preparar_compra(producto, cantidad) for producto, cantidad in lineas]
+            ventas = [
+                self._crear_venta("producto", id_cliente, f"{producto.nombre} x{cantidad}", compra['total'],
+                                  producto_id=producto.id_producto, cantidad=cantidad)
+                for (producto, cantidad), compra in zip(lineas, compras)
+            ]
+            
+            stock_antes = {id_producto: self.productos[id_producto].stock for id_producto in cantidades}
+            for id_producto, cantidad in cantidades.items():
+                self.productos[id_producto].reducir_stock(cantidad)
+            
+            try:
+                self._registrar_ventas(ventas)
+            except Exception:
+                # Sin registro en el libro no hay venta: se devuelve el stock reservado
+                for id_producto, stock in stock_antes.items():
+                    self.productos[id_producto].ajustar_stock(stock)
+                raise
+            
+            cliente.compras.extend(compras)
+            origen._cliente_modificado(cliente)
+            for id_producto, cantidad in cantidades.items():
+                self.productos[id_producto].registrar_demanda(cantidad)
         
-        return compra
+        return compras
     
     def reponer_stock(self, id_producto, cantidad):
         producto = self.buscar_producto(id_producto)
         if not producto:
             raise ProductoAgotadoError("Producto no encontrado")
         
-        producto.reponer_stock(cantidad)
+        producto.reponer_stock(cantidad_entera(cantidad, producto.nombre))
         return f"Stock de {producto.nombre} repuesto: {producto.stock} unidades"
     
+    def definir_umbral_stock(self, id_producto, umbral):
+        producto = self.buscar_producto(id_producto)
+        if not producto:
+            raise ProductoAgotadoError("Producto no encontrado")
+        if umbral < 0:
+            raise ValueError("El umbral de stock no puede ser negativo")
+        
+        with producto._lock:
+            producto.umbral_stock = umbral
+            # Sin cambio de stock: solo se revisa si entra o sale del conjunto de stock bajo
+            self._stock_actualizado(producto, producto.stock)
+        return f"Umbral de stock de {producto.nombre}: {umbral} unidades"
+    
+    def pronostico_stock(self, plazo_reposicion_dias=3, dias_cobertura=14):
+        """Ritmo de venta, dias hasta agotar y cantidad sugerida a reponer de cada producto.
+        Se repone cuando el stock no alcanza para el plazo de reposicion mas el umbral, pidiendo
+        lo necesario para cubrir plazo + dias_cobertura sin bajar del umbral"""
+        momento = time.time()
+        pronostico = []
+        for producto in list(self.productos.values()):
+            with producto._lock:
+                velocidad = producto.velocidad_venta(momento)
+                stock = producto.stock
+                umbral = producto.umbral_stock
+            punto_pedido = velocidad * plazo_reposicion_dias + umbral
+            reponer = 0
+            if stock <= punto_pedido:
+                reponer = max(math.ceil(velocidad * (plazo_reposicion_dias + dias_cobertura) + umbral - stock), 0)
+            pronostico.append({
+                "id_producto": producto.id_producto,
+                "nombre": producto.nombre,
+                "stock": stock,
+                "umbral_stock": umbral,
+                "velocidad_diaria": round(velocidad, 3),
+                "dias_hasta_agotar": round(stock / velocidad, 1) if velocidad > 0 else None,
+                "reponer": reponer
+            })
+        # Primero lo que se agota antes
+        pronostico.sort(key=lambda p: (p["dias_hasta_agotar"] is None, p["dias_hasta_agotar"] or 0))
+        return pronostico
+    
     def renovar_membresias_automatico(self):
+        resumen = self.renovar_membresias_lote()
+        return [f"{r['nombre']}: {r['mensaje']}" for r in resumen["resultados"]]
+    
+    def renovar_membresias_lote(self):
+        """Renueva todas las membresias activas en una sola pasada.
+        Las ventas de las renovaciones se escriben en el libro con una sola escritura"""
+        inicio = time.perf_counter()
         resultados = []
-        for cliente in self.clientes.values():
-            if cliente.activo:
-                resultado = cliente.renovar_membresia()
-                
-                # Registrar en historial de ventas si se renovo
-                if "Renovacion registrada" in resultado:
-                    self._registrar_venta(
-                        tipo_venta="membresia",
-                        cliente_id=cliente.id_cliente,
-                        descripcion=f"Renovacion {cliente.membresia.tipo}",
-                        monto=cliente.membresia.precio
-                    )
-                
-                resultados.append(f"{cliente.nombre}: {resultado}")
-        return resultados
+        ventas = []
+        # (cliente, monto sumado a la deuda, si quedo suspendido) para deshacer la pasada si falla el libro
+        cargos = []
+        suspendidos = 0
+        
+        with self._lock_agregados:
+            clientes = list(self.clientes.values())
+        
+        for cliente in clientes:
+            with cliente._lock:
+                if not cliente.activo:
+                    continue
+                antes = self._estado_cliente(cliente)
+                resultado = cliente.aplicar_renovacion()
+                # Las deudas se reindexan todas juntas al final de la pasada
+                self._cliente_actualizado(cliente, antes, indexar_deuda=False)
+                cargos.append((cliente, cliente.membresia.precio, resultado["suspendido"]))
+            resultado["cliente_id"] = cliente.id_cliente
+            resultado["nombre"] = cliente.nombre
+            resultados.append(resultado)
+            
+            if resultado["renovado"]:
+                ventas.append(self._crear_venta(
+                    "membresia",
+                    cliente.id_cliente,
+                    f"Renovacion {cliente.membresia.tipo}",
+                    cliente.membresia.precio
+                ))
+            else:
+                suspendidos += 1
+        
+        if resultados:
+            with self._lock_agregados:
+                self._indice_clientes.reindexar_deudas(list(self.clientes.values()))
+        
+        if ventas:
+            try:
+                self._registrar_ventas(ventas)
+            except Exception:
+                # Sin las ventas en el libro no hay renovacion: se descuenta el cargo y se levanta la suspension.
+                # Se resta el cargo (no se vuelve al valor anterior) para no pisar pagos hechos mientras tanto
+                for cliente, cargo, suspendido in cargos:
+                    with cliente._lock:
+                        antes = self._estado_cliente(cliente)
+                        cliente.deuda_renovacion -= cargo
+                        if suspendido and cliente.deuda_renovacion < cliente.membresia.limite_deuda:
+                            cliente.activo = True
+                        self._cliente_actualizado(cliente, antes)
+                raise
+        
+        segundos = time.perf_counter() - inicio
+        return {
+            "resultados": resultados,
+            "procesados": len(resultados),
+            "renovados": len(ventas),
+            "suspendidos": suspendidos,
+            "segundos": segundos,
+            "clientes_por_segundo": len(resultados) / segundos if segundos > 0 else 0
+        }
     
     def cancelar_membresia(self, id_cliente):
         cliente = self.buscar_cliente(id_cliente)
         if not cliente:
             raise ClienteInhabilitadoError("Cliente no encontrado")
         
-        resultado = cliente.cancelar_membresia()
+        with cliente._lock:
+            antes = self._estado_cliente(cliente)
+            resultado = cliente.cancelar_membresia()
+            self._cliente_actualizado(cliente, antes)
         
         # Registrar en historial de ventas
         self._registrar_venta(
@@ -403,7 +1424,10 @@ class Coworking:
         if not cliente:
             raise PagoRechazadoError("Cliente no encontrado")
         
-        resultado = cliente.pagar_renovacion(monto)
+        with cliente._lock:
+            antes = self._estado_cliente(cliente)
+            resultado = cliente.pagar_renovacion(monto)
+            self._cliente_actualizado(cliente, antes)
         
         # Registrar en historial de ventas
         self._registrar_venta(
@@ -415,7 +1439,43 @@ class Coworking:
         
         return resultado
     
-    def obtener_estadisticas(self):
+    def obtener_estadisticas(self, desde=None, hasta=None, recalcular=False):
+        """Devuelve las estadisticas acumuladas. Con desde/hasta (fechas, hasta excluida) las ventas
+        se limitan a ese rango combinando los acumulados por dia y mes.
+        Con recalcular=True se recorren todos los datos"""
+        if recalcular:
+            return self._calcular_estadisticas(desde, hasta)
+        with self._lock_agregados:
+            stats = self._estadisticas.como_diccionario(len(self.reservas))
+            rango = None
+            if desde is not None or hasta is not None:
+                rango = self._resumen_ventas.consultar(desde, hasta)
+        if rango is not None:
+            stats["ventas_totales"] = rango["total"]
+            stats["ventas_por_tipo"] = rango["por_tipo"]
+            stats["ventas_por_cliente"] = rango["por_cliente"]
+            stats["cantidad_ventas"] = rango["cantidad"]
+        return stats
+    
+    def verificar_estadisticas(self, desde=None, hasta=None):
+        """Compara las estadisticas acumuladas con un recalculo completo y devuelve las diferencias"""
+        acumuladas = self.obtener_estadisticas(desde, hasta)
+        recalculadas = self._calcular_estadisticas(desde, hasta)
+        diferencias = {}
+        for clave, valor in recalculadas.items():
+            acumulado = acumuladas[clave]
+            if isinstance(valor, list):
+                iguales = sorted(valor) == sorted(acumulado)
+            elif isinstance(valor, dict):
+                iguales = valor.keys() == acumulado.keys() and all(
+                    abs(valor[k] - acumulado[k]) < 1e-6 for k in valor)
+            else:
+                iguales = abs(valor - acumulado) < 1e-6
+            if not iguales:
+                diferencias[clave] = (acumulado, valor)
+        return diferencias
+    
+    def _calcular_estadisticas(self, desde=None, hasta=None):
         stats = {
             "total_clientes": len(self.clientes),
             "clientes_activos": sum(1 for c in self.clientes.values() if c.activo),
@@ -433,19 +1493,37 @@ class Coworking:
         
         for producto in self.productos.values():
             stats["valor_inventario"] += producto.precio * producto.stock
-            if producto.stock < 10:
+            if producto.bajo_stock():
                 stats["productos_bajo_stock"].append(producto.nombre)
         
         # Estadísticas de ventas
-        historial_ventas = self.obtener_historial_ventas()
-        for venta in historial_ventas:
-            stats["ventas_totales"] += venta["monto"]
-            tipo = venta["tipo"]
-            stats["ventas_por_tipo"][tipo] = stats["ventas_por_tipo"].get(tipo, 0) + venta["monto"]
+        analisis = self.analizar_ventas(
+            desde=str(desde)[:10] if desde is not None else None,
+            hasta=str(hasta)[:10] if hasta is not None else None
+        )
+        stats["ventas_totales"] = analisis["total"]
+        stats["ventas_por_tipo"] = analisis["por_tipo"]
+        if desde is not None or hasta is not None:
+            stats["ventas_por_cliente"] = analisis["por_cliente"]
+            stats["cantidad_ventas"] = analisis["cantidad"]
         
         return stats
+    
+    def obtener_metricas(self):
+        """Llamadas y latencias por operacion, bytes leidos/escritos y tamano del libro de ventas"""
+        metricas = METRICAS.como_diccionario()
+        with self._lock_agregados:
+            cantidad = sum(cubeta["cantidad"] for cubeta in self._resumen_ventas.meses.values())
+        metricas["libro_ventas"] = {"ventas": cantidad, "bytes": self.libro_ventas.tamano_bytes()}
+        return metricas
+    
     def __len__(self):
         return len(self.clientes)
     
     def __iter__(self):
-        return iter(self.clientes.values())
\ No newline at end of file
+        return iter(self.clientes.values())
+
+
+# Cada metodo publico de Coworking queda medido (ver Coworking.obtener_metricas).
+# Las busquedas por id son un acceso a diccionario: medirlas costaria mas que ejecutarlas
+instrumentar_clase(Coworking, excluir=("buscar_cliente", "buscar_cliente_reserva", "buscar_sala", "buscar_producto"))
@@ -0,0 +1,100 @@
+from datetime import datetime, time, timedelta
+
+#Grilla de ocupacion de una sala: por cada dia un entero de 96 bits, un bit por franja de 15 minutos.
+#Las consultas (salas libres, porcentaje de uso, mapa de calor, huecos comunes) se resuelven con
+#operaciones de bits sobre esos enteros en lugar de recorrer las reservas
+
+MINUTOS_FRANJA = 15
+FRANJAS_DIA = 24 * 60 // MINUTOS_FRANJA
+FRANJAS_HORA = 60 // MINUTOS_FRANJA
+DIA_COMPLETO = (1 << FRANJAS_DIA) - 1
+UN_DIA = timedelta(days=1)
+
+
+def contar_bits(mascara):
+    return bin(mascara).count("1")
+
+
+def _franja(desde_medianoche, redondear_arriba=False):
+    minutos = desde_medianoche.total_seconds() / 60
+    franja = int(minutos // MINUTOS_FRANJA)
+    if redondear_arriba and franja * MINUTOS_FRANJA < minutos:
+        franja += 1
+    return franja
+
+
+def mascara_horario(hora_inicio=None, hora_fin=None):
+    """Bits de las franjas entre dos horas del dia (datetime.time); sin horas, el dia completo"""
+    inicio = _franja(datetime.combine(datetime.min, hora_inicio or time()) - datetime.min)
+    fin = FRANJAS_DIA if hora_fin is None else _franja(
+        datetime.combine(datetime.min, hora_fin) - datetime.min, redondear_arriba=True)
+    if fin <= inicio:
+        return 0
+    return ((1 << (fin - inicio)) - 1) << inicio
+
+
+def dias_entre(desde, hasta):
+    """Fechas (date) de desde a hasta, hasta excluida"""
+    dia = desde
+    while dia < hasta:
+        yield dia
+        dia += UN_DIA
+
+
+def huecos(ocupado, franjas_minimas=1):
+    """(primera_franja, cantidad) de cada tramo libre de al menos franjas_minimas franjas"""
+    libre = ~ocupado & DIA_COMPLETO
+    resultado = []
+    while libre:
+        primera = (libre & -libre).bit_length() - 1
+        corrida = libre >> primera
+        # Cantidad de unos seguidos desde el bit mas bajo
+        largo = (~corrida & (corrida + 1)).bit_length() - 1
+        if largo >= franjas_minimas:
+            resultado.append((primera, largo))
+        libre &= ~(((1 << largo) - 1) << primera)
+    return resultado
+
+
+class GrillaOcupacion:
+    __slots__ = ("dias",)
+
+    def __init__(self):
+        self.dias = {}
+
+    def marcar(self, inicio, fin):
+        """Marca como ocupadas las franjas que toca [inicio, fin), repartiendo entre dias si cruza la medianoche"""
+        dia = inicio.date()
+        while True:
+            medianoche = datetime.combine(dia, time())
+            desde = max(inicio, medianoche) - medianoche
+            hasta = min(fin, medianoche + UN_DIA) - medianoche
+            primera = _franja(desde)
+            ultima = _franja(hasta, redondear_arriba=True)
+            if ultima > primera:
+                self.dias[dia] = self.dias.get(dia, 0) | (((1 << (ultima - primera)) - 1) << primera)
+            if fin <= medianoche + UN_DIA:
+                break
+            dia += UN_DIA
+
+    def mascara(self, dia):
+        return self.dias.get(dia, 0)
+
+    def libre(self, dias, mascara):
+        """True si todas las franjas de la mascara estan libres en cada uno de los dias"""
+        return not any(self.dias.get(dia, 0) & mascara for dia in dias)
+
+    def franjas_ocupadas(self, desde, hasta, mascara=DIA_COMPLETO):
+        return sum(contar_bits(self.dias.get(dia, 0) & mascara) for dia in dias_entre(desde, hasta))
+
+    def sumar_por_hora(self, desde, hasta, tabla):
+        """Suma a tabla[dia_semana][hora] las franjas ocupadas de cada hora entre desde y hasta"""
+        for dia in dias_entre(desde, hasta):
+            mascara = self.dias.get(dia, 0)
+            if not mascara:
+                continue
+            fila = tabla[dia.weekday()]
+            for hora in range(24):
+                bits = (mascara >> (hora * FRANJAS_HORA)) & ((1 << FRANJAS_HORA) - 1)
+                if bits:
+                    fila[hora] += contar_bits(bits)
@@ -1,62 +1,241 @@
 import json
+import os
 from datetime import datetime
-from models import MembresiaBasica, MembresiaEstandar, MembresiaPremium, MembresiaEstudiante, Cliente, Producto
-
-def guardar_datos(coworking, archivo_clientes="datos/clientes.json", archivo_productos="datos/productos.json"):
-    datos_clientes = []
-    for cliente in coworking.clientes.values():
-        # Convertir datetime a string ISO
-        compras_serializables = []
-        for compra in cliente.compras:
-            compra_serializable = compra.copy()
-            compra_serializable['fecha'] = compra['fecha'].isoformat()  # Convertir fecha
-            compras_serializables.append(compra_serializable)
+from models import MembresiaBasica, MembresiaEstandar, MembresiaPremium, MembresiaEstudiante, Cliente, Producto, Sala, Reserva
+from metricas import METRICAS, instrumentar_funciones
+from ventas import LibroVentasPorMes
+
+# Tamano a partir del cual el registro de cambios se compacta en una foto completa
+LIMITE_REGISTRO_CAMBIOS = 1024 * 1024
+
+def _escribir_json_atomico(archivo, datos, fin="", **opciones_json):
+    """Escribe en un temporal sincronizado y lo renombra encima: un corte a mitad deja intacto el archivo anterior"""
+    temporal = archivo + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, **opciones_json)
+        f.write(fin)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, archivo)
+    METRICAS.sumar_archivo("escritos", archivo)
+
+def _serializar_compras(compras):
+    # Convertir datetime a string ISO
+    compras_serializables = []
+    for compra in compras:
+        compra_serializable = compra.copy()
+        compra_serializable['fecha'] = compra['fecha'].isoformat()  # Convertir fecha
+        compras_serializables.append(compra_serializable)
+    return compras_serializables
+
+def _serializar_cliente(cliente):
+    return {
+        'id_cliente': cliente.id_cliente,
+        'nombre': cliente.nombre,
+        'correo': cliente.correo,
+        'membresia_tipo': cliente.membresia.tipo,
+        'activo': cliente.activo,
+        'entradas_usadas': cliente.entradas_usadas,
+        'deuda_renovacion': cliente.deuda_renovacion,
+        'fecha_ultimo_uso': cliente.fecha_ultimo_uso.isoformat()  # Convertir fecha
+    }
+
+def _serializar_producto(producto):
+    return {
+        'id_producto': producto.id_producto,
+        'nombre': producto.nombre,
+        'precio': producto.precio,
+        'stock': producto.stock,
+        'umbral_stock': producto.umbral_stock,
+        'demanda': producto.demanda,
+        'ultima_demanda': producto.ultima_demanda
+    }
+
+def _serializar_reserva(reserva):
+    return [reserva.id_reserva, reserva.cliente.id_cliente, reserva.inicio.isoformat(), reserva.duracion_horas]
+
+def _foto_cliente(cliente, serializar=_serializar_cliente, desde=None):
+    """(datos, desde, compras, hasta) del cliente tomados bajo su lock: compras son las de [desde, hasta).
+    Las compras que lleguen mientras se guarda quedan para el proximo guardado; quien guarda
+    actualiza _compras_guardadas = hasta solo despues de escribir"""
+    with cliente._lock:
+        desde = cliente._compras_guardadas if desde is None else desde
+        hasta = len(cliente.compras)
+        return serializar(cliente), desde, cliente.compras[desde:hasta], hasta
+
+def _foto_producto(producto, serializar=_serializar_producto):
+    with producto._lock:
+        return serializar(producto)
+
+def _reservas_sala(sala):
+    with sala._lock:
+        return list(sala.reservas)
+
+def _generacion_registro(archivo_cambios):
+    """Generacion de la foto sobre la que se escribio el registro (0 si no hay registro o es de una version anterior)"""
+    try:
+        with open(archivo_cambios, 'r', encoding='utf-8') as f:
+            cambio = json.loads(f.readline())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0
+    return cambio['datos'] if cambio.get('tipo') == 'generacion' else 0
+
+def guardar_datos(coworking, archivo_clientes="datos/clientes.json", archivo_productos="datos/productos.json",
+                  archivo_reservas="datos/reservas.json", archivo_cambios="datos/cambios.jsonl"):
+    """Guarda una foto completa del sistema y empieza un registro de cambios nuevo.
+    Cada archivo de la foto lleva su generacion y el registro la de la foto sobre la que se escribe:
+    si el guardado se corta a mitad, al cargar no se reaplica el registro viejo sobre los archivos ya nuevos"""
+    generacion = _generacion_registro(archivo_cambios) + 1
+    # Hasta terminar, el registro no corresponde a la foto: si esto falla el proximo guardado es completo
+    coworking._foto_pendiente = True
+    # Lo que se modifique a partir de aqui queda marcado para el proximo guardado
+    cambios = coworking.tomar_cambios()
+    try:
+        clientes, productos, salas, prox_id_reserva = coworking.foto()
+        
+        datos_clientes = []
+        guardadas = []
+        for cliente in clientes:
+            datos, _, compras, hasta = _foto_cliente(cliente, desde=0)
+            datos['compras'] = _serializar_compras(compras)  # Usar la versión con fechas convertidas
+            datos_clientes.append(datos)
+            guardadas.append((cliente, hasta))
+        
+        _escribir_json_atomico(archivo_clientes, {'generacion': generacion, 'clientes': datos_clientes},
+                               indent=2, ensure_ascii=False)
         
-        datos_clientes.append({
-            'id_cliente': cliente.id_cliente,
-            'nombre': cliente.nombre,
-            'correo': cliente.correo,
-            'membresia_tipo': cliente.membresia.tipo,
-            'activo': cliente.activo,
-            'entradas_usadas': cliente.entradas_usadas,
-            'deuda_renovacion': cliente.deuda_renovacion,
-            'fecha_ultimo_uso': cliente.fecha_ultimo_uso.isoformat(),  # Convertir fecha
-            'compras': compras_serializables  # Usar la versión con fechas convertidas
+        datos_productos = [_foto_producto(producto) for producto in productos]
+        
+        _escribir_json_atomico(archivo_productos, {'generacion': generacion, 'productos': datos_productos},
+                               indent=2, ensure_ascii=False)
+        
+        _escribir_reservas(salas, prox_id_reserva, archivo_reservas, generacion)
+        
+        # Todo lo pendiente ya esta en la foto: el registro se reemplaza por uno vacio de la generacion nueva
+        _escribir_json_atomico(archivo_cambios, {'tipo': 'generacion', 'datos': generacion}, fin="\n")
+    except Exception:
+        coworking.devolver_cambios(cambios)
+        raise
+    for cliente, hasta in guardadas:
+        cliente._compras_guardadas = hasta
+    coworking._foto_pendiente = False
+
+def guardar_reservas(coworking, archivo_reservas="datos/reservas.json", archivo_cambios="datos/cambios.jsonl"):
+    """Guarda las reservas agrupadas por sala y en el orden del indice de cada sala.
+    Cada reserva es una fila compacta [id_reserva, id_cliente, inicio, duracion_horas].
+    Queda en la generacion del registro: reaplicar sus reservas no duplica nada"""
+    _, _, salas, prox_id_reserva = coworking.foto()
+    _escribir_reservas(salas, prox_id_reserva, archivo_reservas, _generacion_registro(archivo_cambios))
+
+def _escribir_reservas(salas, prox_id_reserva, archivo_reservas, generacion):
+    datos_salas = []
+    for sala in salas:
+        datos_salas.append({
+            'id_sala': sala.id_sala,
+            'nombre': sala.nombre,
+            'capacidad': sala.capacidad,
+            'reservas': [_serializar_reserva(reserva) for reserva in _reservas_sala(sala)]
         })
     
-    with open(archivo_clientes, 'w', encoding='utf-8') as f:
-        json.dump(datos_clientes, f, indent=2, ensure_ascii=False)
+    _escribir_json_atomico(archivo_reservas, {'generacion': generacion, 'prox_id_reserva': prox_id_reserva,
+                                              'salas': datos_salas},
+                           ensure_ascii=False, separators=(',', ':'))
+
+def guardar_cambios(coworking, archivo_cambios="datos/cambios.jsonl", limite=LIMITE_REGISTRO_CAMBIOS, **archivos):
+    """Agrega al registro de cambios solo lo modificado desde el ultimo guardado.
+    Cuando el registro supera el limite, no existe o la ultima foto quedo a medias se guarda una foto completa (guardar_datos)"""
+    if (coworking._foto_pendiente or not os.path.exists(archivo_cambios)
+            or os.path.getsize(archivo_cambios) > limite):
+        guardar_datos(coworking, archivo_cambios=archivo_cambios, **archivos)
+        return 0
     
-    datos_productos = []
-    for producto in coworking.productos.values():
-        datos_productos.append({
-            'id_producto': producto.id_producto,
-            'nombre': producto.nombre,
-            'precio': producto.precio,
-            'stock': producto.stock
+    cambios = coworking.tomar_cambios()
+    lineas = []
+    guardadas = []
+    for cliente in cambios['clientes']:
+        # Solo las compras nuevas; 'desde' hace que reaplicar la misma linea no las duplique
+        datos, desde, compras, hasta = _foto_cliente(cliente)
+        lineas.append({
+            'tipo': 'cliente',
+            'datos': datos,
+            'desde': desde,
+            'compras': _serializar_compras(compras)
         })
+        guardadas.append((cliente, hasta))
+    for producto in cambios['productos']:
+        lineas.append({'tipo': 'producto', 'datos': _foto_producto(producto)})
+    for reserva in cambios['reservas']:
+        lineas.append({'tipo': 'reserva', 'sala': reserva.sala.id_sala, 'datos': _serializar_reserva(reserva)})
     
-    with open(archivo_productos, 'w', encoding='utf-8') as f:
-        json.dump(datos_productos, f, indent=2, ensure_ascii=False)
-
-def cargar_datos(coworking, archivo_clientes="datos/clientes.json", archivo_productos="datos/productos.json"):
-    """Carga los datos del sistema desde archivos JSON"""
+    if not lineas:
+        return 0
     
-    tipos_membresia = {
+    lineas.append({'tipo': 'prox_id_reserva', 'datos': coworking.prox_id_reserva})
+    texto = "".join(json.dumps(linea, ensure_ascii=False) + "\n" for linea in lineas)
+    try:
+        with open(archivo_cambios, 'a', encoding='utf-8') as f:
+            f.write(texto)
+    except Exception:
+        coworking.devolver_cambios(cambios)
+        raise
+    for cliente, hasta in guardadas:
+        cliente._compras_guardadas = hasta
+    METRICAS.sumar_bytes("escritos", len(texto.encode('utf-8')))
+    return len(lineas)
+
+def _tipos_membresia():
+    return {
         "Basica": MembresiaBasica(),
         "Estandar": MembresiaEstandar(),
         "Premium": MembresiaPremium(),
         "Estudiante": MembresiaEstudiante()
     }
+
+def _aplicar_datos_cliente(cliente, datos):
+    cliente.activo = datos['activo']
+    cliente.entradas_usadas = datos['entradas_usadas']
+    cliente.deuda_renovacion = datos['deuda_renovacion']
+    cliente.fecha_ultimo_uso = datetime.fromisoformat(datos['fecha_ultimo_uso'])
+
+def _aplicar_datos_producto(producto, datos):
+    # Archivos anteriores al umbral por producto y a la demanda quedan con los valores por defecto
+    producto.umbral_stock = datos.get('umbral_stock', producto.umbral_stock)
+    producto.demanda = datos.get('demanda', 0.0)
+    producto.ultima_demanda = datos.get('ultima_demanda')
+
+def _cargar_compras(compras):
+    compras_cargadas = []
+    for compra in compras:
+        compra_cargada = compra.copy()
+        if 'fecha' in compra_cargada:
+            compra_cargada['fecha'] = datetime.fromisoformat(compra_cargada['fecha'])
+        compras_cargadas.append(compra_cargada)
+    return compras_cargadas
+
+def _generacion_foto(datos, clave):
+    """(generacion, filas) de un archivo de la foto. Los de versiones anteriores son la lista sola: generacion 0"""
+    if isinstance(datos, list):
+        return 0, datos
+    return datos['generacion'], datos[clave]
+
+def cargar_datos(coworking, archivo_clientes="datos/clientes.json", archivo_productos="datos/productos.json",
+                 archivo_reservas="datos/reservas.json", archivo_cambios="datos/cambios.jsonl"):
+    """Carga los datos del sistema desde archivos JSON"""
+    
+    tipos_membresia = _tipos_membresia()
     
     # Bandera para saber si cargamos datos existentes
     datos_existen = False
+    # Generacion de cada archivo de la foto, por tipo de linea del registro de cambios
+    generaciones = {}
     
     # Cargar clientes
     try:
         with open(archivo_clientes, 'r', encoding='utf-8') as f:
-            datos_clientes = json.load(f)
+            generaciones['cliente'], datos_clientes = _generacion_foto(json.load(f), 'clientes')
+        METRICAS.sumar_archivo("leidos", archivo_clientes)
         
+        clientes = []
         for datos in datos_clientes:
             membresia = tipos_membresia.get(datos['membresia_tipo'], MembresiaBasica())
             cliente = Cliente(
@@ -65,20 +244,11 @@ def cargar_datos(coworking, archivo_clientes="datos/clientes.json", archivo_prod
                 datos['correo'],
                 membresia
             )
-            cliente.activo = datos['activo']
-            cliente.entradas_usadas = datos['entradas_usadas']
-            cliente.deuda_renovacion = datos['deuda_renovacion']
-            cliente.fecha_ultimo_uso = datetime.fromisoformat(datos['fecha_ultimo_uso'])
-            
-            compras_cargadas = []
-            for compra in datos['compras']:
-                compra_cargada = compra.copy()
-                if 'fecha' in compra_cargada:
-                    compra_cargada['fecha'] = datetime.fromisoformat(compra_cargada['fecha'])
-                compras_cargadas.append(compra_cargada)
-            cliente.compras = compras_cargadas
-            
-            coworking.agregar_cliente(cliente)
+            _aplicar_datos_cliente(cliente, datos)
+            cliente.compras = _cargar_compras(datos['compras'])
+            cliente._compras_guardadas = len(cliente.compras)
+            clientes.append(cliente)
+        coworking.agregar_clientes(clientes)
         
         datos_existen = True
     
@@ -88,7 +258,8 @@ def cargar_datos(coworking, archivo_clientes="datos/clientes.json", archivo_prod
     # Cargar productos
     try:
         with open(archivo_productos, 'r', encoding='utf-8') as f:
-            datos_productos = json.load(f)
+            generaciones['producto'], datos_productos = _generacion_foto(json.load(f), 'productos')
+        METRICAS.sumar_archivo("leidos", archivo_productos)
         
         for datos in datos_productos:
             producto = Producto(
@@ -97,6 +268,7 @@ def cargar_datos(coworking, archivo_clientes="datos/clientes.json", archivo_prod
                 datos['precio'],
                 datos['stock']
             )
+            _aplicar_datos_producto(producto, datos)
             coworking.agregar_producto(producto)
         
         datos_existen = True
@@ -104,9 +276,177 @@ def cargar_datos(coworking, archivo_clientes="datos/clientes.json", archivo_prod
     except FileNotFoundError:
         print("No se encontraron datos de productos.")
     
+    # Cargar salas y reservas
+    try:
+        generaciones['reserva'] = generaciones['prox_id_reserva'] = cargar_reservas(coworking, archivo_reservas)
+        datos_existen = True
+    except FileNotFoundError:
+        print("No se encontraron datos de reservas.")
+    
+    # Aplicar los cambios guardados despues de la ultima foto completa
+    if os.path.exists(archivo_cambios):
+        # Las salas no van en el registro: las reservas necesitan que existan
+        coworking._crear_salas_si_no_existen()
+    if aplicar_cambios(coworking, archivo_cambios, generaciones):
+        datos_existen = True
+    
     # Si NO cargamos datos existentes, crear datos por defecto
     if not datos_existen:
         print("Creando datos por defecto...")
         coworking.inicializar_datos_default()
     else:
-        print("Datos existentes cargados correctamente")
\ No newline at end of file
+        coworking._crear_salas_si_no_existen()
+        # Lo recien cargado no cuenta como cambio pendiente
+        coworking.tomar_cambios()
+        print("Datos existentes cargados correctamente")
+
+def cargar_reservas(coworking, archivo_reservas="datos/reservas.json"):
+    """Carga las reservas directamente en el indice ordenado de cada sala. Devuelve la generacion del archivo"""
+    with open(archivo_reservas, 'r', encoding='utf-8') as f:
+        datos = json.load(f)
+    METRICAS.sumar_archivo("leidos", archivo_reservas)
+    
+    omitidas = 0
+    for datos_sala in datos['salas']:
+        sala = coworking.buscar_sala(datos_sala['id_sala'])
+        if not sala:
+            sala = Sala(datos_sala['id_sala'], datos_sala['nombre'], datos_sala['capacidad'])
+            coworking.agregar_sala(sala)
+        
+        reservas = []
+        for id_reserva, id_cliente, inicio, duracion_horas in datos_sala['reservas']:
+            cliente = coworking.buscar_cliente_reserva(id_cliente)
+            if not cliente:
+                omitidas += 1
+                continue
+            reserva = Reserva(id_reserva, cliente, sala, datetime.fromisoformat(inicio), duracion_horas)
+            reservas.append(reserva)
+            cliente.reservas.append(reserva)
+            coworking.reservas[id_reserva] = reserva
+        
+        # Se guardaron en el orden del indice, asi que se cargan sin revalidar solapes
+        sala.cargar_reservas(reservas)
+    
+    coworking.prox_id_reserva = max(coworking.prox_id_reserva, datos['prox_id_reserva'])
+    if omitidas:
+        print(f"Se omitieron {omitidas} reservas de clientes inexistentes")
+    return datos.get('generacion', 0)
+
+def aplicar_cambios(coworking, archivo_cambios="datos/cambios.jsonl", generaciones=None):
+    """Reaplica el registro de cambios sobre los datos cargados. Devuelve cuantas lineas aplico.
+    generaciones indica la de cada archivo de la foto por tipo de linea: si un archivo es de una foto
+    posterior al registro (guardado cortado a mitad) ya tiene esos cambios y sus lineas se saltan"""
+    try:
+        f = open(archivo_cambios, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return 0
+    
+    METRICAS.sumar_archivo("leidos", archivo_cambios)
+    tipos_membresia = _tipos_membresia()
+    generaciones = generaciones or {}
+    # Registro de una version anterior, sin linea de generacion: es de la generacion 0
+    adelantados = {tipo for tipo, generacion in generaciones.items() if generacion > 0}
+    aplicadas = 0
+    with f:
+        for linea in f:
+            try:
+                cambio = json.loads(linea)
+            except json.JSONDecodeError:
+                # Linea incompleta al final del registro: se descarta
+                continue
+            datos = cambio['datos']
+            
+            if cambio['tipo'] == 'generacion':
+                adelantados = {tipo for tipo, generacion in generaciones.items() if generacion > datos}
+                continue
+            if cambio['tipo'] in adelantados:
+                continue
+            
+            if cambio['tipo'] == 'cliente':
+                cliente = coworking.buscar_cliente(datos['id_cliente'])
+                if not cliente:
+                    membresia = tipos_membresia.get(datos['membresia_tipo'], MembresiaBasica())
+                    cliente = Cliente(datos['id_cliente'], datos['nombre'], datos['correo'], membresia)
+                    coworking.agregar_cliente(cliente)
+                antes = coworking._estado_cliente(cliente)
+                _aplicar_datos_cliente(cliente, datos)
+                cliente.compras[cambio['desde']:] = _cargar_compras(cambio['compras'])
+                cliente._compras_guardadas = len(cliente.compras)
+                coworking._cliente_actualizado(cliente, antes)
+            
+            elif cambio['tipo'] == 'producto':
+                producto = coworking.buscar_producto(datos['id_producto'])
+                if not producto:
+                    producto = Producto(datos['id_producto'], datos['nombre'], datos['precio'], datos['stock'])
+                    _aplicar_datos_producto(producto, datos)
+                    coworking.agregar_producto(producto)
+                else:
+                    with producto._lock:
+                        stock_antes = producto.stock
+                        producto.stock = datos['stock']
+                        _aplicar_datos_producto(producto, datos)
+                        # Tambien si solo cambio el umbral
+                        coworking._stock_actualizado(producto, stock_antes)
+            
+            elif cambio['tipo'] == 'reserva':
+                id_reserva, id_cliente, inicio, duracion_horas = datos
+                cliente = coworking.buscar_cliente_reserva(id_cliente)
+                sala = coworking.buscar_sala(cambio['sala'])
+                if id_reserva in coworking.reservas or not cliente or not sala:
+                    continue
+                reserva = Reserva(id_reserva, cliente, sala, datetime.fromisoformat(inicio), duracion_horas)
+                sala.agregar_reserva(reserva)
+                cliente.reservas.append(reserva)
+                coworking.reservas[id_reserva] = reserva
+            
+            elif cambio['tipo'] == 'prox_id_reserva':
+                coworking.prox_id_reserva = max(coworking.prox_id_reserva, datos)
+            
+            aplicadas += 1
+    if adelantados:
+        # Los cambios nuevos no pueden ir a este registro: el proximo guardado tiene que ser completo
+        coworking._foto_pendiente = True
+    return aplicadas
+
+#Almacenes intercambiables: el programa solo usa crear_libro_ventas, cargar, guardar y guardar_cambios
+
+class AlmacenJSON:
+    def __init__(self, directorio="datos", fsync=False):
+        self.directorio = directorio
+        # fsync=True sincroniza con el disco cada grupo de ventas del libro
+        self.fsync = fsync
+        self.archivos = {
+            'archivo_clientes': os.path.join(directorio, "clientes.json"),
+            'archivo_productos': os.path.join(directorio, "productos.json"),
+            'archivo_reservas': os.path.join(directorio, "reservas.json")
+        }
+        self.archivo_cambios = os.path.join(directorio, "cambios.jsonl")
+    
+    def crear_libro_ventas(self):
+        return LibroVentasPorMes(os.path.join(self.directorio, "ventas"), os.path.join(self.directorio, "ventas.jsonl"),
+                                 os.path.join(self.directorio, "ventas.json"), fsync=self.fsync)
+    
+    def cargar(self, coworking):
+        os.makedirs(self.directorio, exist_ok=True)
+        cargar_datos(coworking, archivo_cambios=self.archivo_cambios, **self.archivos)
+    
+    def guardar(self, coworking):
+        guardar_datos(coworking, archivo_cambios=self.archivo_cambios, **self.archivos)
+    
+    def guardar_cambios(self, coworking):
+        return guardar_cambios(coworking, self.archivo_cambios, **self.archivos)
+    
+    def cerrar(self):
+        pass
+
+def crear_almacen(tipo="json", directorio="datos", fsync=False):
+    if tipo == "json":
+        return AlmacenJSON(directorio, fsync)
+    if tipo == "sqlite":
+        from persistencia_sqlite import AlmacenSQLite
+        return AlmacenSQLite(os.path.join(directorio, "coworking.db"))
+    raise ValueError(f"Tipo de almacen desconocido: {tipo}")
+
+
+instrumentar_funciones(globals(), ["guardar_datos", "guardar_reservas", "guardar_cambios", "cargar_datos",
+                                   "cargar_reservas", "aplicar_cambios"], "persistencia")
@@ -0,0 +1,450 @@
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from metricas import instrumentar_clase
+from models import MembresiaBasica, Cliente, Producto, Sala, Reserva, Coworking
+from persistencia import AlmacenJSON, _foto_cliente, _foto_producto, _reservas_sala, _tipos_membresia
+from ventas import ResumenVentas, _texto_fecha, analisis_vacio, escritura_hecha
+
+#Almacen SQLite (solo libreria estandar) con indices para consultar sin cargar todo en memoria
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS clientes (
+    id_cliente TEXT PRIMARY KEY,
+    nombre TEXT,
+    correo TEXT,
+    membresia_tipo TEXT,
+    activo INTEGER,
+    entradas_usadas INTEGER,
+    deuda_renovacion REAL,
+    fecha_ultimo_uso TEXT
+);
+CREATE TABLE IF NOT EXISTS compras (
+    id_cliente TEXT,
+    posicion INTEGER,
+    fecha TEXT,
+    producto TEXT,
+    cantidad INTEGER,
+    precio_unitario REAL,
+    descuento REAL,
+    total REAL,
+    PRIMARY KEY (id_cliente, posicion)
+);
+CREATE TABLE IF NOT EXISTS productos (
+    id_producto TEXT PRIMARY KEY,
+    nombre TEXT,
+    precio REAL,
+    stock INTEGER,
+    umbral_stock INTEGER,
+    demanda REAL,
+    ultima_demanda REAL
+);
+CREATE TABLE IF NOT EXISTS salas (
+    id_sala TEXT PRIMARY KEY,
+    nombre TEXT,
+    capacidad INTEGER
+);
+CREATE TABLE IF NOT EXISTS reservas (
+    id_reserva TEXT PRIMARY KEY,
+    id_cliente TEXT,
+    id_sala TEXT,
+    inicio TEXT,
+    fin TEXT,
+    duracion_horas REAL
+);
+CREATE TABLE IF NOT EXISTS ventas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha TEXT,
+    tipo TEXT,
+    cliente_id TEXT,
+    descripcion TEXT,
+    monto REAL,
+    producto_id TEXT,
+    cantidad INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_reservas_sala_inicio ON reservas (id_sala, inicio);
+CREATE INDEX IF NOT EXISTS idx_reservas_cliente ON reservas (id_cliente);
+CREATE INDEX IF NOT EXISTS idx_ventas_cliente ON ventas (cliente_id);
+CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas (fecha);
+CREATE INDEX IF NOT EXISTS idx_ventas_tipo_fecha ON ventas (tipo, fecha);
+"""
+
+COLUMNAS_VENTA = ("fecha", "tipo", "cliente_id", "descripcion", "monto", "producto_id", "cantidad")
+SELECT_VENTAS = "SELECT " + ", ".join(COLUMNAS_VENTA) + " FROM ventas"
+
+
+def _venta(fila):
+    # producto_id y cantidad solo existen en las ventas de productos
+    return {columna: valor for columna, valor in zip(COLUMNAS_VENTA, fila) if valor is not None}
+
+
+class LibroVentasSQLite:
+    """Libro de ventas sobre la tabla ventas, con la misma interfaz que LibroVentas"""
+
+    def __init__(self, almacen):
+        self.almacen = almacen
+
+    def registrar(self, venta):
+        return self.registrar_lote([venta])
+
+    def registrar_lote(self, ventas):
+        conexion = self.almacen.conexion
+        with self.almacen._lock, conexion:
+            conexion.executemany(
+                "INSERT INTO ventas (" + ", ".join(COLUMNAS_VENTA) + ") VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [tuple(venta.get(columna) for columna in COLUMNAS_VENTA) for venta in ventas]
+            )
+        # La transaccion ya quedo confirmada
+        return escritura_hecha(len(ventas))
+
+    def flush(self, timeout=None):
+        return True
+
+    def iterar(self):
+        return self.consultar()
+
+    def consultar(self, tipo=None, cliente_id=None, desde=None, hasta=None, limite=None, recientes_primero=False):
+        condiciones = []
+        parametros = []
+        if tipo is not None:
+            condiciones.append("tipo = ?")
+            parametros.append(tipo)
+        if cliente_id is not None:
+            condiciones.append("cliente_id = ?")
+            parametros.append(cliente_id)
+        if desde is not None:
+            condiciones.append("fecha >= ?")
+            parametros.append(_texto_fecha(desde))
+        if hasta is not None:
+            condiciones.append("fecha < ?")
+            parametros.append(_texto_fecha(hasta))
+
+        consulta = SELECT_VENTAS
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        consulta += " ORDER BY id DESC" if recientes_primero else " ORDER BY id"
+        if limite is not None:
+            consulta += " LIMIT ?"
+            parametros.append(limite)
+
+        with self.almacen._lock:
+            cursor = self.almacen.conexion.execute(consulta, parametros)
+        while True:
+            # Se lee por bloques para no retener la conexion mientras se consumen los resultados
+            with self.almacen._lock:
+                filas = cursor.fetchmany(1000)
+            if not filas:
+                break
+            for fila in filas:
+                yield _venta(fila)
+
+    def ultimas(self, cantidad=20, pagina=0, cliente_id=None):
+        consulta = SELECT_VENTAS
+        parametros = []
+        if cliente_id is not None:
+            consulta += " WHERE cliente_id = ?"
+            parametros.append(cliente_id)
+        consulta += " ORDER BY id DESC LIMIT ? OFFSET ?"
+        parametros += [cantidad, cantidad * pagina]
+        with self.almacen._lock:
+            filas = self.almacen.conexion.execute(consulta, parametros).fetchall()
+        return [_venta(fila) for fila in filas]
+
+    def totales_por_tipo(self):
+        with self.almacen._lock:
+            filas = self.almacen.conexion.execute("SELECT tipo, SUM(monto) FROM ventas GROUP BY tipo").fetchall()
+        return {tipo: total for tipo, total in filas}
+
+    def analizar(self, desde=None, hasta=None, procesos=None):
+        """Totales por tipo, cliente, producto y dia en [desde, hasta), agrupados en SQL"""
+        condiciones = []
+        parametros = []
+        if desde is not None:
+            condiciones.append("fecha >= ?")
+            parametros.append(_texto_fecha(desde))
+        if hasta is not None:
+            condiciones.append("fecha < ?")
+            parametros.append(_texto_fecha(hasta))
+        filtro = " WHERE " + " AND ".join(condiciones) if condiciones else ""
+        analisis = analisis_vacio()
+        with self.almacen._lock:
+            conexion = self.almacen.conexion
+            for dia, tipo, cliente_id, monto, cantidad in conexion.execute(
+                    "SELECT substr(fecha, 1, 10), tipo, cliente_id, SUM(monto), COUNT(*) FROM ventas"
+                    + filtro + " GROUP BY 1, 2, 3", parametros):
+                analisis["total"] += monto
+                analisis["cantidad"] += cantidad
+                analisis["por_tipo"][tipo] = analisis["por_tipo"].get(tipo, 0) + monto
+                analisis["por_cliente"][cliente_id] = analisis["por_cliente"].get(cliente_id, 0) + monto
+                analisis["por_dia"][dia] = analisis["por_dia"].get(dia, 0) + monto
+            filtro_producto = (filtro + " AND " if filtro else " WHERE ") + "producto_id IS NOT NULL"
+            for id_producto, unidades, monto in conexion.execute(
+                    "SELECT producto_id, SUM(COALESCE(cantidad, 1)), SUM(monto) FROM ventas"
+                    + filtro_producto + " GROUP BY producto_id", parametros):
+                analisis["por_producto"][id_producto] = {"unidades": unidades, "monto": monto}
+        return analisis
+
+    def resumen_por_periodo(self):
+        """Acumulados diarios y mensuales agrupados directamente en SQL"""
+        resumen = ResumenVentas()
+        with self.almacen._lock:
+            filas = self.almacen.conexion.execute(
+                "SELECT substr(fecha, 1, 10), tipo, cliente_id, SUM(monto), COUNT(*) FROM ventas GROUP BY 1, 2, 3"
+            ).fetchall()
+        for dia, tipo, cliente_id, monto, cantidad in filas:
+            resumen.agregar(dia, tipo, cliente_id, monto, cantidad)
+        return resumen
+
+    def tamano_bytes(self):
+        # Las ventas comparten archivo con el resto de tablas: se informa el tamano de la base completa
+        try:
+            return os.path.getsize(self.almacen.ruta)
+        except OSError:
+            return 0
+
+    def cerrar(self):
+        pass
+
+
+class AlmacenSQLite:
+    def __init__(self, ruta="datos/coworking.db"):
+        self.ruta = ruta
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        # La conexion se comparte entre hilos; _lock serializa su uso
+        self.conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.conexion.executescript(ESQUEMA)
+        # Bases creadas antes de guardar el producto de cada venta y el umbral y la demanda de cada producto
+        for tabla, nuevas in (("ventas", (("producto_id", "TEXT"), ("cantidad", "INTEGER"))),
+                              ("productos", (("umbral_stock", "INTEGER"), ("demanda", "REAL"),
+                                             ("ultima_demanda", "REAL")))):
+            columnas = {fila[1] for fila in self.conexion.execute(f"PRAGMA table_info({tabla})")}
+            for columna, tipo in nuevas:
+                if columna not in columnas:
+                    self.conexion.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {tipo}")
+
+    def crear_libro_ventas(self):
+        return LibroVentasSQLite(self)
+
+    #Guardado
+
+    def _filas_cliente(self, cliente):
+        return (cliente.id_cliente, cliente.nombre, cliente.correo, cliente.membresia.tipo, int(cliente.activo),
+                cliente.entradas_usadas, cliente.deuda_renovacion, cliente.fecha_ultimo_uso.isoformat())
+
+    def _filas_compras(self, id_cliente, desde, compras):
+        return [
+            (id_cliente, posicion, compra['fecha'].isoformat(), compra['producto'], compra['cantidad'],
+             compra['precio_unitario'], compra['descuento'], compra['total'])
+            for posicion, compra in enumerate(compras, start=desde)
+        ]
+
+    def _fila_producto(self, producto):
+        return (producto.id_producto, producto.nombre, producto.precio, producto.stock, producto.umbral_stock,
+                producto.demanda, producto.ultima_demanda)
+
+    def _filas_reserva(self, reserva):
+        return (reserva.id_reserva, reserva.cliente.id_cliente, reserva.sala.id_sala,
+                reserva.inicio.isoformat(), reserva.fin.isoformat(), reserva.duracion_horas)
+
+    def _escribir(self, clientes, productos, reservas, salas, prox_id_reserva):
+        # Cada cliente y producto se lee bajo su lock; solo las compras que aun no estan en la tabla
+        fotos = [_foto_cliente(cliente, self._filas_cliente) for cliente in clientes]
+        filas_productos = [_foto_producto(producto, self._fila_producto) for producto in productos]
+        with self._lock, self.conexion:
+            self.conexion.executemany(
+                "INSERT OR REPLACE INTO clientes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [fila for fila, _, _, _ in fotos]
+            )
+            for cliente, (_, desde, compras, _) in zip(clientes, fotos):
+                self.conexion.executemany(
+                    "INSERT OR REPLACE INTO compras VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._filas_compras(cliente.id_cliente, desde, compras)
+                )
+            self.conexion.executemany(
+                "INSERT OR REPLACE INTO productos (id_producto, nombre, precio, stock, umbral_stock, demanda, "
+                "ultima_demanda) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                filas_productos
+            )
+            self.conexion.executemany(
+                "INSERT OR REPLACE INTO salas VALUES (?, ?, ?)",
+                [(s.id_sala, s.nombre, s.capacidad) for s in salas]
+            )
+            self.conexion.executemany(
+                "INSERT OR REPLACE INTO reservas VALUES (?, ?, ?, ?, ?, ?)",
+                [self._filas_reserva(reserva) for reserva in reservas]
+            )
+            self.conexion.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('prox_id_reserva', ?)", (str(prox_id_reserva),)
+            )
+        for cliente, (_, _, _, hasta) in zip(clientes, fotos):
+            cliente._compras_guardadas = hasta
+
+    def guardar(self, coworking):
+        # Lo que se modifique a partir de aqui queda marcado para el proximo guardado
+        cambios = coworking.tomar_cambios()
+        clientes, productos, salas, prox_id_reserva = coworking.foto()
+        reservas = [reserva for sala in salas for reserva in _reservas_sala(sala)]
+        try:
+            self._escribir(clientes, productos, reservas, salas, prox_id_reserva)
+        except Exception:
+            coworking.devolver_cambios(cambios)
+            raise
+
+    def guardar_cambios(self, coworking):
+        cambios = coworking.tomar_cambios()
+        total = len(cambios['clientes']) + len(cambios['productos']) + len(cambios['reservas'])
+        if total:
+            _, _, salas, prox_id_reserva = coworking.foto()
+            try:
+                self._escribir(cambios['clientes'], cambios['productos'], cambios['reservas'], salas, prox_id_reserva)
+            except Exception:
+                coworking.devolver_cambios(cambios)
+                raise
+        return total
+
+    #Carga
+
+    def cargar(self, coworking):
+        tipos_membresia = _tipos_membresia()
+        compras_por_cliente = {}
+        for id_cliente, fecha, producto, cantidad, precio_unitario, descuento, total in self.conexion.execute(
+                "SELECT id_cliente, fecha, producto, cantidad, precio_unitario, descuento, total "
+                "FROM compras ORDER BY id_cliente, posicion"):
+            compras_por_cliente.setdefault(id_cliente, []).append({
+                "fecha": datetime.fromisoformat(fecha),
+                "producto": producto,
+                "cantidad": cantidad,
+                "precio_unitario": precio_unitario,
+                "descuento": descuento,
+                "total": total
+            })
+
+        clientes = []
+        for fila in self.conexion.execute("SELECT * FROM clientes"):
+            id_cliente, nombre, correo, membresia_tipo, activo, entradas_usadas, deuda, fecha_ultimo_uso = fila
+            cliente = Cliente(id_cliente, nombre, correo, tipos_membresia.get(membresia_tipo, MembresiaBasica()))
+            cliente.activo = bool(activo)
+            cliente.entradas_usadas = entradas_usadas
+            cliente.deuda_renovacion = deuda
+            cliente.fecha_ultimo_uso = datetime.fromisoformat(fecha_ultimo_uso)
+            cliente.compras = compras_por_cliente.get(id_cliente, [])
+            cliente._compras_guardadas = len(cliente.compras)
+            clientes.append(cliente)
+        coworking.agregar_clientes(clientes)
+
+        for id_producto, nombre, precio, stock, umbral_stock, demanda, ultima_demanda in self.conexion.execute(
+                "SELECT id_producto, nombre, precio, stock, umbral_stock, demanda, ultima_demanda FROM productos"):
+            producto = Producto(id_producto, nombre, precio, stock)
+            if umbral_stock is not None:
+                producto.umbral_stock = umbral_stock
+            producto.demanda = demanda or 0.0
+            producto.ultima_demanda = ultima_demanda
+            coworking.agregar_producto(producto)
+
+        for id_sala, nombre, capacidad in self.conexion.execute("SELECT * FROM salas"):
+            coworking.agregar_sala(Sala(id_sala, nombre, capacidad))
+
+        # El indice (id_sala, inicio) entrega las reservas ya ordenadas para el indice de cada sala
+        reservas_sala = []
+        sala_actual = None
+        for id_reserva, id_cliente, id_sala, inicio, duracion_horas in self.conexion.execute(
+                "SELECT id_reserva, id_cliente, id_sala, inicio, duracion_horas FROM reservas ORDER BY id_sala, inicio"):
+            sala = coworking.buscar_sala(id_sala)
+            cliente = coworking.buscar_cliente_reserva(id_cliente)
+            if not sala or not cliente:
+                continue
+            if sala is not sala_actual:
+                if sala_actual is not None:
+                    sala_actual.cargar_reservas(reservas_sala)
+                sala_actual, reservas_sala = sala, []
+            reserva = Reserva(id_reserva, cliente, sala, datetime.fromisoformat(inicio), duracion_horas)
+            reservas_sala.append(reserva)
+            cliente.reservas.append(reserva)
+            coworking.reservas[id_reserva] = reserva
+        if sala_actual is not None:
+            sala_actual.cargar_reservas(reservas_sala)
+
+        fila = self.conexion.execute("SELECT valor FROM meta WHERE clave = 'prox_id_reserva'").fetchone()
+        if fila:
+            coworking.prox_id_reserva = max(coworking.prox_id_reserva, int(fila[0]))
+
+        if not coworking.clientes and not coworking.productos and not coworking.salas:
+            print("Creando datos por defecto...")
+            coworking.inicializar_datos_default()
+        else:
+            coworking._crear_salas_si_no_existen()
+            coworking.tomar_cambios()
+            print("Datos existentes cargados correctamente")
+
+    def cerrar(self):
+        self.conexion.close()
+
+
+instrumentar_clase(AlmacenSQLite)
+
+
+#Exportar / importar entre el almacen JSON y SQLite
+
+def copiar_almacen(origen, destino, tamano_lote=10000):
+    """Copia clientes, productos, salas, reservas y el historial de ventas de un almacen a otro"""
+    libro_destino = destino.crear_libro_ventas()
+    if next(iter(libro_destino.iterar()), None) is not None:
+        raise ValueError("El almacen destino ya tiene ventas registradas")
+
+    coworking = Coworking(libro_ventas=origen.crear_libro_ventas())
+    origen.cargar(coworking)
+    for cliente in coworking.clientes.values():
+        cliente._compras_guardadas = 0
+    destino.guardar(coworking)
+
+    lote = []
+    copiadas = 0
+    for venta in coworking.libro_ventas.iterar():
+        lote.append(venta)
+        if len(lote) >= tamano_lote:
+            libro_destino.registrar_lote(lote).esperar()
+            copiadas += len(lote)
+            lote = []
+    if lote:
+        libro_destino.registrar_lote(lote).esperar()
+        copiadas += len(lote)
+    libro_destino.cerrar()
+    coworking.cerrar()
+    return copiadas
+
+
+def main(argumentos):
+    if len(argumentos) != 3 or argumentos[0] not in ("exportar", "importar"):
+        print("Uso: python persistencia_sqlite.py exportar <directorio_json> <archivo.db>")
+        print("     python persistencia_sqlite.py importar <archivo.db> <directorio_json>")
+        return 1
+
+    if argumentos[0] == "exportar":
+        origen, destino = AlmacenJSON(argumentos[1]), AlmacenSQLite(argumentos[2])
+    else:
+        origen, destino = AlmacenSQLite(argumentos[1]), AlmacenJSON(argumentos[2])
+        os.makedirs(argumentos[2], exist_ok=True)
+
+    try:
+        copiadas = copiar_almacen(origen, destino)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        origen.cerrar()
+        destino.cerrar()
+    print(f"Datos copiados. Ventas: {copiadas}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,183 @@
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from models import *
+from persistencia import crear_almacen
+
+#Prueba de concurrencia: muchos hilos reservan, compran y reponen sobre el mismo coworking a la vez.
+#Al final se comprueba que no haya reservas superpuestas, stock negativo ni estadisticas desfasadas.
+#Termina con codigo 1 si alguna comprobacion falla
+
+ERRORES_NEGOCIO = (ClienteInhabilitadoError, SalaOcupadaError, ProductoAgotadoError, StockInsuficienteError)
+INICIO_CALENDARIO = datetime(2025, 3, 3, 8, 0)
+
+
+def preparar(coworking, clientes, salas, productos, stock):
+    coworking.agregar_clientes([Cliente(f"C{i + 1}", f"Cliente {i + 1}", f"cliente{i + 1}@correo.com",
+                                        MembresiaPremium()) for i in range(clientes)])
+    for i in range(salas):
+        coworking.agregar_sala(Sala(f"S{i + 1}", f"Sala {i + 1}", 4 + i))
+    for i in range(productos):
+        coworking.agregar_producto(Producto(f"P{i + 1}", f"Producto {i + 1}", 2 + i, stock))
+
+
+def trabajar(coworking, numero, operaciones, franjas, barrera, cuentas, fallas):
+    """Operaciones al azar de un hilo: pocas salas y poco stock para que los hilos choquen seguido"""
+    azar = random.Random(numero)
+    ids_clientes = list(coworking.clientes)
+    ids_salas = list(coworking.salas)
+    ids_productos = list(coworking.productos)
+    locales = {}
+    repuesto = {}
+    barrera.wait()
+    for _ in range(operaciones):
+        id_cliente = azar.choice(ids_clientes)
+        eleccion = azar.random()
+        try:
+            if eleccion < 0.3:
+                operacion = "reservar_sala"
+                inicio = INICIO_CALENDARIO + timedelta(minutes=30 * azar.randrange(franjas))
+                coworking.reservar_sala(id_cliente, azar.choice(ids_salas), inicio, azar.choice([0.5, 1, 2]))
+            elif eleccion < 0.4:
+                operacion = "reservar_salas"
+                inicio = INICIO_CALENDARIO + timedelta(minutes=30 * azar.randrange(franjas))
+                coworking.reservar_salas(id_cliente, [(id_sala, inicio, 1) for id_sala in azar.sample(ids_salas, 2)])
+            elif eleccion < 0.65:
+                operacion = "comprar_producto"
+                coworking.comprar_producto(id_cliente, azar.choice(ids_productos), azar.randint(1, 3))
+            elif eleccion < 0.85:
+                operacion = "comprar_productos"
+                coworking.comprar_productos(id_cliente, [(id_producto, azar.randint(1, 3))
+                                                         for id_producto in azar.sample(ids_productos, 2)])
+            else:
+                operacion = "reponer_stock"
+                id_producto, cantidad = azar.choice(ids_productos), azar.randint(1, 5)
+                coworking.reponer_stock(id_producto, cantidad)
+                repuesto[id_producto] = repuesto.get(id_producto, 0) + cantidad
+            clave = (operacion, "ok")
+        except ERRORES_NEGOCIO:
+            clave = (operacion, "rechazada")
+        except Exception as e:
+            fallas.append(f"{operacion}: {type(e).__name__}: {e}")
+            clave = (operacion, "error")
+        locales[clave] = locales.get(clave, 0) + 1
+    with cuentas["lock"]:
+        for clave, cantidad in locales.items():
+            cuentas[clave] = cuentas.get(clave, 0) + cantidad
+        for id_producto, cantidad in repuesto.items():
+            cuentas["repuesto"][id_producto] = cuentas["repuesto"].get(id_producto, 0) + cantidad
+
+
+def comprobar(coworking, stock_inicial, repuesto, fallas):
+    """Devuelve la lista de problemas encontrados (vacia si todo esta bien)"""
+    problemas = list(fallas)
+
+    # Sin sobreventa de salas: las reservas de cada sala no se superponen
+    por_sala = {}
+    for reserva in coworking.reservas.values():
+        por_sala.setdefault(reserva.sala.id_sala, []).append(reserva)
+    for id_sala, reservas in por_sala.items():
+        reservas.sort(key=lambda reserva: reserva.inicio)
+        for anterior, siguiente in zip(reservas, reservas[1:]):
+            if siguiente.inicio < anterior.fin:
+                problemas.append(f"Reservas superpuestas en {id_sala}: {anterior.id_reserva} y {siguiente.id_reserva}")
+
+    # Ningun cliente supera sus entradas, y cada reserva aparece en su cliente y en su sala.
+    # (reservar_sala descuenta la entrada aunque la sala este ocupada, por eso no se exige igualdad)
+    for cliente in coworking.clientes.values():
+        if cliente.entradas_usadas > cliente.membresia.entradas_mes:
+            problemas.append(f"{cliente.id_cliente} uso {cliente.entradas_usadas} entradas de "
+                             f"{cliente.membresia.entradas_mes}")
+        if len(cliente.reservas) > cliente.entradas_usadas:
+            problemas.append(f"{cliente.id_cliente} tiene mas reservas que entradas usadas")
+    for nombre, cantidad in (("clientes", sum(len(cliente.reservas) for cliente in coworking.clientes.values())),
+                             ("salas", sum(len(reservas) for reservas in por_sala.values()))):
+        if cantidad != len(coworking.reservas):
+            problemas.append(f"Reservas en {nombre} ({cantidad}) distintas de las registradas ({len(coworking.reservas)})")
+
+    # Sin stock negativo, y stock inicial + repuesto - vendido segun el libro = stock final
+    coworking.confirmar_ventas()
+    vendido = coworking.analizar_ventas()["por_producto"]
+    for id_producto, producto in coworking.productos.items():
+        if producto.stock < 0:
+            problemas.append(f"Stock negativo de {id_producto}: {producto.stock}")
+        unidades = vendido.get(id_producto, {}).get("unidades", 0)
+        esperado = stock_inicial + repuesto.get(id_producto, 0) - unidades
+        if producto.stock != esperado:
+            problemas.append(f"Stock de {id_producto} es {producto.stock}, segun las ventas deberia ser {esperado}")
+
+    # Lo comprado en el historial de los clientes coincide con lo vendido en el libro
+    unidades_clientes = sum(compra["cantidad"] for cliente in coworking.clientes.values()
+                            for compra in cliente.compras)
+    unidades_libro = sum(datos["unidades"] for datos in vendido.values())
+    if unidades_clientes != unidades_libro:
+        problemas.append(f"Unidades en el historial de clientes ({unidades_clientes}) distintas del libro "
+                         f"({unidades_libro})")
+
+    diferencias = coworking.verificar_estadisticas()
+    if diferencias:
+        problemas.append(f"Estadisticas acumuladas desfasadas: {diferencias}")
+    return problemas
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Prueba de concurrencia del sistema de coworking")
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--operaciones", type=int, default=2000, help="Operaciones por hilo")
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--salas", type=int, default=3)
+    parser.add_argument("--productos", type=int, default=4)
+    parser.add_argument("--stock", type=int, default=200)
+    parser.add_argument("--franjas", type=int, default=960, help="Horarios de inicio posibles (cada 30 minutos)")
+    parser.add_argument("--almacen", choices=["json", "sqlite"], default="json")
+    opciones = parser.parse_args(argumentos)
+
+    # Cambios de hilo mucho mas seguidos que lo normal para provocar intercalados
+    sys.setswitchinterval(1e-5)
+    directorio = tempfile.mkdtemp(prefix="concurrencia_")
+    try:
+        almacen = crear_almacen(opciones.almacen, directorio)
+        coworking = Coworking(libro_ventas=almacen.crear_libro_ventas())
+        preparar(coworking, opciones.clientes, opciones.salas, opciones.productos, opciones.stock)
+
+        barrera = threading.Barrier(opciones.hilos)
+        cuentas = {"lock": threading.Lock(), "repuesto": {}}
+        fallas = []
+        hilos = [threading.Thread(target=trabajar, args=(coworking, numero, opciones.operaciones, opciones.franjas,
+                                                         barrera, cuentas, fallas))
+                 for numero in range(opciones.hilos)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        segundos = time.perf_counter() - inicio
+
+        problemas = comprobar(coworking, opciones.stock, cuentas["repuesto"], fallas)
+        coworking.cerrar()
+        almacen.cerrar()
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    total = opciones.hilos * opciones.operaciones
+    print(f"{total} operaciones en {opciones.hilos} hilos: {segundos:.2f} s ({total / segundos:.0f} ops/s)")
+    for operacion in ("reservar_sala", "reservar_salas", "comprar_producto", "comprar_productos", "reponer_stock"):
+        print(f"  {operacion:20} ok {cuentas.get((operacion, 'ok'), 0):>7}  "
+              f"rechazadas {cuentas.get((operacion, 'rechazada'), 0):>7}  "
+              f"errores {cuentas.get((operacion, 'error'), 0):>5}")
+    if problemas:
+        print("FALLO:")
+        for problema in problemas[:20]:
+            print(f"  {problema}")
+        return 1
+    print("OK: sin reservas superpuestas, sin stock negativo y estadisticas consistentes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import contextlib
+import io
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+from models import *
+import persistencia
+from persistencia import crear_almacen
+
+#Prueba de guardado cortado: una foto completa se interrumpe antes de cada uno de sus archivos
+#y se comprueba que al cargar no se pierdan compras, stock ni reservas ya guardados.
+#Termina con codigo 1 si alguna comprobacion falla
+
+class Corte(Exception):
+    """Simula que el proceso muere en ese punto del guardado"""
+
+
+def cortar_en(escritura):
+    """Reemplaza la escritura atomica para que se corte antes de la escritura numero 'escritura'"""
+    escribir = persistencia._escribir_json_atomico
+    hechas = []
+
+    def escribir_o_cortar(archivo, *args, **kwargs):
+        hechas.append(archivo)
+        if len(hechas) == escritura:
+            raise Corte(archivo)
+        escribir(archivo, *args, **kwargs)
+    persistencia._escribir_json_atomico = escribir_o_cortar
+    return escribir
+
+
+def abrir(directorio):
+    almacen = crear_almacen("json", directorio)
+    coworking = Coworking(libro_ventas=almacen.crear_libro_ventas())
+    # Los avisos de la carga no interesan aqui
+    with contextlib.redirect_stdout(io.StringIO()):
+        almacen.cargar(coworking)
+    return almacen, coworking
+
+
+def estado(coworking):
+    cliente = coworking.buscar_cliente("C1")
+    return (len(cliente.compras), coworking.buscar_producto("P1").stock,
+            sorted(coworking.reservas), coworking.prox_id_reserva)
+
+
+def cerrar(almacen, coworking):
+    coworking.cerrar()
+    almacen.cerrar()
+
+
+def probar_corte(escritura, problemas):
+    directorio = tempfile.mkdtemp(prefix="guardado_")
+    try:
+        almacen, coworking = abrir(directorio)
+        coworking.agregar_cliente(Cliente("C1", "Cliente 1", "cliente1@correo.com", MembresiaPremium()))
+        almacen.guardar(coworking)
+
+        # Un guardado incremental y despues cambios que solo va a tener la foto completa
+        coworking.comprar_producto("C1", "P1", 1)
+        coworking.reservar_sala("C1", "S1", datetime(2025, 3, 3, 9, 0), 1)
+        almacen.guardar_cambios(coworking)
+        guardado = estado(coworking)
+        coworking.comprar_producto("C1", "P1", 2)
+        coworking.reservar_sala("C1", "S2", datetime(2025, 3, 3, 10, 0), 1)
+        completo = estado(coworking)
+
+        escribir = cortar_en(escritura)
+        try:
+            almacen.guardar(coworking)
+            problemas.append(f"Corte {escritura}: el guardado no se corto")
+        except Corte:
+            pass
+        finally:
+            persistencia._escribir_json_atomico = escribir
+
+        # Reinicio: lo cargado tiene que ser lo guardado antes o lo de la foto nueva, archivo por archivo
+        cerrar(almacen, coworking)
+        almacen, coworking = abrir(directorio)
+        compras, stock, reservas, prox_id_reserva = estado(coworking)
+        esperado = (completo[0] if escritura > 1 else guardado[0], completo[1] if escritura > 2 else guardado[1],
+                    completo[2] if escritura > 3 else guardado[2], completo[3] if escritura > 3 else guardado[3])
+        if (compras, stock, reservas, prox_id_reserva) != esperado:
+            problemas.append(f"Corte {escritura}: al cargar quedo {(compras, stock, reservas, prox_id_reserva)}, "
+                             f"se esperaba {esperado}")
+
+        # Despues del reinicio, lo nuevo se guarda con un guardado incremental y tiene que sobrevivir
+        coworking.comprar_producto("C1", "P1", 1)
+        despues = estado(coworking)
+        almacen.guardar_cambios(coworking)
+        cerrar(almacen, coworking)
+        almacen, coworking = abrir(directorio)
+        if estado(coworking) != despues:
+            problemas.append(f"Corte {escritura}: despues del reinicio se cargo {estado(coworking)}, "
+                             f"se esperaba {despues}")
+        cerrar(almacen, coworking)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def probar_sin_reinicio(problemas):
+    """El proceso sigue despues de un guardado completo que fallo: los cambios siguientes no se pierden"""
+    directorio = tempfile.mkdtemp(prefix="guardado_")
+    try:
+        almacen, coworking = abrir(directorio)
+        coworking.agregar_cliente(Cliente("C1", "Cliente 1", "cliente1@correo.com", MembresiaPremium()))
+        almacen.guardar(coworking)
+        coworking.comprar_producto("C1", "P1", 1)
+        almacen.guardar_cambios(coworking)
+
+        escribir = cortar_en(2)
+        try:
+            almacen.guardar(coworking)
+        except Corte:
+            pass
+        finally:
+            persistencia._escribir_json_atomico = escribir
+
+        coworking.comprar_producto("C1", "P1", 2)
+        almacen.guardar_cambios(coworking)
+        esperado = estado(coworking)
+        cerrar(almacen, coworking)
+        almacen, coworking = abrir(directorio)
+        if estado(coworking) != esperado:
+            problemas.append(f"Sin reinicio: se cargo {estado(coworking)}, se esperaba {esperado}")
+        cerrar(almacen, coworking)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def main():
+    problemas = []
+    # Escrituras de la foto completa: clientes, productos, reservas y registro de cambios
+    for escritura in range(1, 5):
+        probar_corte(escritura, problemas)
+    probar_sin_reinicio(problemas)
+
+    if problemas:
+        print("FALLO:")
+        for problema in problemas:
+            print(f"  {problema}")
+        return 1
+    print("OK: un guardado completo cortado en cualquier punto no pierde lo ya guardado")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from models import Coworking, ClienteInhabilitadoError
+from persistencia import crear_almacen, _escribir_json_atomico
+from ventas import analisis_vacio, combinar_analisis
+
+#Red de sedes: cada sede es un Coworking con su propia carpeta de datos (sedes/<id_sede>/).
+#Las operaciones se envian a la sede que corresponde y los reportes de la red se arman
+#sumando los acumulados parciales de cada sede
+
+class SedeNoEncontradaError(Exception):
+    pass
+
+
+#Directorio compartido de clientes: sede de origen de cada cliente y otras sedes donde puede operar.
+#El cliente (membresia, entradas, deuda, compras) vive solo en su sede de origen
+
+class DirectorioClientes:
+    def __init__(self, archivo="sedes/directorio.json"):
+        self.archivo = archivo
+        self.clientes = {}
+        self._lock = threading.Lock()
+        # Hay cambios sin escribir: solo entonces guardar() reescribe el archivo
+        self._modificado = not os.path.exists(archivo)
+        if not self._modificado:
+            with open(archivo, "r", encoding='utf-8') as f:
+                self.clientes = json.load(f)
+
+    def registrar(self, id_cliente, id_sede, otras_sedes=()):
+        with self._lock:
+            if id_cliente in self.clientes:
+                raise ClienteInhabilitadoError("Cliente ya existe en la red")
+            self.clientes[id_cliente] = {"sede": id_sede, "otras_sedes": sorted(set(otras_sedes) - {id_sede})}
+            self._modificado = True
+
+    def agregar_si_falta(self, id_cliente, id_sede):
+        with self._lock:
+            if id_cliente not in self.clientes:
+                self.clientes[id_cliente] = {"sede": id_sede, "otras_sedes": []}
+                self._modificado = True
+
+    def quitar(self, id_cliente):
+        with self._lock:
+            if self.clientes.pop(id_cliente, None) is not None:
+                self._modificado = True
+
+    def permitir_sede(self, id_cliente, id_sede):
+        """Habilita al cliente para operar tambien en id_sede"""
+        with self._lock:
+            entrada = self.clientes.get(id_cliente)
+            if entrada is None:
+                raise ClienteInhabilitadoError("Cliente no encontrado")
+            if id_sede != entrada["sede"] and id_sede not in entrada["otras_sedes"]:
+                entrada["otras_sedes"] = sorted(entrada["otras_sedes"] + [id_sede])
+                self._modificado = True
+
+    def sede_de(self, id_cliente):
+        entrada = self.clientes.get(id_cliente)
+        return entrada["sede"] if entrada else None
+
+    def sedes_de(self, id_cliente):
+        """Sede de origen primero y luego las demas sedes habilitadas"""
+        entrada = self.clientes.get(id_cliente)
+        return [entrada["sede"]] + entrada["otras_sedes"] if entrada else []
+
+    def puede_operar(self, id_cliente, id_sede):
+        return id_sede in self.sedes_de(id_cliente)
+
+    def guardar(self):
+        """Reescribe el archivo solo si hubo altas, bajas o sedes habilitadas desde el ultimo guardado"""
+        with self._lock:
+            if not self._modificado:
+                return
+            datos = dict(self.clientes)
+            self._modificado = False
+        try:
+            _escribir_json_atomico(self.archivo, datos)
+        except Exception:
+            with self._lock:
+                self._modificado = True
+            raise
+
+    def __len__(self):
+        return len(self.clientes)
+
+
+class ClienteVisitante:
+    """Cliente de otra sede que aparece en las reservas de una sede mientras se carga la red.
+    Al terminar la carga RedCoworking lo reemplaza por el cliente real"""
+
+    def __init__(self, id_cliente):
+        self.id_cliente = id_cliente
+        self.nombre = id_cliente
+        self.reservas = []
+
+
+#Clase para la red de sedes
+
+class RedCoworking:
+    def __init__(self, directorio="sedes", tipo_almacen="json", fsync=False):
+        self.directorio = directorio
+        self.tipo_almacen = tipo_almacen
+        self.fsync = fsync
+        self.directorio_clientes = DirectorioClientes(os.path.join(directorio, "directorio.json"))
+        self.sedes = {}
+        self.almacenes = {}
+        self._visitantes = {}
+        self._lock = threading.Lock()
+
+    def _en_sedes(self, funcion, ids_sedes=None):
+        """Ejecuta funcion(id_sede, coworking) en todas las sedes a la vez y devuelve {id_sede: resultado}"""
+        ids_sedes = sorted(self.sedes) if ids_sedes is None else ids_sedes
+        if not ids_sedes:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(ids_sedes)) as hilos:
+            resultados = hilos.map(lambda id_sede: funcion(id_sede, self.sedes.get(id_sede)), ids_sedes)
+            return dict(zip(ids_sedes, resultados))
+
+    #Carga y guardado
+
+    def cargar(self, ids_sedes=None):
+        """Carga cada sede en su propio hilo. Sin ids se cargan todas las carpetas de la red"""
+        if ids_sedes is None:
+            os.makedirs(self.directorio, exist_ok=True)
+            ids_sedes = sorted(nombre for nombre in os.listdir(self.directorio)
+                               if os.path.isdir(os.path.join(self.directorio, nombre)))
+        inicio = time.perf_counter()
+        self._en_sedes(self._cargar_sede, ids_sedes)
+        self._resolver_visitantes()
+        print(f"{len(ids_sedes)} sedes cargadas en {time.perf_counter() - inicio:.2f} s")
+
+    def _cargar_sede(self, id_sede, _=None):
+        almacen = crear_almacen(self.tipo_almacen, os.path.join(self.directorio, id_sede), self.fsync)
+        coworking = Coworking(libro_ventas=almacen.crear_libro_ventas())
+        coworking.buscar_visitante = self._visitante
+        almacen.cargar(coworking)
+        with self._lock:
+            self.sedes[id_sede] = coworking
+            self.almacenes[id_sede] = almacen
+        # Clientes que no llegaron al directorio (corte antes de guardarlo): su sede es esta
+        for id_cliente in list(coworking.clientes):
+            self.directorio_clientes.agregar_si_falta(id_cliente, id_sede)
+        return coworking
+
+    def _visitante(self, id_cliente):
+        # Las sedes se cargan en paralelo: el cliente real puede no estar cargado todavia
+        with self._lock:
+            visitante = self._visitantes.get(id_cliente)
+            if visitante is None:
+                visitante = self._visitantes[id_cliente] = ClienteVisitante(id_cliente)
+            return visitante
+
+    def _resolver_visitantes(self):
+        with self._lock:
+            visitantes, self._visitantes = self._visitantes, {}
+        for id_cliente, visitante in visitantes.items():
+            cliente = self.buscar_cliente(id_cliente)
+            if cliente is None:
+                # Se conserva el visitante para no perder sus reservas al guardar
+                continue
+            for reserva in visitante.reservas:
+                reserva.cliente = cliente
+                cliente.reservas.append(reserva)
+
+    def agregar_sede(self, id_sede):
+        """Crea una sede nueva (con sus datos por defecto) o carga una existente"""
+        if id_sede in self.sedes:
+            raise ValueError(f"La sede {id_sede} ya existe")
+        coworking = self._cargar_sede(id_sede)
+        self._resolver_visitantes()
+        return coworking
+
+    def guardar(self):
+        self._en_sedes(lambda id_sede, coworking: self.almacenes[id_sede].guardar(coworking))
+        self.directorio_clientes.guardar()
+
+    def guardar_cambios(self):
+        cambios = self._en_sedes(lambda id_sede, coworking: self.almacenes[id_sede].guardar_cambios(coworking))
+        self.directorio_clientes.guardar()
+        return sum(cambios.values())
+
+    def cerrar(self):
+        for id_sede, coworking in self.sedes.items():
+            coworking.cerrar()
+            self.almacenes[id_sede].cerrar()
+
+    #Operaciones enviadas a su sede
+
+    def sede(self, id_sede):
+        coworking = self.sedes.get(id_sede)
+        if coworking is None:
+            raise SedeNoEncontradaError(f"Sede {id_sede} no encontrada")
+        return coworking
+
+    def registrar_cliente(self, id_sede, cliente, otras_sedes=()):
+        """Registra el cliente en su sede de origen; otras_sedes son las sedes donde tambien puede operar"""
+        coworking = self.sede(id_sede)
+        for otra in otras_sedes:
+            self.sede(otra)
+        self.directorio_clientes.registrar(cliente.id_cliente, id_sede, otras_sedes)
+        try:
+            coworking.agregar_cliente(cliente)
+        except ClienteInhabilitadoError:
+            self.directorio_clientes.quitar(cliente.id_cliente)
+            raise
+
+    def buscar_cliente(self, id_cliente):
+        id_sede = self.directorio_clientes.sede_de(id_cliente)
+        return self.sedes[id_sede].buscar_cliente(id_cliente) if id_sede in self.sedes else None
+
+    def _sede_cliente(self, id_cliente, id_sede=None):
+        """Coworking de origen del cliente, comprobando que pueda operar en id_sede"""
+        origen = self.directorio_clientes.sede_de(id_cliente)
+        if origen is None or origen not in self.sedes:
+            raise ClienteInhabilitadoError("Cliente no encontrado")
+        if id_sede is not None and not self.directorio_clientes.puede_operar(id_cliente, id_sede):
+            raise ClienteInhabilitadoError(f"El cliente no tiene acceso a la sede {id_sede}")
+        return self.sedes[origen]
+
+    def reservar_sala(self, id_sede, id_cliente, id_sala, fecha_hora, duracion_horas=1):
+        coworking = self.sede(id_sede)
+        origen = self._sede_cliente(id_cliente, id_sede)
+        return coworking.reservar_sala(id_cliente, id_sala, fecha_hora, duracion_horas, origen=origen)
+
+    def reservar_salas(self, id_sede, id_cliente, solicitudes):
+        coworking = self.sede(id_sede)
+        origen = self._sede_cliente(id_cliente, id_sede)
+        return coworking.reservar_salas(id_cliente, solicitudes, origen=origen)
+
+    def reservar_recurrente(self, id_sede, id_cliente, ids_salas, inicio, duracion_horas, hasta, cada_dias=7):
+        coworking = self.sede(id_sede)
+        origen = self._sede_cliente(id_cliente, id_sede)
+        return coworking.reservar_recurrente(id_cliente, ids_salas, inicio, duracion_horas, hasta, cada_dias, origen)
+
+    def comprar_producto(self, id_sede, id_cliente, id_producto, cantidad=1):
+        coworking = self.sede(id_sede)
+        origen = self._sede_cliente(id_cliente, id_sede)
+        return coworking.comprar_producto(id_cliente, id_producto, cantidad, origen=origen)
+
+    def comprar_productos(self, id_sede, id_cliente, items):
+        coworking = self.sede(id_sede)
+        origen = self._sede_cliente(id_cliente, id_sede)
+        return coworking.comprar_productos(id_cliente, items, origen=origen)
+
+    def pagar_renovacion(self, id_cliente, monto):
+        return self._sede_cliente(id_cliente).pagar_renovacion(id_cliente, monto)
+
+    def cancelar_membresia(self, id_cliente):
+        return self._sede_cliente(id_cliente).cancelar_membresia(id_cliente)
+
+    def renovar_membresias_automatico(self):
+        """Cada sede renueva a sus propios clientes"""
+        return self._en_sedes(lambda id_sede, coworking: coworking.renovar_membresias_automatico())
+
+    def obtener_ultimas_ventas_cliente(self, id_cliente, cantidad=20):
+        """Ventas mas recientes del cliente en todas las sedes donde opera, de la mas reciente a la mas antigua"""
+        listas = [self.sedes[id_sede].obtener_ultimas_ventas(cantidad, 0, id_cliente)
+                  for id_sede in self.directorio_clientes.sedes_de(id_cliente) if id_sede in self.sedes]
+        return list(islice(heapq.merge(*listas, key=lambda venta: venta["fecha"], reverse=True), cantidad))
+
+    #Reportes de la red: cada sede calcula sus acumulados y aqui solo se suman
+
+    def obtener_estadisticas(self, desde=None, hasta=None):
+        """Estadisticas de la red y de cada sede (en 'por_sede')"""
+        por_sede = {id_sede: coworking.obtener_estadisticas(desde, hasta)
+                    for id_sede, coworking in sorted(self.sedes.items())}
+        stats = {}
+        for id_sede, parcial in por_sede.items():
+            for clave, valor in parcial.items():
+                if isinstance(valor, dict):
+                    destino = stats.setdefault(clave, {})
+                    for nombre, cantidad in valor.items():
+                        destino[nombre] = destino.get(nombre, 0) + cantidad
+                elif isinstance(valor, list):
+                    stats.setdefault(clave, []).extend(f"{nombre} ({id_sede})" for nombre in valor)
+                else:
+                    stats[clave] = stats.get(clave, 0) + valor
+        stats["por_sede"] = por_sede
+        return stats
+
+    def analizar_ventas(self, desde=None, hasta=None):
+        """Totales de ventas de la red por tipo, cliente, producto y dia, mas el total de cada sede.
+        Cada sede analiza su propio historial (en paralelo) y solo viajan los resultados parciales"""
+        parciales = self._en_sedes(lambda id_sede, coworking: coworking.analizar_ventas(desde, hasta))
+        analisis = analisis_vacio()
+        analisis["por_sede"] = {}
+        for id_sede, parcial in parciales.items():
+            combinar_analisis(analisis, parcial)
+            analisis["por_sede"][id_sede] = {"total": parcial["total"], "cantidad": parcial["cantidad"]}
+        return analisis
+
+    def __iter__(self):
+        return iter(sorted(self.sedes.items()))
+
+
+def main(argumentos):
+    """Reporte de la red: python sedes.py [directorio]"""
+    red = RedCoworking(argumentos[0] if argumentos else "sedes")
+    red.cargar()
+    try:
+        stats = red.obtener_estadisticas()
+        print(f"\nRed: {len(red.sedes)} sedes - {stats.get('total_clientes', 0)} clientes "
+              f"- {stats.get('total_reservas', 0)} reservas - ventas ${stats.get('ventas_totales', 0)}")
+        for id_sede, parcial in stats["por_sede"].items():
+            print(f"  {id_sede}: {parcial['total_clientes']} clientes - {parcial['total_reservas']} reservas "
+                  f"- ventas ${parcial['ventas_totales']}")
+        if stats.get("productos_bajo_stock"):
+            print("Productos con stock bajo: " + ", ".join(stats["productos_bajo_stock"]))
+    finally:
+        red.cerrar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,443 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from urllib.parse import urlsplit, parse_qs
+from metricas import METRICAS
+from models import (Coworking, Cliente, MembresiaBasica, MembresiaEstandar, MembresiaPremium, MembresiaEstudiante,
+                    ClienteInhabilitadoError, SalaOcupadaError, PagoRechazadoError, ProductoAgotadoError,
+                    StockInsuficienteError, ReservaEnBloqueError)
+from persistencia import crear_almacen
+
+#Servicio HTTP/JSON local (asyncio) con las operaciones del coworking, para varias terminales a la vez
+
+TIPOS_MEMBRESIA = {
+    "Basica": MembresiaBasica,
+    "Estandar": MembresiaEstandar,
+    "Premium": MembresiaPremium,
+    "Estudiante": MembresiaEstudiante
+}
+
+ERRORES_NEGOCIO = (ClienteInhabilitadoError, SalaOcupadaError, PagoRechazadoError, ProductoAgotadoError,
+                   StockInsuficienteError, ValueError, KeyError, TypeError)
+
+TEXTOS_ESTADO = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                 409: "Conflict", 500: "Internal Server Error"}
+
+
+class ErrorHTTP(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def _a_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"No serializable: {type(valor).__name__}")
+
+
+def _reserva_a_dict(reserva):
+    return {
+        "id_reserva": reserva.id_reserva,
+        "id_cliente": reserva.cliente.id_cliente,
+        "id_sala": reserva.sala.id_sala,
+        "inicio": reserva.inicio,
+        "fin": reserva.fin,
+        "duracion_horas": reserva.duracion_horas
+    }
+
+
+def _cliente_a_dict(cliente):
+    return {
+        "id_cliente": cliente.id_cliente,
+        "nombre": cliente.nombre,
+        "correo": cliente.correo,
+        "membresia": cliente.membresia.tipo,
+        "activo": cliente.activo,
+        "entradas_usadas": cliente.entradas_usadas,
+        "deuda_renovacion": cliente.deuda_renovacion
+    }
+
+
+class ServicioCoworking:
+    def __init__(self, coworking, almacen, host="127.0.0.1", puerto=8080, hilos=8):
+        self.coworking = coworking
+        self.almacen = almacen
+        self.host = host
+        self.puerto = puerto
+        # Las operaciones corren en hilos (el nucleo es thread-safe) y el guardado en un hilo aparte
+        self._operaciones = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="operacion")
+        self._guardado = ThreadPoolExecutor(max_workers=1, thread_name_prefix="guardado")
+        self._guardado_pendiente = False
+        self._servidor = None
+        self.rutas = {
+            ("POST", "/clientes"): self._registrar_cliente,
+            ("GET", "/clientes"): self._ver_cliente,
+            ("POST", "/reservas"): self._reservar,
+            ("POST", "/reservas/lote"): self._reservar_lote,
+            ("POST", "/compras"): self._comprar,
+            ("POST", "/pagos"): self._pagar,
+            ("POST", "/cancelaciones"): self._cancelar,
+            ("POST", "/reposiciones"): self._reponer,
+            ("POST", "/stock/umbral"): self._umbral_stock,
+            ("GET", "/stock/pronostico"): self._pronostico_stock,
+            ("POST", "/stock/alertas"): self._alertas_stock,
+            ("GET", "/estadisticas"): self._estadisticas,
+            ("GET", "/ventas"): self._ventas,
+            ("GET", "/salas/libres"): self._salas_libres,
+            ("GET", "/salas/sugerencias"): self._sugerir_salas,
+            ("GET", "/ocupacion"): self._ocupacion,
+            ("GET", "/metricas"): self._metricas,
+            ("POST", "/perfil"): self._perfil
+        }
+
+    #Operaciones (se ejecutan en el pool de hilos)
+
+    def _registrar_cliente(self, datos, consulta):
+        tipo = TIPOS_MEMBRESIA.get(datos.get("membresia", "Basica"), MembresiaBasica)
+        cliente = Cliente(datos["id_cliente"], datos["nombre"], datos["correo"], tipo())
+        self.coworking.agregar_cliente(cliente)
+        return 201, _cliente_a_dict(cliente), True
+
+    def _ver_cliente(self, datos, consulta):
+        cliente = self.coworking.buscar_cliente(consulta.get("id_cliente", ""))
+        if not cliente:
+            raise ErrorHTTP(404, "Cliente no encontrado")
+        return 200, _cliente_a_dict(cliente), False
+
+    def _reservar(self, datos, consulta):
+        reserva = self.coworking.reservar_sala(
+            datos["id_cliente"], datos["id_sala"], datetime.fromisoformat(datos["inicio"]),
+            datos.get("duracion_horas", 1)
+        )
+        return 201, _reserva_a_dict(reserva), True
+
+    def _reservar_lote(self, datos, consulta):
+        """{"id_cliente", "reservas": [{"id_sala", "inicio", "duracion_horas"}, ...]} o, para una serie,
+        {"id_cliente", "salas": [...], "inicio", "duracion_horas", "hasta", "cada_dias"}. Todo o nada"""
+        try:
+            if "reservas" in datos:
+                reservas = self.coworking.reservar_salas(datos["id_cliente"], [
+                    (reserva["id_sala"], datetime.fromisoformat(reserva["inicio"]), reserva.get("duracion_horas", 1))
+                    for reserva in datos["reservas"]
+                ])
+            else:
+                reservas = self.coworking.reservar_recurrente(
+                    datos["id_cliente"], datos["salas"], datetime.fromisoformat(datos["inicio"]),
+                    datos.get("duracion_horas", 1), datetime.fromisoformat(datos["hasta"]), datos.get("cada_dias", 7)
+                )
+        except ReservaEnBloqueError as e:
+            return 409, {"error": str(e), "conflictos": e.conflictos}, False
+        return 201, {"reservas": [_reserva_a_dict(reserva) for reserva in reservas]}, True
+
+    def _comprar(self, datos, consulta):
+        compras = self.coworking.comprar_productos(datos["id_cliente"], [tuple(item) for item in datos["items"]])
+        return 201, {"compras": compras, "total": sum(compra["total"] for compra in compras)}, True
+
+    def _pagar(self, datos, consulta):
+        return 200, {"mensaje": self.coworking.pagar_renovacion(datos["id_cliente"], datos["monto"])}, True
+
+    def _cancelar(self, datos, consulta):
+        return 200, {"mensaje": self.coworking.cancelar_membresia(datos["id_cliente"])}, True
+
+    def _reponer(self, datos, consulta):
+        return 200, {"mensaje": self.coworking.reponer_stock(datos["id_producto"], datos["cantidad"])}, True
+
+    def _umbral_stock(self, datos, consulta):
+        return 200, {"mensaje": self.coworking.definir_umbral_stock(datos["id_producto"], datos["umbral"])}, True
+
+    def _pronostico_stock(self, datos, consulta):
+        """?plazo_reposicion_dias=3&dias_cobertura=14"""
+        pronostico = self.coworking.pronostico_stock(float(consulta.get("plazo_reposicion_dias", 3)),
+                                                     float(consulta.get("dias_cobertura", 14)))
+        return 200, {"productos": pronostico}, False
+
+    def _alertas_stock(self, datos, consulta):
+        """Entrega (y descarta) las alertas de stock bajo acumuladas desde la ultima consulta"""
+        return 200, {"alertas": self.coworking.tomar_alertas_stock()}, False
+
+    def _estadisticas(self, datos, consulta):
+        return 200, self.coworking.obtener_estadisticas(consulta.get("desde"), consulta.get("hasta")), False
+
+    def _ventas(self, datos, consulta):
+        cantidad = int(consulta.get("cantidad", 20))
+        pagina = int(consulta.get("pagina", 0))
+        ventas = self.coworking.obtener_ultimas_ventas(cantidad, pagina, consulta.get("id_cliente"))
+        return 200, {"ventas": ventas}, False
+
+    def _salas_libres(self, datos, consulta):
+        """?dias=AAAA-MM-DD,AAAA-MM-DD&desde=14:00&hasta=16:00&capacidad=4"""
+        dias = [date.fromisoformat(dia) for dia in consulta["dias"].split(",")]
+        salas = self.coworking.salas_libres(dias, datetime.strptime(consulta["desde"], "%H:%M").time(),
+                                            datetime.strptime(consulta["hasta"], "%H:%M").time(),
+                                            int(consulta.get("capacidad", 0)))
+        return 200, {"salas": [{"id_sala": sala.id_sala, "nombre": sala.nombre, "capacidad": sala.capacidad}
+                               for sala in salas]}, False
+
+    def _sugerir_salas(self, datos, consulta):
+        """?personas=4&inicio=AAAA-MM-DDTHH:MM&duracion_horas=2&flexibilidad_horas=3"""
+        opciones = self.coworking.sugerir_salas(
+            int(consulta["personas"]), datetime.fromisoformat(consulta["inicio"]),
+            float(consulta.get("duracion_horas", 1)), float(consulta.get("flexibilidad_horas", 0))
+        )
+        return 200, {"opciones": [{"id_sala": opcion["sala"].id_sala, "capacidad": opcion["sala"].capacidad,
+                                   "inicio": opcion["inicio"], "fin": opcion["fin"],
+                                   "desplazamiento_minutos": opcion["desplazamiento_minutos"]}
+                                  for opcion in opciones]}, False
+
+    def _ocupacion(self, datos, consulta):
+        """?desde=AAAA-MM-DD&hasta=AAAA-MM-DD (hasta excluida): porcentaje de uso por sala y mapa de calor"""
+        desde, hasta = date.fromisoformat(consulta["desde"]), date.fromisoformat(consulta["hasta"])
+        return 200, {"utilizacion": self.coworking.utilizacion_salas(desde, hasta),
+                     "mapa_calor": self.coworking.mapa_calor_ocupacion(desde, hasta)}, False
+
+    def _metricas(self, datos, consulta):
+        return 200, self.coworking.obtener_metricas(), False
+
+    def _perfil(self, datos, consulta):
+        """Inicia una captura de cProfile: {"segundos": 30, "archivo": "datos/perfil.prof"}"""
+        archivo = datos.get("archivo", "datos/perfil.prof")
+        METRICAS.iniciar_perfil(float(datos.get("segundos", 30)), archivo)
+        return 200, {"mensaje": f"Perfilando durante {datos.get('segundos', 30)} segundos en {archivo}"}, False
+
+    def _ejecutar(self, metodo, ruta, datos, consulta):
+        operacion = self.rutas.get((metodo, ruta))
+        if operacion is None:
+            if any(r == ruta for _, r in self.rutas):
+                raise ErrorHTTP(405, "Metodo no permitido")
+            raise ErrorHTTP(404, "Ruta no encontrada")
+        inicio = time.perf_counter()
+        try:
+            return operacion(datos, consulta)
+        except ErrorHTTP:
+            raise
+        except ERRORES_NEGOCIO as e:
+            estado = 400 if isinstance(e, (ValueError, KeyError, TypeError)) else 409
+            raise ErrorHTTP(estado, str(e) if not isinstance(e, KeyError) else f"Falta el campo {e}")
+        finally:
+            METRICAS.registrar(f"http {metodo} {ruta}", time.perf_counter() - inicio)
+
+    #Guardado en segundo plano
+
+    def _programar_guardado(self):
+        # Varios cambios seguidos se agrupan en un solo guardado incremental
+        if self._guardado_pendiente:
+            return
+        self._guardado_pendiente = True
+        asyncio.get_running_loop().run_in_executor(self._guardado, self._guardar)
+
+    def _guardar(self):
+        self._guardado_pendiente = False
+        try:
+            self.almacen.guardar_cambios(self.coworking)
+        except Exception as e:
+            print(f"Error al guardar cambios: {e}")
+
+    #HTTP
+
+    async def _atender(self, lector, escritor):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    linea = await lector.readline()
+                    if not linea:
+                        break
+                    metodo, destino, version = linea.decode("latin-1").split()
+                    cabeceras = {}
+                    while True:
+                        cabecera = await lector.readline()
+                        if cabecera in (b"\r\n", b"\n", b""):
+                            break
+                        nombre, _, valor = cabecera.decode("latin-1").partition(":")
+                        cabeceras[nombre.strip().lower()] = valor.strip()
+                    largo = int(cabeceras.get("content-length", 0))
+                    cuerpo = await lector.readexactly(largo) if largo else b""
+                except (ValueError, asyncio.IncompleteReadError):
+                    await self._responder(escritor, 400, {"error": "Peticion mal formada"}, False)
+                    break
+
+                mantener = (cabeceras.get("connection", "").lower() != "close"
+                            and version.upper() == "HTTP/1.1")
+                partes = urlsplit(destino)
+                consulta = {clave: valores[-1] for clave, valores in parse_qs(partes.query).items()}
+                try:
+                    datos = json.loads(cuerpo) if cuerpo else {}
+                    estado, respuesta, modifica = await loop.run_in_executor(
+                        self._operaciones, self._ejecutar, metodo.upper(), partes.path.rstrip("/") or "/",
+                        datos, consulta
+                    )
+                    if modifica:
+                        self._programar_guardado()
+                except json.JSONDecodeError:
+                    estado, respuesta = 400, {"error": "El cuerpo no es JSON valido"}
+                except ErrorHTTP as e:
+                    estado, respuesta = e.estado, {"error": str(e)}
+                except Exception as e:
+                    estado, respuesta = 500, {"error": str(e)}
+
+                await self._responder(escritor, estado, respuesta, mantener)
+                if not mantener:
+                    break
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        except asyncio.CancelledError:
+            # El servicio se esta deteniendo con la conexion abierta (keep-alive)
+            pass
+        finally:
+            escritor.close()
+
+    async def _responder(self, escritor, estado, respuesta, mantener):
+        cuerpo = json.dumps(respuesta, default=_a_json, ensure_ascii=False).encode("utf-8")
+        escritor.write(
+            f"HTTP/1.1 {estado} {TEXTOS_ESTADO.get(estado, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(cuerpo)}\r\n"
+            f"Connection: {'keep-alive' if mantener else 'close'}\r\n\r\n".encode("latin-1") + cuerpo
+        )
+        await escritor.drain()
+
+    async def iniciar(self):
+        self._servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+        self.puerto = self._servidor.sockets[0].getsockname()[1]
+        return self._servidor
+
+    async def detener(self):
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+        self._operaciones.shutdown()
+        self._guardado.shutdown()
+        METRICAS.detener_perfil()
+        self.almacen.guardar(self.coworking)
+
+
+#Cliente asyncio con conexion persistente (keep-alive), para usar el servicio y para pruebas de carga
+
+class ClienteHTTP:
+    def __init__(self, host="127.0.0.1", puerto=8080):
+        self.host = host
+        self.puerto = puerto
+        self._lector = None
+        self._escritor = None
+
+    async def conectar(self):
+        self._lector, self._escritor = await asyncio.open_connection(self.host, self.puerto)
+
+    async def pedir(self, metodo, ruta, datos=None):
+        if self._escritor is None:
+            await self.conectar()
+        cuerpo = json.dumps(datos, default=_a_json).encode("utf-8") if datos is not None else b""
+        self._escritor.write(
+            f"{metodo} {ruta} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n\r\n".encode("latin-1") + cuerpo
+        )
+        await self._escritor.drain()
+
+        estado = int((await self._lector.readline()).split()[1])
+        cabeceras = {}
+        while True:
+            cabecera = await self._lector.readline()
+            if cabecera in (b"\r\n", b""):
+                break
+            nombre, _, valor = cabecera.decode("latin-1").partition(":")
+            cabeceras[nombre.strip().lower()] = valor.strip()
+        respuesta = await self._lector.readexactly(int(cabeceras.get("content-length", 0)))
+        if cabeceras.get("connection") == "close":
+            await self.cerrar()
+        return estado, json.loads(respuesta)
+
+    async def cerrar(self):
+        if self._escritor is not None:
+            self._escritor.close()
+            self._escritor = None
+
+
+async def prueba_carga(host="127.0.0.1", puerto=8080, conexiones=20, peticiones=200):
+    """Lanza conexiones concurrentes que mezclan compras, reservas y consultas. Devuelve peticiones/s"""
+    async def terminal(numero):
+        cliente = ClienteHTTP(host, puerto)
+        id_cliente = f"carga{numero}"
+        await cliente.pedir("POST", "/clientes", {"id_cliente": id_cliente, "nombre": f"Carga {numero}",
+                                                  "correo": f"{id_cliente}@prueba", "membresia": "Premium"})
+        estados = {}
+        for i in range(peticiones):
+            if i % 4 == 0:
+                estado, _ = await cliente.pedir("POST", "/compras", {"id_cliente": id_cliente, "items": [["P3", 1]]})
+            elif i % 4 == 1:
+                estado, _ = await cliente.pedir("GET", "/estadisticas")
+            elif i % 4 == 2:
+                estado, _ = await cliente.pedir("GET", "/ventas?cantidad=20")
+            else:
+                estado, _ = await cliente.pedir("POST", "/reposiciones", {"id_producto": "P3", "cantidad": 1})
+            estados[estado] = estados.get(estado, 0) + 1
+        await cliente.cerrar()
+        return estados
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*(terminal(n) for n in range(conexiones)))
+    segundos = time.perf_counter() - inicio
+    estados = {}
+    for resultado in resultados:
+        for estado, cantidad in resultado.items():
+            estados[estado] = estados.get(estado, 0) + cantidad
+    total = conexiones * (peticiones + 1)
+    return {"peticiones": total, "segundos": segundos, "peticiones_por_segundo": total / segundos,
+            "estados": estados}
+
+
+async def _servir(host, puerto, tipo_almacen):
+    almacen = crear_almacen(tipo_almacen, fsync=os.environ.get("COWORKING_FSYNC") == "1")
+    coworking = Coworking(libro_ventas=almacen.crear_libro_ventas())
+    almacen.cargar(coworking)
+    servicio = ServicioCoworking(coworking, almacen, host, puerto)
+    servidor = await servicio.iniciar()
+    print(f"Servicio de coworking en http://{host}:{servicio.puerto}")
+
+    # Ctrl+C o SIGTERM detienen el servicio guardando los datos
+    detener = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(senal, detener.set)
+        except NotImplementedError:
+            pass
+    try:
+        async with servidor:
+            await detener.wait()
+    finally:
+        await servicio.detener()
+        coworking.cerrar()
+        almacen.cerrar()
+        print("Datos guardados. Servicio detenido")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio HTTP/JSON del coworking")
+    parser.add_argument("modo", nargs="?", choices=["servir", "carga"], default="servir")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8080)
+    parser.add_argument("--conexiones", type=int, default=20)
+    parser.add_argument("--peticiones", type=int, default=200)
+    argumentos = parser.parse_args()
+
+    if argumentos.modo == "carga":
+        resultado = asyncio.run(prueba_carga(argumentos.host, argumentos.puerto,
+                                             argumentos.conexiones, argumentos.peticiones))
+        print(f"{resultado['peticiones']} peticiones en {resultado['segundos']:.2f}s "
+              f"({resultado['peticiones_por_segundo']:.0f}/s) - estados: {resultado['estados']}")
+        return
+
+    try:
+        asyncio.run(_servir(argumentos.host, argumentos.puerto, os.environ.get("COWORKING_ALMACEN", "json")))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
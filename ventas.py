@@ -0,0 +1,896 @@
+import atexit
+import json
+import mmap
+import multiprocessing
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from itertools import chain, islice
+from metricas import METRICAS
+
+# Indice lateral (ventas.jsonl.idx): un registro fijo por venta con
+# posicion en el libro, marca de tiempo y crc32 del cliente
+FORMATO_INDICE = struct.Struct("<QdI")
+EPOCA = datetime(1970, 1, 1)
+# Las ventas se fechan antes de entrar a la cola, asi que dos hilos pueden escribirlas apenas desordenadas.
+# El indice guarda la mayor marca vista hasta cada venta (no decrece) y las busquedas por fecha
+# siguen leyendo este margen de segundos mas alla del limite
+TOLERANCIA_DESORDEN = 60
+# Intentos de escribir un grupo antes de informar el error a quienes lo esperan
+REINTENTOS_ESCRITURA = 3
+
+
+def _marca_tiempo(fecha):
+    """Segundos desde 1970 de una fecha (date, datetime o texto ISO), sin zona horaria"""
+    if isinstance(fecha, str):
+        fecha = datetime.fromisoformat(fecha)
+    elif not isinstance(fecha, datetime):
+        fecha = datetime(fecha.year, fecha.month, fecha.day)
+    return (fecha - EPOCA).total_seconds()
+
+
+def _crc_cliente(cliente_id):
+    return zlib.crc32(str(cliente_id).encode('utf-8'))
+
+
+def _mapear(archivo):
+    """mmap de solo lectura del archivo, o None si no existe o esta vacio"""
+    try:
+        f = open(archivo, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _entrada_indice(venta, longitud):
+    try:
+        marca = _marca_tiempo(venta["fecha"])
+    except (KeyError, TypeError, ValueError):
+        marca = 0.0
+    return longitud, marca, _crc_cliente(venta.get("cliente_id"))
+
+#Escritura de un grupo de ventas: se puede esperar hasta que este en disco
+
+class EscrituraVentas:
+    def __init__(self, libro=None):
+        self._hecha = threading.Event()
+        self._libro = libro
+        self.error = None
+        self.cantidad = 0
+
+    def marcar_hecha(self, error=None):
+        self.error = error
+        self._hecha.set()
+
+    @property
+    def hecha(self):
+        return self._hecha.is_set()
+
+    def esperar(self, timeout=None):
+        """Espera a que el grupo quede escrito (y sincronizado si el libro usa fsync).
+        Devuelve False si se agota el tiempo; relanza el error si la escritura fallo"""
+        if not self._hecha.is_set() and self._libro is not None:
+            # Quien espera no necesita que el grupo siga creciendo: se escribe ya, y las ventas
+            # que lleguen mientras tanto forman el grupo siguiente
+            self._libro._adelantar(self)
+        if not self._hecha.wait(timeout):
+            return False
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+def escritura_hecha(cantidad=0):
+    escritura = EscrituraVentas()
+    escritura.cantidad = cantidad
+    escritura.marcar_hecha()
+    return escritura
+
+
+#Libro de ventas del negocio en formato JSON Lines (una venta por linea).
+#Las ventas se escriben en grupos desde un hilo aparte: cuando se juntan tamano_grupo ventas,
+#cuando la mas antigua lleva intervalo segundos esperando o cuando se llama a flush().
+#Con fsync=True cada grupo se sincroniza con el disco. tamano_grupo=1 escribe cada venta al momento
+
+class LibroVentas:
+    def __init__(self, archivo="datos/ventas.jsonl", archivo_antiguo="datos/ventas.json",
+                 tamano_grupo=256, intervalo=0.01, fsync=False):
+        self.archivo = archivo
+        self.archivo_antiguo = archivo_antiguo
+        self.tamano_grupo = tamano_grupo
+        self.intervalo = intervalo
+        self.fsync = fsync
+        self._archivo_abierto = None
+        # Escritor serializado: una sola escritura en curso sobre el archivo
+        self._lock = threading.Lock()
+        # Cola del escritor en segundo plano (protegida por _condicion)
+        self._condicion = threading.Condition()
+        self._pendientes = []
+        self._cantidad_pendiente = 0
+        self._grupo = EscrituraVentas(self)
+        self._ultimo_grupo = escritura_hecha()
+        self._primer_pendiente = 0
+        self._forzar = False
+        self._cerrando = False
+        self._escritor = None
+        self.archivo_indice = archivo + ".idx"
+        self._indice_abierto = None
+        self._ultima_marca = 0.0
+        self._migrar_formato_antiguo()
+        self._sincronizar_indice()
+
+    def _migrar_formato_antiguo(self):
+        """Convierte un ventas.json existente (lista JSON) al libro JSON Lines"""
+        if not self.archivo_antiguo or not os.path.exists(self.archivo_antiguo):
+            return
+        if os.path.exists(self.archivo):
+            return
+
+        with open(self.archivo_antiguo, "r", encoding='utf-8') as f:
+            ventas = json.load(f)
+
+        temporal = self.archivo + ".tmp"
+        with open(temporal, "w", encoding='utf-8') as f:
+            for venta in ventas:
+                f.write(json.dumps(venta, ensure_ascii=False) + "\n")
+        os.replace(temporal, self.archivo)
+        os.replace(self.archivo_antiguo, self.archivo_antiguo + ".migrado")
+        print(f"Historial de ventas migrado a {self.archivo} ({len(ventas)} ventas)")
+
+    def _abrir(self):
+        # El libro y su indice se abren una sola vez en modo append y se reutilizan
+        if self._archivo_abierto is None:
+            directorio = os.path.dirname(self.archivo)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            self._archivo_abierto = open(self.archivo, "ab")
+            self._archivo_abierto.seek(0, os.SEEK_END)
+            self._indice_abierto = open(self.archivo_indice, "ab")
+        return self._archivo_abierto
+
+    def _escribir(self, texto, entradas):
+        """Agrega las lineas al libro y sus registros al indice. El libro va primero: un corte entre
+        ambos deja ventas sin indexar, que se indexan al abrir el libro la proxima vez"""
+        with self._lock:
+            f = self._abrir()
+            inicio = posicion = f.tell()
+            inicio_indice = self._indice_abierto.tell()
+            ultima_marca = self._ultima_marca
+            try:
+                f.write(texto)
+                f.flush()
+                registros = []
+                for longitud, marca, crc in entradas:
+                    self._ultima_marca = max(self._ultima_marca, marca)
+                    registros.append(FORMATO_INDICE.pack(posicion, self._ultima_marca, crc))
+                    posicion += longitud
+                self._indice_abierto.write(b"".join(registros))
+                self._indice_abierto.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                    os.fsync(self._indice_abierto.fileno())
+            except Exception:
+                # Un grupo fallido no deja lineas a medias: el libro y el indice vuelven a como estaban
+                self._ultima_marca = ultima_marca
+                self._descartar_desde(inicio, inicio_indice)
+                raise
+        METRICAS.sumar_bytes("escritos", len(texto) + FORMATO_INDICE.size * len(entradas))
+
+    def _descartar_desde(self, posicion, posicion_indice):
+        for archivo in (self._archivo_abierto, self._indice_abierto):
+            try:
+                archivo.close()
+            except Exception:
+                pass
+        self._archivo_abierto = self._indice_abierto = None
+        for ruta, tamano in ((self.archivo, posicion), (self.archivo_indice, posicion_indice)):
+            try:
+                with open(ruta, "r+b") as archivo:
+                    archivo.truncate(tamano)
+            except OSError:
+                pass  # Si tampoco se puede cortar, _sincronizar_indice descarta la linea incompleta al abrir
+
+    def _sincronizar_indice(self):
+        """Indexa las ventas del libro que aun no estan en el indice (todas la primera vez).
+        Si el indice no corresponde al libro se rehace desde cero"""
+        try:
+            tamano_libro = os.path.getsize(self.archivo)
+        except OSError:
+            tamano_libro = 0
+        try:
+            tamano_indice = os.path.getsize(self.archivo_indice)
+        except OSError:
+            tamano_indice = 0
+
+        if not os.path.exists(self.archivo):
+            if tamano_indice:
+                os.remove(self.archivo_indice)
+            return
+
+        cantidad = tamano_indice // FORMATO_INDICE.size
+        cubierto = 0
+        with open(self.archivo, "rb") as libro, open(self.archivo_indice, "ab+") as indice:
+            if cantidad:
+                indice.seek((cantidad - 1) * FORMATO_INDICE.size)
+                posicion, marca, crc = FORMATO_INDICE.unpack(indice.read(FORMATO_INDICE.size))
+                libro.seek(posicion)
+                venta = self._decodificar(libro.readline()) if posicion < tamano_libro else None
+                if venta is None or _crc_cliente(venta.get("cliente_id")) != crc:
+                    cantidad = 0
+                else:
+                    cubierto = libro.tell()
+                    self._ultima_marca = marca
+            # Registros sobrantes (indice cortado a mitad o que no corresponde al libro)
+            indice.truncate(cantidad * FORMATO_INDICE.size)
+            if cubierto >= tamano_libro:
+                return
+
+            libro.seek(cubierto)
+            registros = []
+            posicion = cubierto
+            for linea in libro:
+                if not linea.endswith(b"\n"):
+                    break  # Linea a medio escribir al final del libro
+                venta = self._decodificar(linea)
+                if venta is not None:
+                    longitud, marca, crc = _entrada_indice(venta, len(linea))
+                    self._ultima_marca = max(self._ultima_marca, marca)
+                    registros.append(FORMATO_INDICE.pack(posicion, self._ultima_marca, crc))
+                posicion += len(linea)
+            indice.seek(0, os.SEEK_END)
+            indice.write(b"".join(registros))
+
+    def registrar(self, venta):
+        """Encola la venta. Devuelve la EscrituraVentas de su grupo"""
+        return self.registrar_lote([venta])
+
+    def registrar_lote(self, ventas):
+        """Encola varias ventas; todas van en el mismo grupo. Devuelve la EscrituraVentas del grupo.
+        Si el grupo no se puede escribir sus ventas se descartan y el error llega a quien lo espera"""
+        lineas = [(json.dumps(venta, ensure_ascii=False) + "\n").encode('utf-8') for venta in ventas]
+        texto = b"".join(lineas)
+        entradas = [_entrada_indice(venta, len(linea)) for venta, linea in zip(ventas, lineas)]
+        if self.tamano_grupo <= 1:
+            self._escribir(texto, entradas)
+            return escritura_hecha(len(ventas))
+
+        with self._condicion:
+            if self._cerrando:
+                raise ValueError("El libro de ventas esta cerrado")
+            if self._escritor is None:
+                self._escritor = threading.Thread(target=self._escribir_grupos, name="libro-ventas", daemon=True)
+                self._escritor.start()
+                # Si el programa termina sin cerrar el libro, lo pendiente se escribe igual
+                atexit.register(self.cerrar)
+            primera = not self._pendientes
+            if primera:
+                self._primer_pendiente = time.monotonic()
+            self._pendientes.append((texto, entradas))
+            self._cantidad_pendiente += len(ventas)
+            grupo = self._grupo
+            grupo.cantidad += len(ventas)
+            # Se despierta al escritor para que empiece a contar el intervalo o porque el grupo ya esta lleno
+            if primera or self._cantidad_pendiente >= self.tamano_grupo:
+                self._condicion.notify()
+        return grupo
+
+    def _escribir_grupos(self):
+        """Hilo escritor: junta las ventas pendientes y las escribe con una sola escritura por grupo"""
+        while True:
+            with self._condicion:
+                while True:
+                    if self._pendientes:
+                        espera = self._primer_pendiente + self.intervalo - time.monotonic()
+                        if (self._cantidad_pendiente >= self.tamano_grupo or self._forzar or self._cerrando
+                                or espera <= 0):
+                            break
+                        self._condicion.wait(espera)
+                    elif self._cerrando:
+                        return
+                    else:
+                        self._condicion.wait()
+                pendientes, grupo = self._pendientes, self._grupo
+                self._pendientes, self._cantidad_pendiente = [], 0
+                self._grupo = EscrituraVentas(self)
+                self._ultimo_grupo = grupo
+                self._forzar = False
+            texto = b"".join(texto for texto, _ in pendientes)
+            entradas = [entrada for _, entradas_grupo in pendientes for entrada in entradas_grupo]
+            error = None
+            for intento in range(REINTENTOS_ESCRITURA):
+                try:
+                    self._escribir(texto, entradas)
+                    error = None
+                    break
+                except Exception as e:
+                    # Cualquier error: si el hilo muriera, quien espera el grupo quedaria bloqueado
+                    error = e
+                    if intento + 1 < REINTENTOS_ESCRITURA:
+                        time.sleep(0.05 * (intento + 1))
+            if error is not None:
+                # Quienes esperan el grupo deshacen sus operaciones; los flush siguientes no heredan el error
+                with self._condicion:
+                    if self._ultimo_grupo is grupo:
+                        self._ultimo_grupo = escritura_hecha()
+            grupo.marcar_hecha(error)
+
+    def _adelantar(self, grupo):
+        with self._condicion:
+            if grupo is self._grupo and self._pendientes:
+                self._forzar = True
+                self._condicion.notify()
+
+    def flush(self, timeout=None):
+        """Escribe ya lo pendiente y espera a que este en disco. Devuelve False si se agota el tiempo"""
+        with self._condicion:
+            if self._pendientes:
+                grupo = self._grupo
+                self._forzar = True
+                self._condicion.notify()
+            else:
+                # Los grupos se escriben en orden: basta esperar al ultimo que salio de la cola
+                grupo = self._ultimo_grupo
+        return grupo.esperar(timeout)
+
+    def iterar(self):
+        """Recorre las ventas del libro una a una sin cargarlo completo en memoria"""
+        self.flush()
+        try:
+            f = open(self.archivo, "r", encoding='utf-8')
+        except FileNotFoundError:
+            return
+        leidos = 0
+        try:
+            with f:
+                for linea in f:
+                    leidos += len(linea)
+                    linea = linea.strip()
+                    if not linea:
+                        continue
+                    try:
+                        yield json.loads(linea)
+                    except json.JSONDecodeError:
+                        # Linea incompleta (por ejemplo, un cierre abrupto a mitad de escritura)
+                        continue
+        finally:
+            METRICAS.sumar_bytes("leidos", leidos)
+
+    def _decodificar(self, linea):
+        linea = linea.strip()
+        if not linea:
+            return None
+        try:
+            return json.loads(linea)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+
+    @contextmanager
+    def _vista(self):
+        """Libro e indice mapeados en memoria (solo lectura) tal como estan ahora en disco"""
+        self.flush()
+        with self._lock:
+            # El indice nunca adelanta al libro: se escribe despues de cada grupo
+            vista = VistaVentas(_mapear(self.archivo), _mapear(self.archivo_indice))
+        try:
+            yield vista
+        finally:
+            vista.cerrar()
+
+    def recientes(self, cliente_id=None, saltar=0):
+        """Recorre las ventas de la mas reciente a la mas antigua, salteando las primeras 'saltar'.
+        Sin cliente el salto es directo; con cliente_id el resto se descarta mirando el crc del indice"""
+        with self._vista() as vista:
+            crc = _crc_cliente(cliente_id) if cliente_id is not None else None
+            if crc is None:
+                posiciones = range(len(vista) - 1 - saltar, -1, -1)
+                saltar = 0
+            else:
+                posiciones = range(len(vista) - 1, -1, -1)
+            for i in posiciones:
+                if crc is not None and vista.crc(i) != crc:
+                    continue
+                venta = vista.venta(i)
+                if venta is None or (cliente_id is not None and venta["cliente_id"] != cliente_id):
+                    continue
+                if saltar:
+                    saltar -= 1
+                    continue
+                yield venta
+
+    def ultimas(self, cantidad=20, pagina=0, cliente_id=None):
+        """Pagina de las ventas mas recientes (pagina 0 = las ultimas). Solo se decodifican las de la pagina"""
+        return list(islice(self.recientes(cliente_id, cantidad * pagina), cantidad))
+
+    def consultar(self, tipo=None, cliente_id=None, desde=None, hasta=None):
+        """Ventas filtradas por tipo, cliente y rango de fechas ISO [desde, hasta).
+        El rango se ubica con busqueda binaria en el indice y el cliente con su crc, asi que solo
+        se decodifican las ventas candidatas"""
+        with self._vista() as vista:
+            inicio = vista.primera_desde(_marca_tiempo(desde)) if desde is not None else 0
+            limite = _marca_tiempo(hasta) + TOLERANCIA_DESORDEN if hasta is not None else None
+            crc = _crc_cliente(cliente_id) if cliente_id is not None else None
+            for i in range(inicio, len(vista)):
+                if limite is not None and vista.marca(i) >= limite:
+                    break
+                if crc is not None and vista.crc(i) != crc:
+                    continue
+                venta = vista.venta(i)
+                if venta is None:
+                    continue
+                if tipo is not None and venta["tipo"] != tipo:
+                    continue
+                if cliente_id is not None and venta["cliente_id"] != cliente_id:
+                    continue
+                if desde is not None and venta["fecha"] < str(desde):
+                    continue
+                if hasta is not None and venta["fecha"] >= str(hasta):
+                    continue
+                yield venta
+
+    def cantidad(self):
+        with self._vista() as vista:
+            return len(vista)
+
+    def totales_por_tipo(self):
+        totales = {}
+        for venta in self.iterar():
+            totales[venta["tipo"]] = totales.get(venta["tipo"], 0) + venta["monto"]
+        return totales
+
+    def resumen_por_periodo(self):
+        """Construye los acumulados diarios y mensuales con una sola lectura del libro"""
+        resumen = ResumenVentas()
+        for venta in self.iterar():
+            resumen.registrar(venta)
+        return resumen
+
+    def analizar(self, desde=None, hasta=None, procesos=None):
+        """Totales por tipo, cliente, producto y dia de las ventas en [desde, hasta)"""
+        self.flush()
+        return _analizar_archivo(self.archivo, _texto_fecha(desde), _texto_fecha(hasta))
+
+    def tamano_bytes(self):
+        self.flush()
+        try:
+            return os.path.getsize(self.archivo)
+        except OSError:
+            return 0
+
+    def cerrar(self):
+        """Escribe lo pendiente, detiene el hilo escritor y cierra el archivo"""
+        with self._condicion:
+            self._cerrando = True
+            self._condicion.notify()
+            escritor, self._escritor = self._escritor, None
+        if escritor is not None:
+            escritor.join()
+            atexit.unregister(self.cerrar)
+        with self._condicion:
+            self._cerrando = False
+        with self._lock:
+            if self._archivo_abierto is not None:
+                self._archivo_abierto.close()
+                self._indice_abierto.close()
+                self._archivo_abierto = None
+                self._indice_abierto = None
+
+
+#Lectura de ventas sueltas sobre el libro y el indice mapeados en memoria
+
+class VistaVentas:
+    def __init__(self, mapa_libro, mapa_indice):
+        self.mapa_libro = mapa_libro
+        self.mapa_indice = mapa_indice
+        self._cantidad = 0
+        if mapa_libro is not None and mapa_indice is not None:
+            self._cantidad = len(mapa_indice) // FORMATO_INDICE.size
+
+    def __len__(self):
+        return self._cantidad
+
+    def registro(self, i):
+        return FORMATO_INDICE.unpack_from(self.mapa_indice, i * FORMATO_INDICE.size)
+
+    def marca(self, i):
+        return self.registro(i)[1]
+
+    def crc(self, i):
+        return self.registro(i)[2]
+
+    def venta(self, i):
+        """Decodifica solo la venta i, leyendo su linea directamente del mapa del libro"""
+        posicion = self.registro(i)[0]
+        fin = self.mapa_libro.find(b"\n", posicion)
+        linea = self.mapa_libro[posicion:fin if fin != -1 else len(self.mapa_libro)]
+        METRICAS.sumar_bytes("leidos", len(linea))
+        try:
+            return json.loads(linea)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+
+    def primera_desde(self, marca):
+        """Busqueda binaria de la primera venta con marca >= la dada (las marcas del indice no decrecen)"""
+        bajo, alto = 0, self._cantidad
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self.marca(medio) < marca:
+                bajo = medio + 1
+            else:
+                alto = medio
+        return bajo
+
+    def cerrar(self):
+        for mapa in (self.mapa_libro, self.mapa_indice):
+            if mapa is not None:
+                mapa.close()
+
+
+#Analisis de un archivo del libro. Son funciones sueltas para poder ejecutarlas en otros procesos
+
+def _texto_fecha(fecha):
+    return str(fecha) if fecha is not None else None
+
+
+def analisis_vacio():
+    return {"total": 0, "cantidad": 0, "por_tipo": {}, "por_cliente": {}, "por_producto": {}, "por_dia": {}}
+
+
+def _leer_archivo(archivo, desde=None, hasta=None):
+    try:
+        f = open(archivo, "r", encoding='utf-8')
+    except FileNotFoundError:
+        return
+    with f:
+        for linea in f:
+            try:
+                venta = json.loads(linea)
+            except json.JSONDecodeError:
+                continue
+            if desde is not None and venta["fecha"] < desde:
+                continue
+            if hasta is not None and venta["fecha"] >= hasta:
+                continue
+            yield venta
+
+
+def _analizar_archivo(archivo, desde=None, hasta=None):
+    """Acumulados de las ventas de un archivo en [desde, hasta) (fechas ISO como texto)"""
+    analisis = analisis_vacio()
+    por_tipo, por_cliente = analisis["por_tipo"], analisis["por_cliente"]
+    por_producto, por_dia = analisis["por_producto"], analisis["por_dia"]
+    for venta in _leer_archivo(archivo, desde, hasta):
+        monto = venta["monto"]
+        analisis["total"] += monto
+        analisis["cantidad"] += 1
+        por_tipo[venta["tipo"]] = por_tipo.get(venta["tipo"], 0) + monto
+        por_cliente[venta["cliente_id"]] = por_cliente.get(venta["cliente_id"], 0) + monto
+        dia = venta["fecha"][:10]
+        por_dia[dia] = por_dia.get(dia, 0) + monto
+        id_producto = venta.get("producto_id")
+        if id_producto is not None:
+            producto = por_producto.get(id_producto)
+            if producto is None:
+                producto = por_producto[id_producto] = {"unidades": 0, "monto": 0}
+            producto["unidades"] += venta.get("cantidad", 1)
+            producto["monto"] += monto
+    return analisis
+
+
+def combinar_analisis(analisis, parcial):
+    """Suma un resultado parcial de _analizar_archivo sobre otro"""
+    analisis["total"] += parcial["total"]
+    analisis["cantidad"] += parcial["cantidad"]
+    for clave in ("por_tipo", "por_cliente", "por_dia"):
+        destino = analisis[clave]
+        for nombre, monto in parcial[clave].items():
+            destino[nombre] = destino.get(nombre, 0) + monto
+    for id_producto, datos in parcial["por_producto"].items():
+        producto = analisis["por_producto"].setdefault(id_producto, {"unidades": 0, "monto": 0})
+        producto["unidades"] += datos["unidades"]
+        producto["monto"] += datos["monto"]
+    return analisis
+
+
+def _resumir_archivo(archivo):
+    """Filas (dia, tipo, cliente, monto, cantidad) del archivo, para armar un ResumenVentas"""
+    filas = {}
+    for venta in _leer_archivo(archivo):
+        clave = (venta["fecha"][:10], venta["tipo"], venta["cliente_id"])
+        fila = filas.get(clave)
+        if fila is None:
+            filas[clave] = [venta["monto"], 1]
+        else:
+            fila[0] += venta["monto"]
+            fila[1] += 1
+    return [clave + tuple(fila) for clave, fila in filas.items()]
+
+
+#Libro de ventas dividido en un archivo por mes (datos/ventas/AAAA-MM.jsonl, cada uno con su indice).
+#Misma interfaz que LibroVentas. Los analisis de todo el historial se reparten entre procesos,
+#uno por mes, y se combinan los resultados parciales
+
+# Por debajo de este tamano no vale la pena arrancar procesos
+UMBRAL_PARALELO = 8 * 1024 * 1024
+
+# Un solo grupo de procesos por programa, compartido por todos los libros (p. ej. las sedes de sedes.py)
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def _pool_analisis(procesos):
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            # spawn: los procesos no heredan los hilos (escritores, servicio) del proceso principal
+            _pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+class LibroVentasPorMes:
+    def __init__(self, directorio="datos/ventas", archivo_unico="datos/ventas.jsonl",
+                 archivo_antiguo="datos/ventas.json", procesos=None, **opciones_libro):
+        self.directorio = directorio
+        self.procesos = procesos or os.cpu_count() or 1
+        self.opciones_libro = opciones_libro
+        self._meses = {}
+        self._lock = threading.Lock()
+        self._migrar_libro_unico(archivo_unico, archivo_antiguo)
+        if os.path.isdir(directorio):
+            for nombre in sorted(os.listdir(directorio)):
+                if nombre.endswith(".jsonl"):
+                    self._mes(nombre[:-len(".jsonl")])
+
+    def _migrar_libro_unico(self, archivo_unico, archivo_antiguo):
+        """Reparte el libro de un solo archivo (o el ventas.json de antes) en archivos por mes.
+        Se arma en una carpeta temporal que se renombra al terminar: un corte a mitad no deja nada a medias"""
+        if os.path.isdir(self.directorio):
+            return
+        fuentes = []
+        if archivo_unico and os.path.exists(archivo_unico):
+            fuentes.append((archivo_unico, _leer_archivo(archivo_unico)))
+        elif archivo_antiguo and os.path.exists(archivo_antiguo):
+            with open(archivo_antiguo, "r", encoding='utf-8') as f:
+                fuentes.append((archivo_antiguo, iter(json.load(f))))
+        if not fuentes:
+            return
+
+        temporal = self.directorio + ".migrando"
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        libros = {}
+        cantidad = 0
+        for archivo, ventas in fuentes:
+            lotes = {}
+            for venta in ventas:
+                mes = venta["fecha"][:7]
+                lote = lotes.setdefault(mes, [])
+                lote.append(venta)
+                cantidad += 1
+                if len(lote) == 10000:
+                    libros.setdefault(mes, LibroVentas(os.path.join(temporal, mes + ".jsonl"), None, tamano_grupo=1))
+                    libros[mes].registrar_lote(lote)
+                    lotes[mes] = []
+            for mes, lote in lotes.items():
+                if lote:
+                    libros.setdefault(mes, LibroVentas(os.path.join(temporal, mes + ".jsonl"), None, tamano_grupo=1))
+                    libros[mes].registrar_lote(lote)
+        for libro in libros.values():
+            libro.cerrar()
+        os.replace(temporal, self.directorio)
+        for archivo, _ in fuentes:
+            os.replace(archivo, archivo + ".migrado")
+        if archivo_unico and os.path.exists(archivo_unico + ".idx"):
+            os.remove(archivo_unico + ".idx")
+        print(f"Historial de ventas dividido por mes en {self.directorio} ({cantidad} ventas)")
+
+    def _mes(self, mes):
+        with self._lock:
+            libro = self._meses.get(mes)
+            if libro is None:
+                libro = LibroVentas(os.path.join(self.directorio, mes + ".jsonl"), None, **self.opciones_libro)
+                self._meses[mes] = libro
+            return libro
+
+    def _libros(self, desde=None, hasta=None):
+        """Libros de los meses que tocan [desde, hasta), del mas antiguo al mas reciente"""
+        desde = _texto_fecha(desde)[:7] if desde is not None else None
+        hasta = _texto_fecha(hasta) if hasta is not None else None
+        with self._lock:
+            meses = sorted(self._meses.items())
+        return [libro for mes, libro in meses
+                if (desde is None or mes >= desde) and (hasta is None or mes < hasta[:7] or (mes == hasta[:7] and hasta[7:] > "-01"))]
+
+    #Escritura
+
+    def registrar(self, venta):
+        return self._mes(venta["fecha"][:7]).registrar(venta)
+
+    def registrar_lote(self, ventas):
+        """Encola las ventas en el archivo de su mes. Devuelve una escritura que se puede esperar"""
+        por_mes = {}
+        for venta in ventas:
+            por_mes.setdefault(venta["fecha"][:7], []).append(venta)
+        escrituras = [self._mes(mes).registrar_lote(lote) for mes, lote in por_mes.items()]
+        return escrituras[0] if len(escrituras) == 1 else EscriturasVentas(escrituras)
+
+    def flush(self, timeout=None):
+        return all([libro.flush(timeout) for libro in self._libros()])
+
+    #Lectura
+
+    def iterar(self):
+        return chain.from_iterable(libro.iterar() for libro in self._libros())
+
+    def recientes(self, cliente_id=None, saltar=0):
+        for libro in reversed(self._libros()):
+            if cliente_id is None and saltar:
+                # Sin filtro los meses enteros se saltan por su cantidad, sin leerlos
+                cantidad = libro.cantidad()
+                if saltar >= cantidad:
+                    saltar -= cantidad
+                    continue
+            for venta in libro.recientes(cliente_id, saltar if cliente_id is None else 0):
+                if cliente_id is not None and saltar:
+                    saltar -= 1
+                    continue
+                yield venta
+            if cliente_id is None:
+                saltar = 0
+
+    def ultimas(self, cantidad=20, pagina=0, cliente_id=None):
+        return list(islice(self.recientes(cliente_id, cantidad * pagina), cantidad))
+
+    def consultar(self, tipo=None, cliente_id=None, desde=None, hasta=None):
+        return chain.from_iterable(libro.consultar(tipo, cliente_id, desde, hasta)
+                                   for libro in self._libros(desde, hasta))
+
+    def cantidad(self):
+        return sum(libro.cantidad() for libro in self._libros())
+
+    def tamano_bytes(self):
+        return sum(libro.tamano_bytes() for libro in self._libros())
+
+    #Analisis en paralelo
+
+    def _en_paralelo(self, funcion, argumentos, procesos=None):
+        """Aplica funcion a cada tupla de argumentos, en varios procesos si hay datos suficientes"""
+        procesos = procesos or self.procesos
+        tamano = sum(os.path.getsize(args[0]) for args in argumentos if os.path.exists(args[0]))
+        if procesos <= 1 or len(argumentos) < 2 or tamano < UMBRAL_PARALELO:
+            return [funcion(*args) for args in argumentos]
+        return list(_pool_analisis(self.procesos).map(funcion, *zip(*argumentos)))
+
+    def analizar(self, desde=None, hasta=None, procesos=None):
+        """Totales por tipo, cliente, producto y dia de las ventas en [desde, hasta), un proceso por mes"""
+        libros = self._libros(desde, hasta)
+        for libro in libros:
+            libro.flush()
+        argumentos = [(libro.archivo, _texto_fecha(desde), _texto_fecha(hasta)) for libro in libros]
+        analisis = analisis_vacio()
+        for parcial in self._en_paralelo(_analizar_archivo, argumentos, procesos):
+            combinar_analisis(analisis, parcial)
+        return analisis
+
+    def totales_por_tipo(self):
+        return self.analizar()["por_tipo"]
+
+    def resumen_por_periodo(self):
+        """Acumulados diarios y mensuales: cada mes se resume en su propio proceso"""
+        libros = self._libros()
+        for libro in libros:
+            libro.flush()
+        resumen = ResumenVentas()
+        for filas in self._en_paralelo(_resumir_archivo, [(libro.archivo,) for libro in libros]):
+            for dia, tipo, cliente_id, monto, cantidad in filas:
+                resumen.agregar(dia, tipo, cliente_id, monto, cantidad)
+        return resumen
+
+    def cerrar(self):
+        for libro in self._libros():
+            libro.cerrar()
+
+
+class EscriturasVentas:
+    """Escritura de un lote repartido en varios meses: termina cuando terminan todas"""
+
+    def __init__(self, escrituras):
+        self.escrituras = escrituras
+        self.cantidad = sum(escritura.cantidad for escritura in escrituras)
+
+    @property
+    def hecha(self):
+        return all(escritura.hecha for escritura in self.escrituras)
+
+    def esperar(self, timeout=None):
+        limite = time.monotonic() + timeout if timeout is not None else None
+        for escritura in self.escrituras:
+            restante = max(0, limite - time.monotonic()) if limite is not None else None
+            if not escritura.esperar(restante):
+                return False
+        return True
+
+
+#Acumulados de ventas por dia y por mes, separados por tipo y por cliente
+
+def _como_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(valor[:10])
+
+
+class ResumenVentas:
+    def __init__(self):
+        self.dias = {}
+        self.meses = {}
+
+    def _cubeta(self, cubetas, clave):
+        cubeta = cubetas.get(clave)
+        if cubeta is None:
+            cubeta = {"total": 0, "cantidad": 0, "por_tipo": {}, "por_cliente": {}}
+            cubetas[clave] = cubeta
+        return cubeta
+
+    def agregar(self, dia, tipo, cliente_id, monto, cantidad=1):
+        """Suma un importe a las cubetas del dia (AAAA-MM-DD) y de su mes"""
+        for cubeta in (self._cubeta(self.dias, dia), self._cubeta(self.meses, dia[:7])):
+            cubeta["total"] += monto
+            cubeta["cantidad"] += cantidad
+            cubeta["por_tipo"][tipo] = cubeta["por_tipo"].get(tipo, 0) + monto
+            cubeta["por_cliente"][cliente_id] = cubeta["por_cliente"].get(cliente_id, 0) + monto
+
+    def registrar(self, venta):
+        self.agregar(venta["fecha"][:10], venta["tipo"], venta["cliente_id"], venta["monto"])
+
+    def totales_por_tipo(self):
+        totales = {}
+        for cubeta in self.meses.values():
+            for tipo, monto in cubeta["por_tipo"].items():
+                totales[tipo] = totales.get(tipo, 0) + monto
+        return totales
+
+    def _cubetas_del_rango(self, desde, hasta):
+        """Cubetas que cubren [desde, hasta): meses completos y dias sueltos en los extremos"""
+        dia = desde
+        while dia < hasta:
+            siguiente_mes = (dia.replace(day=1) + timedelta(days=32)).replace(day=1)
+            if dia.day == 1 and siguiente_mes <= hasta:
+                cubeta = self.meses.get(dia.strftime("%Y-%m"))
+                dia = siguiente_mes
+            else:
+                cubeta = self.dias.get(dia.isoformat())
+                dia += timedelta(days=1)
+            if cubeta is not None:
+                yield cubeta
+
+    def consultar(self, desde=None, hasta=None):
+        """Totales del rango [desde, hasta) combinando cubetas. Sin limites usa todo el historial"""
+        if desde is None or hasta is None:
+            claves = sorted(self.dias)
+            if not claves:
+                return {"total": 0, "cantidad": 0, "por_tipo": {}, "por_cliente": {}}
+            if desde is None:
+                desde = claves[0]
+            if hasta is None:
+                hasta = _como_fecha(claves[-1]) + timedelta(days=1)
+        desde, hasta = _como_fecha(desde), _como_fecha(hasta)
+
+        resultado = {"total": 0, "cantidad": 0, "por_tipo": {}, "por_cliente": {}}
+        for cubeta in self._cubetas_del_rango(desde, hasta):
+            resultado["total"] += cubeta["total"]
+            resultado["cantidad"] += cubeta["cantidad"]
+            for clave in ("por_tipo", "por_cliente"):
+                for nombre, monto in cubeta[clave].items():
+                    resultado[clave][nombre] = resultado[clave].get(nombre, 0) + monto
+        return resultado